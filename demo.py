@@ -3,6 +3,9 @@ import pyzzle
 pyzzle.init(screensize=(640,480), name='My Demo', fullscreen=True)
 pyzzle.load('main.game')
 
+for slide in 'room-1-4', 'room-4-4', 'room-4-1':
+    pyzzle.Slide[slide].addVariant(slide+'b.jpg')
+
 def switchCurtains(switch):
     pyzzle.Slide['room-1-4'].file='room-1-4b.jpg' if switch.on else 'room-1-4.jpg'
     pyzzle.Slide['room-4-4'].file='room-4-4b.jpg' if switch.on else 'room-4-4.jpg'
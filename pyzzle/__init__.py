@@ -1,13 +1,14 @@
 import pygame, sys, sqlite3
 
 import pyzzle
-import gamefile
+import datafile, snapshot, progress, graph, media, hitmap, animation, profiler
 from slide import Slide
 from hotspot import Hotspot
 from switch import Switch
 from item import Item
 from panel import Panel
 from text import Text
+from hitmap import HitMap
 from standard import *
 import os
 
@@ -17,6 +18,10 @@ cursor.rect=Rect(0,0,0,0)
 cursor.image=pygame.Surface((0,0))
 screen=None
 framerate=30
+framecap=150
+"""The maximum number of frames play() draws per second, while anything is animating."""
+idleTimeout=1.
+"""The maximum number of seconds play() waits for input when nothing is animating."""
 gamefile=None
 globals=datafile.Table('globals', (object,), {})
 stages=datafile.Table('stages', (object,), {})
@@ -24,6 +29,13 @@ design=False
 zip=True
 menu=sys.exit
 history=[]
+journal=None
+linkgraph=None
+scheduler=animation.Scheduler()
+"""Runs transitions and other animations, every time a frame is drawn."""
+dirtyRects=False
+"""Whether play() should only redraw the regions of the screen that change, 
+rather than the whole screen every frame. See standard.drawDirty()."""
 
 def init(screensize=(800,600), name='Pyzzle', iconfile=None, fullscreen=False):
     """Initializes the screen. Must call before anything else.
@@ -42,58 +54,240 @@ def init(screensize=(800,600), name='Pyzzle', iconfile=None, fullscreen=False):
         pygame.display.set_icon(icon)
     pygame.mouse.set_visible(False)
     pygame.display.set_caption(name)
-def load(gamefilename):
+def load(gamefilename, lazy=False, useSnapshot=True):
     """Loads game data from an SQLite database file.
     @param datafilename: name of the SQLite database file to load
+    @param lazy: Whether slides and hotspots should be loaded 
+        the first time they are accessed (e.g. Slide['foobar']), 
+        rather than all at once. Startup time and memory then depend 
+        on the slides the player actually visits, rather than the 
+        size of the game file.
+    @param useSnapshot: Whether to load the game from its compiled 
+        snapshot, if one is up to date. See pyzzle.snapshot.write().
+        Snapshots are not used in lazy mode.
+        
+    Stages may keep their slides, hotspots, items and switches in 
+    separate database files, named in the optional "file" column of 
+    the Stage table. These files are attached as their rows are needed. 
+    In lazy mode, they are detached and their rows released once the 
+    player has left the stage for datafile.DB.shardTimeout seconds. 
+    Slides that scripts customized, or whose hotspots they customized 
+    (e.g. by setting onEnter or onClick, or calling Slide.addVariant()), 
+    are never released, since they would be fetched again without 
+    those customizations.
+    
+    The links between slides are indexed in pyzzle.linkgraph 
+    (see pyzzle.graph.LinkGraph), which is built the first time it is queried.
     """
     pyzzle.gamefile=datafile.DB(gamefilename)
+    pyzzle.linkgraph=graph.LinkGraph(gamefile)
+    hitmap.load(gamefile)
     
-    stages.rows=gamefile.load(datafile.Row,'Stage')
-    gamefile.load(Slide)
-    for slide in Slide:  slide._loadRefs()
-    gamefile.load(Hotspot)
-    gamefile.load(Item)
-    gamefile.load(Switch)
+    with gamefile.loading():
+        if useSnapshot and not lazy and snapshot.load(gamefile):
+            return
+        stages.rows=gamefile.load(datafile.Row,'Stage')
+        for stage in stages:
+            if 'file' in stage and stage.file:
+                gamefile.shard(stage.id, stage.file)
+        if lazy:
+            gamefile.bind(Slide)
+            gamefile.bind(Hotspot)
+        else:
+            gamefile.load(Slide)
+            for slide in Slide:  slide._loadRefs()
+            gamefile.load(Hotspot)
+        gamefile.load(Item)
+        gamefile.load(Switch)
     
 def save(gamefilename=None):
     """Saves game data to an SQLite database file.
+    Only slides and hotspots that changed since the last save are written,
+    unless saving to a different file. 
+    
+    When saving to a different file, that file becomes the loaded file. 
+    In lazy mode, slides and hotspots that have yet to be fetched are 
+    fetched first, so that the whole game is written. Stages that keep 
+    their rows in shards get shards of their own next to the new file.
     @param datafilename: name of the SQLite database file to load,
         or the currently loaded file, if none specified
     """
-    if gamefilename:
-        pyzzle.gamefile=datafile.DB(gamefilename)
-    gamefile.save(Slide)
-    gamefile.save(Hotspot)
+    full=bool(gamefilename)
+    target=datafile.DB(gamefilename) if full else gamefile
+    if full:
+        for stage in stages:
+            if 'file' in stage and stage.file:
+                target.shard(stage.id, stage.file)
+        for TableClass in Slide, Hotspot:
+            if TableClass.source:
+                TableClass.source.fetchAll(TableClass)
+    try:
+        #neither tables nor shards can be added partway through the transaction
+        hitmap.prepare(target, full=full)
+        target.prepare([Slide, Hotspot, HitMap], full=full)
+        target.save(Slide, full=full, commit=False)
+        target.save(Hotspot, full=full, commit=False)
+        hitmap.save(target, full=full)
+        target.commit()
+    except:
+        target.rollback()
+        raise
+    if full:
+        pyzzle.gamefile=target
+        for TableClass in Slide, Hotspot:
+            if TableClass.source:
+                target.bind(TableClass)
+        if pyzzle.linkgraph:
+            pyzzle.linkgraph.gamefile=target
     
-def cleanup():
-    """Corrects capitalization of any image files mentioned in 
-    the loaded SQLite database file. 
-    Useful to prepare for distribution using dynamically downloaded content,
-    but takes a while to run."""
+def cleanup(report=True):
+    """Corrects capitalization of the image, sound and cursor files mentioned 
+    in the loaded SQLite database file and its shards, so that they match 
+    the files on disk. Useful to prepare for distribution using dynamically 
+    downloaded content, since web servers are case sensitive.
+    
+    The folder listings are loaded into a temporary table, and each column 
+    is corrected by a single indexed update per folder, 
+    so this runs in seconds even for large games.
+    @param report: Whether to print the files that are mentioned but missing, 
+        and the files that are present but not mentioned.
+    @rtype: (list, list)
+    @return: The paths of missing files, and the paths of unmentioned files.
+    """
+    slideFolders={None:os.path.normpath(media.images.folder)}
     for stage in stages:
-        directory=os.path.join('pictures',stage.folder)
-        print directory
-        for file in os.listdir(directory):
-            print file
-            gamefile.query('update Slide set image = ? where lower(image)=lower(?)', 
-                           (file,file))
+        slideFolders[stage.id]=os.path.normpath(os.path.join(media.images.folder, 
+                                                             stage.folder or ''))
+    builtins=[(slideFolders[None], media.images.default), 
+              (media.cursors.folder, media.cursors.default),
+              (media.cursors.folder, Panel.cursorDefault), 
+              (media.cursors.folder, 'fwd.png'), (media.cursors.folder, 'grab.png')]
+    for cursor in 'up', 'down', 'left', 'right', 'left180', 'right180':
+        builtins.append((media.cursors.folder, cursor+'.png'))
+    folders=set(slideFolders.values()+[media.sounds.folder, media.cursors.folder])
+    names={}
+    for folder in folders:
+        names[folder]={}
+        if os.path.isdir(folder):
+            for file in os.listdir(folder):
+                if os.path.isfile(os.path.join(folder, file)):
+                    names[folder][file.lower()]=file
+    
+    gamefile.query('create temp table [Files] ([folder], [name], [lower])')
+    gamefile.query('create index temp.[FilesIndex] on [Files] ([folder], [lower])')
+    gamefile.query('create temp table [SlideFolder] ([id] primary key, [folder])')
+    gamefile.query('create index temp.[SlideFolderIndex] on [SlideFolder] ([folder])')
+    gamefile.query('create temp table [Mentioned] ([folder], [name], [lower])')
+    gamefile.query('create index temp.[MentionedIndex] on [Mentioned] ([folder], [lower])')
+    try:
+        gamefile._cursor.executemany('insert into temp.[Files] values (?, ?, ?)', 
+                                     [(folder, name, lower) for folder in names 
+                                      for lower, name in names[folder].items()])
+        schemas=gamefile._schemas(all=True)
+        for schema in schemas:
+            for stage, folder in slideFolders.items():
+                gamefile.query('insert or replace into temp.[SlideFolder] '
+                               'select [id], ? from ['+schema+'].[Slide] where [stage] is ?', 
+                               (folder, stage))
+        
+        columns=[('Slide', 'image', 'id'), ('Item', 'takenfile', 'gameslide')]
+        columns=[(table, column, folder, 
+                  '['+key+'] in (select [id] from temp.[SlideFolder] where [folder]=?)', (folder,))
+                 for table, column, key in columns for folder in set(slideFolders.values())]
+        for table, column in (('Hotspot', 'sound'), ('Slide', 'ambientSound'), 
+                              ('Slide', 'movementSound'), ('Stage', 'ambientSound'), 
+                              ('Stage', 'movementSound')):
+            columns.append((table, column, media.sounds.folder, '1', ()))
+        columns.append(('Hotspot', 'cursor', media.cursors.folder, '1', ()))
+        
+        for schema in schemas:
+            for table, column, folder, condition, parameters in columns:
+                table='['+schema+'].['+table+']'
+                gamefile.query('update '+table+' set ['+column+']='
+                               '(select [name] from temp.[Files] '
+                               ' where [folder]=? and [lower]=lower(['+column+'])) '
+                               'where '+condition+' and exists (select 1 from temp.[Files] '
+                               ' where [folder]=? and [lower]=lower(['+column+']) '
+                               ' and [name]<>['+column+'])', 
+                               (folder,)+parameters+(folder,))
+                gamefile.query('insert into temp.[Mentioned] '
+                               'select distinct ?, ['+column+'], lower(['+column+']) '
+                               'from '+table+' where '+condition+' and ['+column+'] <> \'\'', 
+                               (folder,)+parameters)
+        gamefile._cursor.executemany('insert into temp.[Mentioned] values (?, ?, lower(?))', 
+                                     [(folder, name, name) for folder, name in builtins if name])
+        missing=[os.path.join(folder, name) for folder, name in gamefile.query(
+                    'select distinct [folder], [name] from temp.[Mentioned] where not exists '
+                    '(select 1 from temp.[Files] where [Files].[folder]=[Mentioned].[folder] '
+                    ' and [Files].[lower]=[Mentioned].[lower])')]
+        unused=[os.path.join(folder, name) for folder, name in gamefile.query(
+                    'select [folder], [name] from temp.[Files] where not exists '
+                    '(select 1 from temp.[Mentioned] where [Mentioned].[folder]=[Files].[folder] '
+                    ' and [Mentioned].[lower]=[Files].[lower])')]
+        gamefile.commit()
+    finally:
+        for table in 'Files', 'SlideFolder', 'Mentioned':
+            gamefile.query('drop table temp.['+table+']')
+    
+    #loaded rows already match the corrected database, so are not marked dirty
+    correct=lambda folder, file: names[folder].get(file.lower(), file) if file else file
+    with gamefile.loading():
+        for slide in Slide.rows.values():
+            folder=slideFolders.get(slide.stage.id if slide.stage else None)
+            if folder: slide._file=correct(folder, slide._file)
+        for hotspot in Hotspot.rows.values():
+            hotspot.soundfile=correct(media.sounds.folder, hotspot.soundfile)
+            hotspot.cursor=correct(media.cursors.folder, hotspot.cursor)
+    for item in Item.rows.values():
+        folder=slideFolders.get(item.gameSlide.stage.id if item.gameSlide and item.gameSlide.stage 
+                                else None)
+        if folder: item.takenfile=correct(folder, item.takenfile)
+    
+    if report:
+        for path in sorted(missing): print 'missing:', path
+        for path in sorted(unused):  print 'unused:', path
+    return sorted(missing), sorted(unused)
 def play():
     """The main game loop. Call this function only after you have finished 
     scripting and other initialization."""
     clock = pygame.time.Clock()
     while True:
         #update/draw the game
-        clock.tick(150)
+        clock.tick(pyzzle.framecap)
         pyzzle.framerate=clock.get_fps()
+        profiler.beginFrame()
+        
+        if pyzzle.dirtyRects:
+            pyzzle.drawDirty()
+        else:
+            pyzzle.beginDraw()
+            profiler.lap('draw')
+            cursor=pyzzle.panel.highlight()
+            profiler.lap('highlight')
+            pyzzle.drawCursor(cursor)
+            profiler.lap('cursor')
+            profiler.drawOverlay(pyzzle.screen)
+            profiler.lap('overlay')
+            pyzzle.endDraw()
+            profiler.lap('flip')
+        
+        if pyzzle.gamefile and pyzzle.gamefile.shards:
+            pyzzle.gamefile.expire(keep=[sprite._shard() for sprite in pyzzle.panel
+                                         if hasattr(sprite, '_shard')])
+        profiler.lap('shards')
         
-        pyzzle.beginDraw()
-        pyzzle.drawCursor(pyzzle.panel.highlight())
-        pyzzle.endDraw()
+        #sleep until the user does something, unless something is animating
+        if not pyzzle.animating() and not pygame.event.peek():
+            profiler.endFrame()
+            pyzzle.waitEvents(.05 if media.downloading() else pyzzle.idleTimeout)
+            continue
         
         #process user input - MUST COME AFTER DRAW
         #(cursor pos needs to be set when calling pyzzle.panel.click())
         for event in pygame.event.get():
             if event.type == QUIT:
+                if pyzzle.journal:
+                    pyzzle.journal.close()
                 pyzzle.gamefile.close()
                 sys.exit()
             if event.type == KEYDOWN:
@@ -101,19 +295,31 @@ def play():
                     pyzzle.menu()
                 if  pyzzle.design and pygame.key.get_mods() & KMOD_CTRL:
                     if event.key == K_z:
+                        pyzzle.scheduler.finish()
                         if pyzzle.history:
-                            oldslide, newslide=pyzzle.history.pop(-1)
+                            oldslide, newslide=[Slide[slide] if isinstance(slide, basestring) else slide
+                                                for slide in pyzzle.history.pop(-1)]
                             if oldslide:
                                 pyzzle.transition(newslide, oldslide, 0)
                                 pyzzle.history=pyzzle.history[0:-1]
+                            if pyzzle.journal:
+                                pyzzle.journal.record('state', 'history', len(pyzzle.history))
                     elif event.key==K_g:
                         slidename = pyzzle.promptText('Enter slide to jump to:')
-                        if slidename in Slide.rows:
+                        if slidename in Slide:
                             pyzzle.panel.sprites.empty()
                             pyzzle.panel.add(Slide[slidename])
                     elif event.key==K_s:
                         pyzzle.save()
                         pyzzle.prompt('Game saved')
-            if event.type == MOUSEBUTTONDOWN:
+                    elif event.key==K_m:
+                        slides=[slide for slide in pyzzle.panel.sprites if isinstance(slide, Slide)]
+                        if slides:
+                            hitmap.design(slides[-1])
+                    elif event.key==K_p:
+                        profiler.overlay=not profiler.overlay
+            if event.type == MOUSEBUTTONDOWN and not pyzzle.scheduler.blocking():
                 pyzzle.panel.click(design=(pygame.mouse.get_pressed()[2] and pyzzle.design))
+        profiler.lap('events')
+        profiler.endFrame()
                 
\ No newline at end of file
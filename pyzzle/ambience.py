@@ -0,0 +1,171 @@
+"""Plays ambient sounds in a loop, crossfading between them as the player moves.
+
+Short ambient sounds are loaded through media.sounds, like any other sound.
+Long ones (streamSize bytes or more) would take tens of MB of memory once
+decoded, and a noticeable time to decode, so they are streamed from disk instead:
+WAV files are decoded a chunk at a time by a background thread, and queued
+onto one of two reserved mixer channels, so that the ambience of one stage
+can fade out while the next fades in. Other formats (e.g. OGG, MP3) are
+streamed by pygame.mixer.music, which only plays one file at a time,
+so they cut rather than crossfade into one another.
+"""
+import os, wave, audioop, threading, time
+import pygame
+
+import media
+
+streamSize=1024*1024
+"""The size, in bytes, from which ambient sound files are streamed."""
+chunkLength=1.
+"""The number of seconds of audio decoded at a time, when streaming WAV files."""
+
+current=None
+"""The ambience currently playing."""
+_channels=[]
+_owners={}
+"""The stream that last took over each reserved channel, indexed by the channel's id."""
+
+def play(file, fade=0):
+    """Plays an ambient sound in a loop, fading out the current ambience, if different.
+    @param file: The name of the sound file within media.sounds.
+    @param fade: The number of seconds taken to fade the ambience in and out.
+    """
+    global current
+    if current and current.file==file:
+        return
+    stop(fade)
+    path=media.sounds.find(file)
+    if path and os.path.getsize(path) >= streamSize:
+        if path.lower().endswith('.wav'): current=_WaveStream(file, path)
+        else:                             current=_MusicStream(file, path)
+    else:
+        current=_Buffered(file)
+    current.play(fade)
+def stop(fade=0):
+    """Fades out the current ambience.
+    @param fade: The number of seconds taken to fade out.
+    """
+    global current
+    if current:
+        current.stop(fade)
+        current=None
+
+def _fade(setVolume, start, end, fade, cancelled=lambda:False):
+    """Ramps the volume of a channel or music over a number of seconds.
+    Called from streaming threads."""
+    steps=max(1, int(fade*20))
+    for step in range(1, steps+1):
+        if cancelled(): return
+        setVolume(start+(end-start)*step/float(steps))
+        time.sleep(fade/steps)
+
+class _Buffered:
+    """A short ambient sound, loaded entirely into memory."""
+    def __init__(self, file):
+        self.file=file
+    def play(self, fade):
+        self.sound=media.sounds.load(self.file)
+        self.sound.play(-1, fade_ms=int(fade*1000))
+    def stop(self, fade):
+        if fade: self.sound.fadeout(int(fade*1000))
+        else:    self.sound.stop()
+
+class _WaveStream:
+    """A long WAV file, decoded a chunk at a time and queued onto a reserved channel."""
+    def __init__(self, file, path):
+        self.file=file
+        self.path=path
+        self._stopping=False
+        self._fade=0
+        if not _channels:
+            pygame.mixer.set_reserved(2)
+            _channels.extend([pygame.mixer.Channel(0), pygame.mixer.Channel(1)])
+        #alternate channels, so the previous ambience can fade out on the other
+        self.channel=_channels[0]
+        _channels.reverse()
+        _owners[id(self.channel)]=self
+    def _owns(self):
+        """Whether the stream's channel has yet to be taken over by a newer stream, 
+        e.g. after switching ambience three times in quick succession."""
+        return _owners.get(id(self.channel)) is self
+    def play(self, fade):
+        self._thread=threading.Thread(target=self._stream, args=(fade,))
+        self._thread.daemon=True
+        self._thread.start()
+    def stop(self, fade):
+        self._fade=fade
+        self._stopping=True
+    def _stream(self, fade):
+        frequency, format, channels = pygame.mixer.get_init()
+        width=abs(format)/8
+        source=wave.open(self.path, 'rb')
+        ratestate=None
+        if self._owns():
+            self.channel.stop()
+            self.channel.set_volume(1.)
+        first=True
+        try:
+            while not self._stopping and self._owns():
+                data=source.readframes(int(source.getframerate()*chunkLength))
+                if not data:
+                    source.rewind()
+                    continue
+                sourceWidth, sourceChannels = source.getsampwidth(), source.getnchannels()
+                if sourceWidth==1:
+                    data=audioop.bias(data, 1, -128)
+                if sourceWidth != width:
+                    data=audioop.lin2lin(data, sourceWidth, width)
+                if source.getframerate() != frequency:
+                    data, ratestate = audioop.ratecv(data, width, sourceChannels,
+                                                     source.getframerate(), frequency, ratestate)
+                if sourceChannels==1 and channels==2:
+                    data=audioop.tostereo(data, width, 1, 1)
+                elif sourceChannels==2 and channels==1:
+                    data=audioop.tomono(data, width, .5, .5)
+                if format > 0 and width==1:
+                    data=audioop.bias(data, 1, 128)
+                chunk=pygame.mixer.Sound(buffer=data)
+
+                if first:
+                    self.channel.play(chunk, fade_ms=int(fade*1000))
+                    first=False
+                else:
+                    while self.channel.get_queue() and not self._stopping:
+                        time.sleep(.02)
+                    if not self._stopping:
+                        self.channel.queue(chunk)
+        finally:
+            source.close()
+        #leave the channel alone once a newer stream has taken it over
+        _fade(self.channel.set_volume, 1., 0., self._fade, 
+              cancelled=lambda: not self._owns())
+        #stopping a channel plays its queued sound, so let the queue empty first
+        while self._owns() and self.channel.get_queue():
+            time.sleep(.02)
+        if self._owns():
+            self.channel.stop()
+            self.channel.set_volume(1.)
+
+_music=[None]
+class _MusicStream:
+    """A long compressed file, streamed by pygame.mixer.music."""
+    def __init__(self, file, path):
+        self.file=file
+        self.path=path
+    def play(self, fade):
+        _music[0]=self
+        pygame.mixer.music.load(self.path)
+        pygame.mixer.music.set_volume(0. if fade else 1.)
+        pygame.mixer.music.play(-1)
+        self._thread(pygame.mixer.music.set_volume, 0., 1., fade)
+    def stop(self, fade):
+        def setVolume(volume):
+            pygame.mixer.music.set_volume(volume)
+            if volume==0.: pygame.mixer.music.stop()
+        self._thread(setVolume, 1., 0., fade)
+    def _thread(self, setVolume, start, end, fade):
+        thread=threading.Thread(target=_fade,
+                                args=(setVolume, start, end, fade,
+                                      lambda: _music[0] is not self))
+        thread.daemon=True
+        thread.start()
@@ -0,0 +1,153 @@
+"""Animations that run for a fixed amount of time, alongside the main loop.
+
+Transitions and other animations are tweens: functions of their progress,
+from 0 to 1, that is measured by the clock rather than by counting frames.
+An animation therefore finishes in the time it was given, however fast or
+slow frames are drawn, and the main loop keeps processing events meanwhile.
+
+Tweens are run by pyzzle.scheduler, which advances them every time a frame
+is drawn (see standard.beginDraw()). Tweens may run side by side, or be
+queued to run one after another, as the stages of a transition are.
+"""
+import pygame
+
+def now():
+    """The number of seconds since pygame was initialized. Never goes backwards."""
+    return pygame.time.get_ticks()/1000.
+
+class Tween:
+    """An animation that runs for a fixed number of seconds."""
+    def __init__(self, duration=0, onStart=None, onUpdate=None, onFinish=None,
+                 onDraw=None, blocking=False, opaque=False):
+        """Creates a Tween. It does not run until passed to Scheduler.start()
+        or Scheduler.queue().
+        @param duration: The number of seconds the Tween runs for.
+        @param onStart: Called without arguments when the Tween starts.
+        @param onUpdate: Called with the Tween's progress, from 0 to 1,
+            every frame while the Tween runs, and with 1 when it finishes.
+        @param onFinish: Called without arguments when the Tween finishes,
+            unless it is cancelled.
+        @param onDraw: Called with the screen every time a frame is drawn
+            while the Tween runs, after the game itself is drawn.
+        @param blocking: Whether the user is prevented from clicking
+            while the Tween runs, e.g. during transitions.
+        @param opaque: Whether onDraw covers the whole screen, so the game
+            need not be drawn beneath it while the Tween runs.
+        """
+        self.duration=duration
+        self.onStart=onStart
+        self.onUpdate=onUpdate
+        self.onFinish=onFinish
+        self.onDraw=onDraw
+        self.blocking=blocking
+        self.opaque=opaque
+        self.started=None
+        """The time the Tween started, or None if it has yet to start."""
+        self.done=False
+        """Whether the Tween has finished or been cancelled."""
+    def _start(self):
+        self.started=now()
+        if self.onStart: self.onStart()
+    def progress(self):
+        """The fraction of the Tween's duration that has elapsed, from 0 to 1."""
+        if self.done:            return 1.
+        if self.started is None: return 0.
+        if self.duration <= 0:   return 1.
+        return min(1., (now()-self.started)/self.duration)
+    def update(self):
+        """Advances the Tween to the current time, finishing it if its time is up."""
+        if self.done: return
+        if self.started is None: self._start()
+        progress=self.progress()
+        if progress >= 1.:
+            self.finish()
+        elif self.onUpdate:
+            self.onUpdate(progress)
+    def finish(self):
+        """Finishes the Tween immediately."""
+        if self.done: return
+        if self.started is None: self._start()
+        self.done=True
+        if self.onUpdate: self.onUpdate(1.)
+        if self.onFinish: self.onFinish()
+    def cancel(self):
+        """Stops the Tween where it is. onFinish is not called."""
+        self.done=True
+
+class Scheduler:
+    """Runs Tweens every time a frame is drawn.
+
+    Tweens passed to start() run immediately, alongside any others.
+    Tweens passed to queue() run one after another, in the order
+    they were queued. A Tween with no duration that can run immediately
+    is finished before start() or queue() returns, so transitions
+    without delay still take effect at once.
+    """
+    def __init__(self):
+        self.running=[]
+        """The Tweens that are running alongside one another."""
+        self.queued=[]
+        """The Tweens waiting to run one after another. The first one is running."""
+        self._advancing=False
+    def start(self, tween):
+        """Runs a Tween alongside any others.
+        @rtype: Tween"""
+        if tween.duration <= 0:
+            tween.finish()
+        else:
+            self.running.append(tween)
+            tween.update()
+        return tween
+    def queue(self, tween):
+        """Runs a Tween once all previously queued Tweens are done.
+        @rtype: Tween"""
+        self.queued.append(tween)
+        self._advance()
+        return tween
+    def _advance(self):
+        """Runs queued Tweens up to the first one whose time is not up."""
+        #Tweens may queue others when they finish
+        if self._advancing: return
+        self._advancing=True
+        try:
+            while self.queued:
+                self.queued[0].update()
+                if not self.queued[0].done: break
+                self.queued.pop(0)
+        finally:
+            self._advancing=False
+    def update(self):
+        """Advances all Tweens to the current time. Called every frame."""
+        for tween in self.running[:]:
+            tween.update()
+        self.running=[tween for tween in self.running if not tween.done]
+        self._advance()
+    def draw(self, screen):
+        """Draws running Tweens that have an onDraw function."""
+        for tween in self.running+self.queued[:1]:
+            if tween.onDraw and not tween.done:
+                tween.onDraw(screen)
+    def opaque(self):
+        """Whether a running Tween draws over the whole screen."""
+        return any(tween.opaque and tween.onDraw and tween.started is not None 
+                   and not tween.done for tween in self.running+self.queued[:1])
+    def busy(self):
+        """Whether any Tween is running or queued."""
+        return bool(self.running or self.queued)
+    def blocking(self):
+        """Whether any running or queued Tween prevents the user from clicking."""
+        return any(tween.blocking for tween in self.running+self.queued)
+    def finish(self):
+        """Finishes all running and queued Tweens immediately, in order."""
+        while self.running or self.queued:
+            for tween in self.running[:]:
+                tween.finish()
+            self.running=[tween for tween in self.running if not tween.done]
+            if self.queued:
+                self.queued.pop(0).finish()
+    def cancel(self):
+        """Stops all running and queued Tweens, without finishing them."""
+        for tween in self.running+self.queued:
+            tween.cancel()
+        self.running=[]
+        self.queued=[]
@@ -0,0 +1,187 @@
+"""Benchmarks the engine by replaying fixed scenarios against a game file.
+
+Runs without a display, using SDL's dummy video and audio drivers,
+and prints the results as JSON, so that runs before and after a change
+can be compared. To benchmark the demo game, from the folder it is in::
+
+    python -m pyzzle.bench main.game --output before.json
+
+Each scenario is a phase of the report, with its wall time, the number
+of frames drawn, percentiles of the time taken to draw a frame,
+and the peak resident memory of the process by the end of the phase.
+Animations are timed by a simulated clock that advances 1/60 of a second
+every frame, so every run draws the same frames, however fast they are drawn.
+"""
+import os, sys, time, json, optparse
+
+import pygame
+
+import pyzzle
+from pyzzle import animation, media
+
+try:
+    import resource
+except ImportError:
+    #not available on Windows
+    resource=None
+
+frameRate=60.
+"""The frame rate simulated by the clock that times animations."""
+
+def peakRSS():
+    """The peak resident memory of the process so far, in kilobytes, or None if unknown."""
+    if not resource:
+        return None
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024 if sys.platform == 'darwin' else peak
+
+def percentile(values, fraction):
+    """The value below which a fraction of values fall."""
+    if not values: return None
+    values=sorted(values)
+    return values[min(len(values)-1, int(fraction*len(values)))]
+
+class Bench:
+    """Draws frames the way play() does, and records how long they take."""
+    def __init__(self):
+        self.phases=[]
+        self.clock=0.
+        self._frames=None
+    def now(self):
+        return self.clock
+
+    def phase(self, name, scenario, *args):
+        """Runs a scenario, recording its timings as a phase of the report."""
+        self._frames=[]
+        start=time.time()
+        scenario(*args)
+        wall=time.time()-start
+        frames=[frame*1000 for frame in self._frames]
+        self.phases.append((name, {'wall':    round(wall, 4),
+                                   'frames':  len(frames),
+                                   'p50':     _round(percentile(frames, .5)),
+                                   'p90':     _round(percentile(frames, .9)),
+                                   'p99':     _round(percentile(frames, .99)),
+                                   'max':     _round(max(frames) if frames else None),
+                                   'peakRSS': peakRSS()}))
+    def frame(self, pos=(0,0)):
+        """Draws a frame with the cursor at pos, as play() does."""
+        start=time.time()
+        self.clock+=1/frameRate
+        pygame.event.pump()
+        pyzzle.cursor.rect.center=pos
+        if pyzzle.dirtyRects:
+            pyzzle.drawDirty()
+        else:
+            pyzzle.beginDraw()
+            pyzzle.drawCursor(pyzzle.panel.highlight(), pos)
+            pyzzle.endDraw()
+        self._frames.append(time.time()-start)
+    def settle(self):
+        """Draws frames until all transitions are done."""
+        while pyzzle.scheduler.busy():
+            self.frame()
+    def current(self):
+        slides=[sprite for sprite in pyzzle.panel.sprites if isinstance(sprite, pyzzle.Slide)]
+        return slides[-1] if slides else None
+
+    def coldStart(self, gamefile, lazy, screensize):
+        pyzzle.init(screensize, name='Pyzzle benchmark')
+        pyzzle.load(gamefile, lazy=lazy)
+        pyzzle.transition(newslide=pyzzle.Slide.start)
+        self.frame()
+    def visit(self, ids):
+        for id in ids:
+            pyzzle.transition(self.current(), pyzzle.Slide[id])
+            self.settle()
+            self.frame()
+    def fades(self, ids, delay=.25):
+        for id in ids:
+            pyzzle.fade(self.current(), pyzzle.Slide[id], delay)
+            self.settle()
+    def pans(self, ids, seconds=2.):
+        """Pans around a 360 degree panorama stitched from the images of slides."""
+        images=[pyzzle.Slide[id].image for id in ids]
+        height=max(image.get_height() for image in images)
+        panorama=pygame.Surface((sum(image.get_width() for image in images), height))
+        left=0
+        for image in images:
+            panorama.blit(image, (left, 0))
+            left+=image.get_width()
+        media.images._store('bench-panorama', panorama)
+        slide=pyzzle.Slide(None, 'bench-panorama')
+        slide.wrap=True
+        pyzzle.transition(self.current(), slide)
+        self.settle()
+        screen=pyzzle.screen.get_rect()
+        #well inside the pan hotspots at the edges of the screen
+        for x in (.95, .05):
+            pos=(int(screen.width*x), screen.centery)
+            for i in range(int(seconds*frameRate)):
+                self.frame(pos)
+    def hover(self, ids, steps=8):
+        """Sweeps the cursor across slides in design mode, with hotspot names shown."""
+        pyzzle.design=True
+        try:
+            screen=pyzzle.screen.get_rect()
+            for id in ids:
+                pyzzle.transition(self.current(), pyzzle.Slide[id])
+                self.settle()
+                for y in range(steps):
+                    for x in range(steps):
+                        self.frame((screen.width*(x+.5)/steps, screen.height*(y+.5)/steps))
+        finally:
+            pyzzle.design=False
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+def main(argv=None):
+    """Runs the benchmark, and prints its report as JSON."""
+    parser=optparse.OptionParser(usage='python -m pyzzle.bench [options] [gamefile]')
+    parser.add_option('--slides', type='int', default=0,
+                      help='the number of slides to visit (all by default)')
+    parser.add_option('--lazy', action='store_true',
+                      help='load slides lazily (see pyzzle.load)')
+    parser.add_option('--dirty', action='store_true',
+                      help='draw frames with dirty rectangles (see pyzzle.dirtyRects)')
+    parser.add_option('--size', default='640x480',
+                      help='the size of the screen (640x480 by default)')
+    parser.add_option('--output', help='the file to write the report to, instead of stdout')
+    options, args = parser.parse_args(argv)
+    gamefile=os.path.abspath(args[0] if args else 'main.game')
+    screensize=tuple(int(size) for size in options.size.split('x'))
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    #media folders are relative to the game
+    os.chdir(os.path.dirname(gamefile))
+    pyzzle.dirtyRects=bool(options.dirty)
+
+    bench=Bench()
+    animation.now=bench.now
+    bench.phase('coldStart', bench.coldStart, gamefile, bool(options.lazy), screensize)
+    ids=[row['id'] for row in pyzzle.gamefile.select('Slide')]
+    if options.slides: ids=ids[:options.slides]
+    bench.phase('firstVisit', bench.visit, ids)
+    bench.phase('revisit',    bench.visit, ids)
+    bench.phase('fade',       bench.fades, ids)
+    bench.phase('pan',        bench.pans, ids[:4])
+    bench.phase('designHover',bench.hover, ids)
+
+    report={'game':     os.path.basename(gamefile),
+            'slides':   len(ids),
+            'options':  {'lazy':bool(options.lazy), 'dirty':bool(options.dirty),
+                         'size':options.size},
+            'versions': {'python':sys.version.split()[0], 'pygame':pygame.version.ver},
+            'phases':   [dict(phase, name=name) for name, phase in bench.phases],
+            'peakRSS':  peakRSS()}
+    output=open(options.output, 'w') if options.output else sys.stdout
+    json.dump(report, output, indent=2, sort_keys=True)
+    output.write('\n')
+    if options.output: output.close()
+    pyzzle.gamefile.close()
+    return report
+
+if __name__ == '__main__':
+    main()
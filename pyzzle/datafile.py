@@ -1,5 +1,6 @@
 import sqlite3
-import os
+import os, re, time
+from contextlib import contextmanager
 
 class Table(type):
     """A metaclass used to represent the tables of a database.
@@ -12,21 +13,60 @@ class Table(type):
     Intstances can also be accessed like a dictionary (e.g. Slide['foobar']), 
     or like attributes (e.g. Slide.foobar) - this comes in handy when
     scripting slides for a large scale video game.
+    
+    If a source is bound to the table (see DB.bind()), rows are fetched 
+    from the database the first time they are accessed, rather than 
+    all at once. Iterating over the table only visits rows that have 
+    already been fetched.
+    
+    Tables also keep track of the rows that were created, modified, 
+    or deleted since they were last saved, so that only those rows 
+    need to be written back to the database.
     """
     def __init__(cls, name, bases=(), attrs={}):
         super(Table, cls).__init__(name, bases, attrs)
         cls.rows={}
+        cls.source=None
+        cls.dirty=set()
+        cls.killed={}
     def __getattr__(cls, attr):
-        return cls.rows[attr]
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return cls[attr]
     def __getitem__(cls, key):
         if not key:         return None
         if type(key) ==cls: return key
-        else:               return cls.rows[key]
+        cls._fetch(key)
+        return cls.rows[key]
     def __contains__(cls,item):
         if type(item)==cls: return item in cls.rows.values()
-        else:               return item in cls.rows.keys()
+        cls._fetch(item)
+        return item in cls.rows
     def __iter__(cls):
         return cls.rows.itervalues()
+    def _fetch(cls, key):
+        if cls.source and key not in cls.rows:
+            cls.source.fetch(cls, key)
+    def ref(cls, key):
+        """Returns the row for key if it is already loaded. 
+        If the row has yet to be fetched from the table's source, 
+        key is returned instead, so the reference can be resolved 
+        once it is actually needed."""
+        if not key: return None
+        if cls.source and key not in cls.rows: return key
+        return cls[key]
+    def touch(cls, row):
+        """Marks a row as created or modified since the last save.
+        Rows touched while they are being loaded from a database are ignored."""
+        if not DB._loading:
+            cls.dirty.add(row)
+    def discard(cls, key):
+        """Removes the row with the given primary key from the table,
+        and marks it to be deleted from the database on the next save."""
+        row=cls.rows.pop(key, None)
+        if row is not None:
+            cls.dirty.discard(row)
+            cls.killed[key]=row
 class Row:
     """A generic row of a database. 
     
@@ -45,46 +85,315 @@ class Row:
     def __setitem__(self, key, value):
         self.cells[key]=value
     def __contains__(self,item):
-        return item in self.cells
+        return item in self.cells.keys()
     def __nonzero__(self):
         return True
+def changed(old, new):
+    """Whether a cell has changed from old to new. 
+    Rows are compared by identity, other values by equality."""
+    if old is new: return False
+    if isinstance(old, Row) or isinstance(new, Row): return True
+    return old != new
 class DB:
     """Represents an SQLite database used to store data for Pyzzle games.
      
     This class performs higher level functionality than classes within 
     the sqlite3 module. It also acts as an Adapter Class that may allow
-    other file formats to be implemented in the future."""
+    other file formats to be implemented in the future.
+    
+    Rows may also be split across several database files, called shards.
+    Typically, each stage of the game keeps its rows in its own shard. 
+    Shards are attached to the main database file when their rows are 
+    needed, and detached once they have not been used for a while. 
+    Loading, fetching and saving rows works the same whether or not 
+    they are stored in a shard."""
+    _loading=0
+    shardLimit=8
+    """The most shards that may be attached at once. 
+    SQLite allows no more than 10 attached databases by default."""
+    shardTimeout=60.
+    """The number of seconds a shard may go unused before 
+    it is detached by expire()"""
     def __init__(self, file=':memory:'):
+        self.file=file
         self._connection=sqlite3.connect(file)
         self._connection.row_factory = sqlite3.Row
         self._cursor = self._connection.cursor()
-    def load(self, TableClass, tablename=None, idcolumn='id'):
+        self._tables={}
+        self._statements={}
+        self._saved=set()
+        self._detaching=set()
+        self.shards={}
+        """The database file of each shard, indexed by shard name"""
+        self._attached={}
+    @contextmanager
+    def loading(self):
+        """A context in which rows that are created or modified 
+        are not marked as dirty, as they are being loaded from the database."""
+        DB._loading+=1
+        try:
+            yield
+        finally:
+            DB._loading-=1
+    
+    def shard(self, name, file):
+        """Registers a shard. The shard is not attached until its rows are needed.
+        @param name: The name of the shard. Rows are stored in the shard 
+            when their _shard() method returns this name. 
+        @param file: The name of the shard's database file, 
+            relative to the folder of the main database file. 
+            Tables that are missing from the file are created upon attaching it.
+        """
+        self.shards[name]=os.path.join(os.path.dirname(self.file), file)
+    def attach(self, name):
+        """Attaches the database file of a shard, if it is not already attached, 
+        and marks the shard as recently used. 
+        Shards cannot be attached while saved rows are waiting to be committed, 
+        so saves of several tables in one transaction must call prepare() first."""
+        self._detaching.discard(name)
+        if name not in self._attached:
+            if self._saved:
+                #sqlite cannot attach databases within a transaction, 
+                #and committing here would split the caller's transaction
+                raise sqlite3.OperationalError('Cannot attach shard '+name+
+                                               ' before saved rows are committed')
+            if len(self._attached) >= DB.shardLimit:
+                self.detach(min(self._attached, key=self._attached.get))
+            self._cursor.execute('attach database ? as ['+name+']', (self.shards[name],))
+            self._createTables(name)
+        self._attached[name]=time.time()
+    def detach(self, name):
+        """Detaches the database file of a shard. 
+        Rows that were loaded from the shard remain loaded, 
+        and the shard is attached again if they need to be saved. 
+        While saved rows are waiting to be committed, the shard is detached 
+        once they are committed or rolled back."""
+        if name in self._attached:
+            if self._saved:
+                self._detaching.add(name)
+                return
+            self._cursor.execute('detach database ['+name+']')
+            del self._attached[name]
+    def expire(self, keep=()):
+        """Detaches shards that have not been used for shardTimeout seconds, 
+        and releases their rows from bound Table classes, so that they are 
+        fetched again the next time they are needed.
+        Shards that hold rows that have yet to be saved are kept.
+        @param keep: The names of shards that must stay attached, 
+            such as the stage the player is in.
+        """
+        if self._saved:
+            return
+        keep=set(keep)
+        for TableClass in self._tables:
+            keep.update(self._schema(row) for row in TableClass.dirty)
+            keep.update(self._schema(row) for row in TableClass.killed.values())
+        now=time.time()
+        for name, used in self._attached.items():
+            if name not in keep and now-used > DB.shardTimeout:
+                self.release(name)
+                self.detach(name)
+    def release(self, name):
+        """Releases rows of bound Table classes that are stored in a shard.
+        Only rows that have a _release() method are released, 
+        and that method may refuse to release the row."""
+        for TableClass in self._tables:
+            for row in TableClass.rows.values():
+                if hasattr(row, '_release') and self._schema(row) == name:
+                    row._release()
+    def _schema(self, row):
+        name=row._shard() if hasattr(row, '_shard') else None
+        return name if name in self.shards else 'main'
+    def _shardsToSave(self, TableClass, full=False):
+        """The shards that save() writes rows of a Table class to."""
+        if full and TableClass.source is not self:
+            return set(self.shards)
+        rows=TableClass.rows.values() if full else TableClass.dirty
+        names=set(self._schema(row) for row in rows)
+        names.update(self._schema(row) for row in TableClass.killed.values())
+        names.discard('main')
+        return names
+    def prepare(self, TableClasses, full=False):
+        """Attaches every shard that save() will write rows of the Table classes to. 
+        Call before saving several tables in one transaction (i.e. with commit=False), 
+        since shards cannot be attached once rows have been written.
+        @param full: Whether the tables will be saved with full=True.
+        """
+        for TableClass in TableClasses:
+            for name in self._shardsToSave(TableClass, full):
+                self.attach(name)
+    def _schemas(self, all=False):
+        if all:
+            for name in self.shards:
+                self.attach(name)
+        return ['main']+self._attached.keys()
+    def _createTables(self, name):
+        existing=set(cells[0] for cells in self._cursor.execute(
+                    "select name from ["+name+"].sqlite_master where type='table'").fetchall())
+        for tablename, sql in self._cursor.execute(
+                    "select name, sql from main.sqlite_master where type='table'").fetchall():
+            if tablename not in existing:
+                self._cursor.execute(re.sub(r'^\s*create\s+table\s+', 
+                                            'create table ['+name+'].', sql, flags=re.I))
+    
+    def load(self, TableClass, tablename=None, idcolumn='id', where={}):
         """Loads all instances a Table class from rows in pyzzle.datafile.
         @param TableClass: A class that uses the Table metaclass.
         @param tablename: The name of the table in the database. 
             If not specified, the name of TableClass is used instead.
         @param idcolumn: The name of the primary key column for the table.
+        @type where: dict
+        @param where: Column values that loaded rows must match. 
+            All rows are loaded if not specified. See select().
         """
         tablename = tablename if tablename else TableClass.__name__
-        query='select * from '+tablename
-        results=self._cursor.execute(query)
         rows={}
-        for cells in results:
-            rows[cells[idcolumn]]=TableClass._load(cells)
+        with self.loading():
+            for cells in self.select(tablename, where):
+                rows[cells[idcolumn]]=TableClass._load(cells)
         return rows
-    def save(self, TableClass, tablename=None, idcolumn='id'):
-        """Saves all members of a Table class to pyzzle.datafile."""
+    def select(self, tablename, where={}):
+        """Gets the rows of a table, in the order they are stored, 
+        without loading them into a Table class.
+        @type where: dict
+        @param where: Column values that rows must match. 
+            All rows are returned if not specified, in which case every 
+            shard is attached. Otherwise, only shards that are already 
+            attached are searched.
+        @rtype: list
+        @return: The cells of each row, as sqlite3.Row objects
+        """
+        condition=''
+        if where:
+            condition=' where '+' and '.join(['['+column+']=?' for column in where])
+        results=[]
+        for schema in self._schemas(all=not where):
+            query='select * from ['+schema+'].['+tablename+']'+condition
+            results+=self._cursor.execute(query, where.values()).fetchall()
+        return results
+    def bind(self, TableClass, tablename=None, idcolumn='id'):
+        """Binds a Table class to the database, so that its rows are 
+        fetched one at a time, the first time they are accessed 
+        (e.g. Slide['foobar']), instead of being loaded up front.
+        @param TableClass: A class that uses the Table metaclass.
+        @param tablename: The name of the table in the database. 
+            If not specified, the name of TableClass is used instead.
+        @param idcolumn: The name of the primary key column for the table.
+        """
         tablename = tablename if tablename else TableClass.__name__
-        self._cursor.execute('delete from '+tablename)
-        
-        for row in TableClass:
+        self._tables[TableClass]=(tablename, idcolumn)
+        TableClass.source=self
+    def fetch(self, TableClass, key):
+        """Loads a single instance of a Table class bound to the database,
+        using its primary key. The main database file and attached shards 
+        are searched first, followed by shards that have yet to be attached.
+        @param TableClass: A class that has been bound using bind()
+        @param key: The primary key of the row to load.
+        @return: The loaded instance, or None if no row has the key.
+        """
+        tablename, idcolumn = self._tables[TableClass]
+        cells=self._find(tablename, idcolumn, key, self._schemas())
+        if not cells:
+            for name in self.shards:
+                if name not in self._attached:
+                    self.attach(name)
+                    cells=self._find(tablename, idcolumn, key, [name])
+                    if cells: break
+        if not cells: return None
+        with self.loading():
+            row=TableClass._load(cells)
+        return TableClass.rows.setdefault(key, row)
+    def fetchAll(self, TableClass):
+        """Fetches every row of a Table class bound to the database 
+        that has yet to be fetched, e.g. before saving the class to another file. 
+        Rows that were deleted since the last save are not fetched again. 
+        Every shard is attached."""
+        tablename, idcolumn = self._tables[TableClass]
+        for cells in self.select(tablename):
+            key=cells[idcolumn]
+            if key not in TableClass.rows and key not in TableClass.killed:
+                with self.loading():
+                    row=TableClass._load(cells)
+                TableClass.rows.setdefault(key, row)
+    def _find(self, tablename, idcolumn, key, schemas):
+        for schema in schemas:
+            query='select * from ['+schema+'].['+tablename+'] where ['+idcolumn+']=?'
+            cells=self._cursor.execute(query, (key,)).fetchone()
+            if cells: return cells
+    def save(self, TableClass, tablename=None, idcolumn='id', 
+             full=False, commit=True):
+        """Saves members of a Table class to pyzzle.datafile. 
+        Only rows that were created, modified, or deleted since the 
+        last save are written, each to the shard it belongs to.
+        @param full: Whether all loaded members should be written, 
+            rather than just those that changed. If TableClass is not 
+            bound to this database, rows that are not loaded are deleted, 
+            so classes bound to another database must call fetchAll() first.
+        @param commit: Whether to commit once the rows are written.
+            Use commit() to save several tables in one transaction.
+        """
+        tablename = tablename if tablename else TableClass.__name__
+        rows=TableClass.rows.values() if full else list(TableClass.dirty)
+        self.prepare([TableClass], full)
+        killed={}
+        for key, row in TableClass.killed.items():
+            killed.setdefault(self._schema(row), []).append((key,))
+        batches={}
+        for row in rows:
             cells=row._save()
-            query=' '.join(['insert into',tablename,'(',
-                            ', '.join(cells.keys()),
-                            ') values (',
-                            ', '.join(('?')*len(cells)),')'])
-            self._cursor.execute(query, cells.values())
+            columns=tuple(sorted(cells.keys()))
+            batches.setdefault((self._schema(row), columns), []).append(
+                                [cells[column] for column in columns])
+        
+        if full and TableClass.source is not self:
+            for schema in self._schemas(all=True):
+                #tables created after a shard was attached are only in the main file
+                if self._cursor.execute("select 1 from ["+schema+"].sqlite_master "
+                                        "where type='table' and name=?", (tablename,)).fetchone():
+                    self._cursor.execute('delete from ['+schema+'].['+tablename+']')
+        for schema, keys in killed.iteritems():
+            self._cursor.executemany('delete from ['+schema+'].['+tablename+
+                                     '] where ['+idcolumn+']=?', keys)
+        for (schema, columns), values in batches.iteritems():
+            self._cursor.executemany(self._upsert(schema, tablename, columns), values)
+        self._saved.add(TableClass)
+        if commit:
+            self.commit()
+    def _upsert(self, schema, tablename, columns):
+        key=(schema, tablename, columns)
+        if key not in self._statements:
+            self._statements[key]=' '.join(['insert or replace into',
+                                            '['+schema+'].['+tablename+']','(',
+                                            ', '.join(['['+column+']' for column in columns]),
+                                            ') values (',
+                                            ', '.join(('?')*len(columns)),')'])
+        return self._statements[key]
+    def query(self, query, parameters=()):
+        """Executes an SQL query on the database, outside of any Table class.
+        Rows from shards may be queried by prefixing tables with the shard name, 
+        once the shard is attached.
+        @rtype: list
+        @return: The rows returned by the query, as sqlite3.Row objects
+        """
+        return self._cursor.execute(query, parameters).fetchall()
+    def commit(self):
+        """Commits rows written by save(), and marks their tables as clean."""
         self._connection.commit()
+        for TableClass in self._saved:
+            TableClass.dirty.clear()
+            TableClass.killed.clear()
+        self._saved.clear()
+        self._detachPending()
+    def rollback(self):
+        """Discards rows written by save() since the last commit."""
+        self._connection.rollback()
+        self._saved.clear()
+        self._detachPending()
+    def _detachPending(self):
+        """Detaches shards whose detach() was deferred until the transaction ended."""
+        for name in list(self._detaching):
+            self._detaching.discard(name)
+            self.detach(name)
     def close(self):
         self._cursor.close()
         self._connection.close()
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""An index of the links between slides, for finding orphaned,
+unreachable, and dead-end slides without repeatedly querying the game file.
+
+The graph is built from the game file the first time it is queried,
+with any unsaved changes to loaded slides and hotspots applied on top.
+From then on, it is kept up to date as hotspots are linked, unlinked,
+and killed (e.g. in design mode). Slides are identified by their ids,
+so queries never load slides that have not been loaded already.
+"""
+import pyzzle
+from datafile import DB
+
+def _id(slide):
+    return slide.id if hasattr(slide, 'id') else slide
+
+class LinkGraph:
+    """The links between the slides of a game file.
+
+    Slides link to one another either through their forward, up, down,
+    right and left hotspots, or through custom hotspots. Each link is
+    stored as an edge, keyed by the hotspot's id, or by a tuple of the
+    slide's id and direction, for template hotspots.
+    """
+    def __init__(self, gamefile):
+        """Creates a link graph for a game file. The graph is not built
+        until it is first queried.
+        @type gamefile: datafile.DB
+        @param gamefile: The game file to build the graph from.
+        """
+        self.gamefile=gamefile
+        self.slides=set()
+        """The ids of all slides in the graph."""
+        self.outgoing={}
+        """The slides that each slide links to, indexed by slide id, then by edge key."""
+        self.incoming={}
+        """The slides that link to each slide, indexed by slide id, then by edge key."""
+        self._edges={}
+        self._built=False
+
+    def build(self):
+        """(Re)builds the graph from the game file and loaded rows."""
+        self.slides=set()
+        self.outgoing={}
+        self.incoming={}
+        self._edges={}
+        self._built=True
+        for row in self.gamefile.select('Slide'):
+            self.slides.add(row['id'])
+            for direction in pyzzle.Slide._refColumns:
+                self._link((row['id'], direction), row['id'], row[direction])
+        for row in self.gamefile.select('Hotspot'):
+            self._link(row['id'], row['parent'], row['link'])
+
+        for slide in pyzzle.Slide.rows.values():
+            self.slides.add(slide.id)
+            for direction in pyzzle.Slide._refColumns:
+                hotspot=getattr(slide, direction)
+                self._link((slide.id, direction), slide.id,
+                           hotspot._getLinkId() if hotspot else None)
+        for hotspot in pyzzle.Hotspot.rows.values():
+            self._link(hotspot.id, _id(hotspot.parent), hotspot._getLinkId())
+        for id in pyzzle.Hotspot.killed:
+            self._link(id, None, None)
+    def _ensureBuilt(self):
+        if not self._built: self.build()
+
+    def _link(self, key, source, target):
+        if key in self._edges:
+            oldsource, oldtarget = self._edges.pop(key)
+            del self.outgoing[oldsource][key]
+            del self.incoming[oldtarget][key]
+        if source and target:
+            self._edges[key]=(source, target)
+            self.outgoing.setdefault(source, {})[key]=target
+            self.incoming.setdefault(target, {})[key]=source
+            self.slides.update((source, target))
+    def update(self, hotspot):
+        """Updates the graph after a hotspot has been linked, unlinked, or killed.
+        Called automatically by Hotspot. Changes made while loading are ignored,
+        since they only repeat what is already in the game file."""
+        if not self._built or DB._loading: return
+        parent=hotspot.__dict__.get('parent')
+        if hotspot._template:
+            directions=[direction for direction in pyzzle.Slide._refColumns
+                        if getattr(parent, direction, None) is hotspot]
+            if not directions: return
+            key=(parent.id, directions[0])
+        elif hotspot.id:
+            key=hotspot.id
+            if pyzzle.Hotspot.rows.get(key) is not hotspot:
+                self._link(key, None, None)
+                return
+        else:
+            return
+        self._link(key, _id(parent), hotspot._getLinkId())
+
+    def successors(self, slide):
+        """The ids of the slides a slide links to."""
+        self._ensureBuilt()
+        return set(self.outgoing.get(_id(slide), {}).itervalues())
+    def predecessors(self, slide):
+        """The ids of the slides that link to a slide."""
+        self._ensureBuilt()
+        return set(self.incoming.get(_id(slide), {}).itervalues())
+    def neighborhood(self, slide, k=1, incoming=False):
+        """The ids of the slides within k links of a slide,
+        excluding the slide itself.
+        @param incoming: Whether links to the slide should be followed
+            as well as links from it.
+        """
+        self._ensureBuilt()
+        start=_id(slide)
+        found=set([start])
+        frontier=[start]
+        for hop in range(k):
+            nextFrontier=[]
+            for id in frontier:
+                neighbors=self.successors(id)
+                if incoming: neighbors|=self.predecessors(id)
+                for neighbor in neighbors - found:
+                    found.add(neighbor)
+                    nextFrontier.append(neighbor)
+            frontier=nextFrontier
+        found.discard(start)
+        return found
+    def reachable(self, start='start'):
+        """The ids of all slides the player can reach from a slide,
+        including the slide itself."""
+        self._ensureBuilt()
+        start=_id(start)
+        found=set([start])
+        frontier=[start]
+        while frontier:
+            id=frontier.pop()
+            for neighbor in self.successors(id) - found:
+                found.add(neighbor)
+                frontier.append(neighbor)
+        return found
+    def unreachable(self, start='start'):
+        """The ids of all slides the player cannot reach from a slide."""
+        return self.slides - self.reachable(start)
+    def orphans(self):
+        """The ids of all slides that no slide links to."""
+        self._ensureBuilt()
+        return set(id for id in self.slides if not self.incoming.get(id))
+    def deadEnds(self):
+        """The ids of all slides that do not link to any slide."""
+        self._ensureBuilt()
+        return set(id for id in self.slides if not self.outgoing.get(id))
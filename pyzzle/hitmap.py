@@ -0,0 +1,174 @@
+"""Masks that give hotspots arbitrary shapes.
+
+A hit map covers a slide with an indexed mask: each pixel holds the index
+of the hotspot found there, or 0 where there is none. A hotspot listed
+in the hit map of its slide is only activated where the mask holds its index,
+rather than throughout its rect, so a single hotspot can follow the outline
+of a lever or a keyhole. The hotspot's rect should still enclose its pixels,
+since it is used to quickly rule out points nowhere near the hotspot.
+
+Hit maps are stored in the HitMap table of the game file,
+with masks compressed by zlib. A mask is only decompressed the first time
+the cursor is tested against it.
+"""
+import zlib, json, sqlite3, os, collections
+
+import pygame
+
+import pyzzle, media
+from datafile import Table
+from relative import RelativeRect
+
+promptLimit=32
+"""The most colors of a hit map image that design() prompts for."""
+minimumArea=.0005
+"""The smallest part of a hit map image that design() prompts for a color covering.
+Rarer colors, such as those left by antialiasing, are ignored."""
+
+class HitMap:
+    """An indexed mask that identifies the hotspot under each pixel of a slide."""
+    __metaclass__=Table
+
+    @staticmethod
+    def _load(cells):
+        return HitMap(cells['slide'], (cells['width'], cells['height']),
+                      str(cells['mask']), json.loads(cells['hotspots']))
+    def __init__(self, slide, size, mask, hotspots):
+        """Creates a hit map.
+        @param slide: The id of the slide covered by the hit map.
+        @type size: (int,int)
+        @param size: The width and height of the mask, typically
+            those of the slide's image. The mask is stretched over the slide's rect.
+        @param mask: The index of the hotspot under each pixel of the mask,
+            one byte per pixel, row by row, compressed by zlib.
+        @param hotspots: The ids of the hotspots in the mask.
+            Pixels with index i belong to hotspots[i-1].
+        """
+        HitMap.rows[slide]=self
+        HitMap.touch(self)
+        self.slide=slide
+        self.size=size
+        self.hotspots=hotspots
+        self._mask=mask
+        self._pixels=None
+    def _save(self):
+        return {'slide'   :self.slide,
+                'width'   :self.size[0],
+                'height'  :self.size[1],
+                'mask'    :sqlite3.Binary(self._mask),
+                'hotspots':json.dumps(self.hotspots)}
+
+    def at(self, pos, rect):
+        """Finds the hotspot at a point on the screen.
+        @param pos: The point on the screen.
+        @type rect: Rect
+        @param rect: The rect of the slide the hit map covers.
+        @return: The id of the hotspot at pos, or None.
+        """
+        if not rect.collidepoint(pos): return None
+        if self._pixels is None:
+            self._pixels=zlib.decompress(self._mask)
+        width, height = self.size
+        x=(pos[0]-rect.left)*width  // rect.width
+        y=(pos[1]-rect.top) *height // rect.height
+        index=ord(self._pixels[y*width+x])
+        return self.hotspots[index-1] if 0 < index <= len(self.hotspots) else None
+
+    @staticmethod
+    def fromImage(slide, image, colors):
+        """Creates a hit map for a slide from an image,
+        in which each hotspot is painted in a color of its own.
+        The rects of hotspots are set to enclose their pixels.
+        @type slide: Slide
+        @type image: Surface
+        @param image: The image to create the mask from.
+            Pixels are assigned to the hotspot painted in exactly their color.
+        @type colors: dict
+        @param colors: The id of the hotspot painted in each color,
+            indexed by (r,g,b). Pixels in other colors, such as black, 
+            belong to no hotspot.
+        @rtype: HitMap
+        """
+        colors=[(color, id) for color, id in colors.items() if id][:255]
+        size=image.get_size()
+        opaque=pygame.Surface(size, 0, 24)
+        opaque.blit(image, (0,0))
+        #each hotspot's pixels are painted in the grey of its index, 
+        #so that any channel of the painted pixels is the mask
+        indexed=pygame.Surface(size, 0, 24)
+        indexed.fill((0,0,0))
+        for index, (color, id) in enumerate(colors):
+            bounds=pygame.mask.from_threshold(opaque, color, (1,1,1,255)).get_bounding_rects()
+            if not bounds: continue
+            pixels=pygame.PixelArray(opaque).extract(color)
+            pixels.replace((255,255,255), (index+1,)*3)
+            painted=pixels.surface
+            del pixels
+            painted.set_colorkey((0,0,0))
+            indexed.blit(painted, (0,0))
+            hotspot=pyzzle.Hotspot[id]
+            hotspot.rectRel=RelativeRect(bounds[0].unionall(bounds[1:]),
+                                         image.get_rect())
+        return HitMap(slide.id, size, zlib.compress(pygame.image.tostring(indexed, 'RGB')[::3]),
+                      [id for color, id in colors])
+
+def load(gamefile):
+    """Loads the hit maps of a game file, if it has any.
+    Hit maps are only stored in the main database file, not in shards."""
+    if gamefile.query("select 1 from sqlite_master where type='table' and name='HitMap'"):
+        with gamefile.loading():
+            for cells in gamefile.query('select * from [HitMap]'):
+                HitMap._load(cells)
+def prepare(gamefile, full=False):
+    """Creates the HitMap table, if save() is about to write to it. 
+    Creating a table commits any rows already written, 
+    so this must be called before a save's transaction begins."""
+    if full or HitMap.dirty or HitMap.killed:
+        gamefile.query('create table if not exists [HitMap] ([slide] VARCHAR(30) PRIMARY KEY, '
+                       '[width] INTEGER, [height] INTEGER, [mask] BLOB, [hotspots] TEXT)')
+def save(gamefile, full=False):
+    """Saves hit maps that changed since the last save, without committing. 
+    Call prepare() first."""
+    if full or HitMap.dirty or HitMap.killed:
+        gamefile.save(HitMap, idcolumn='slide', full=full, commit=False)
+
+def design(slide):
+    """Prompts the designer for an image to create the hit map of a slide from,
+    and for the hotspot painted in each of its colors.
+    The image must be in the slide's folder, and as large as the slide's image.
+    Hotspots that do not exist are created, and may then be linked as usual."""
+    folder=slide.stage.folder if slide.stage else ''
+    file=pyzzle.promptText('Enter hit map image file:')
+    path=media.images.find(os.path.join(folder, file)) if file else None
+    if not path:
+        return
+    image=pygame.image.load(path)
+    hotspots={}
+    for color in _commonColors(image):
+        id=pyzzle.promptText('Enter hotspot for color '+str(color)+': ')
+        if not id: continue
+        if id not in pyzzle.Hotspot:
+            hotspot=pyzzle.Hotspot(parent=slide, link=None, id=id,
+                                   rectRel=RelativeRect((0,0,0,0)))
+            hotspot.onTransition=pyzzle.transition
+            slide.add(hotspot)
+        hotspots[color]=id
+    HitMap.fromImage(slide, image, hotspots)
+
+def _commonColors(image, samples=20000):
+    """Finds the colors of a hit map image worth prompting for.
+    Only a sample of the image's pixels is counted, so large images are quick to design.
+    @type image: Surface
+    @param samples: About how many pixels to count.
+    @return: The (r,g,b) of colors other than black that cover at least minimumArea 
+        of the image, most common first, and at most promptLimit of them.
+    """
+    width, height = image.get_size()
+    scale=min(1., (float(samples)/(width*height))**.5)
+    sample=pygame.transform.scale(image, (max(1, int(width*scale)), max(1, int(height*scale))))
+    data=pygame.image.tostring(sample, 'RGB')
+    counts=collections.Counter(data[i:i+3] for i in xrange(0, len(data), 3))
+    del counts['\0\0\0']
+    least=minimumArea*len(data)/3
+    return [tuple(ord(channel) for channel in color)
+            for color, count in counts.most_common(promptLimit) if count >= least]
@@ -9,7 +9,8 @@ from pygame.locals import *
 
 import pyzzle, media, standard
 from relative import RelativeRect
-from datafile import Table,Row
+from hitmap import HitMap
+from datafile import Table,Row,DB,changed
 
 import os
 
@@ -21,11 +22,20 @@ class Hotspot(Sprite):
     cursorDefault  ='fwd.png'
     """The value of the cursor attribute when no other is specified"""
     
+    _columns=frozenset(['id', 'parent', '_link', 'rectRel', 'cursor', 'soundfile', 
+                        'delay', '_layer', 'text', 'zip', 'drag', 'onTransition'])
+    """Attributes that are saved to the database"""
+    _scripts=frozenset(['onClick', 'onHighlight', '_enabled'])
+    """Attributes that scripts customize, which are not saved to the database"""
+    
     @staticmethod
     def _load(cells):
         row=Row(cells)
         parent  =pyzzle.Slide[row.parent] if row.parent else None
-        link    =pyzzle.Slide[row.link] if row.link else None
+        if row.id in Hotspot.rows:
+            #already loaded along with its parent
+            return Hotspot.rows[row.id]
+        link    =pyzzle.Slide.ref(row.link)
         hotspot=Hotspot(parent, link, 
                        rectRel=RelativeRect((row.left, row.top, row.width, row.height)), 
                        cursor=row.cursor,
@@ -44,11 +54,13 @@ class Hotspot(Sprite):
         if row.transition:
             hotspot.onTransition=getattr(standard, row.transition)
         return hotspot
+    def _shard(self):
+        return self.parent._shard() if hasattr(self.parent, '_shard') else None
     def _save(self):
         cells=  \
         {'id':self.id,
          'parent':self.parent.id if self.parent else None,
-         'link'  :self.link.id   if self.link   else None,
+         'link'  :self._getLinkId(),
          'cursor':self.cursor,
          'sound' :self.soundfile,
          'delay' :self.delay,
@@ -57,8 +69,9 @@ class Hotspot(Sprite):
          'zip'   :self.zip}
         if 'lambda' not in self.onTransition.__name__:
             cells['transition']=self.onTransition.__name__
-        if self._rect:  
+        if self._rectEdited:
             self.rectRel=RelativeRect(self._rect, self.parent.rect)
+            self._rectEdited=False
         for attr in 'left','top','width','height':
             cells[attr]=getattr(self.rectRel,attr)
         if self.drag:
@@ -112,12 +125,17 @@ class Hotspot(Sprite):
         """
         if id and not _template: Hotspot.rows[id]=self
         Sprite.__init__(self)
-        self.id=id
+        self._template=_template
         self.parent=parent
+        self.id=id
         self._link=link
         self._setLink(link)
         self.rectRel=rectRel
         self._rect=None
+        self._rectKey=None
+        self._rectEdited=False
+        """Whether rect was set directly (e.g. in design mode), 
+        so that rectRel is derived from it when the Hotspot is saved."""
         self.cursor=Hotspot.cursorDefault if cursor == '' else cursor
         self.delay=delay
         self._layer=layer
@@ -127,32 +145,93 @@ class Hotspot(Sprite):
         self.text=text
         self.zip=zip
         
-        self._template=_template
         self._enabled=True
         
         self.onClick=onClick
         self.onHighlight=onHighlight
         self.onTransition=onTransition
+        self._scripted=False
+        """Whether a script customized the Hotspot once it was created, 
+        in which case its slide is never released (see Slide._release())."""
         
+    def __setattr__(self, attr, value):
+        if attr in Hotspot._columns and changed(self.__dict__.get(attr), value):
+            Sprite.__setattr__(self, attr, value)
+            self._touch()
+            if attr == '_link' and pyzzle.linkgraph:
+                pyzzle.linkgraph.update(self)
+            if attr == '_layer' and hasattr(self.parent, 'change_layer') and self in self.parent:
+                self.parent.change_layer(self, value)
+            if attr == 'rectRel' and hasattr(self.parent, '_grid'):
+                self.parent._grid=None
+        else:
+            if attr in Hotspot._scripts and '_scripted' in self.__dict__ and not DB._loading:
+                Sprite.__setattr__(self, '_scripted', True)
+            Sprite.__setattr__(self, attr, value)
+    def _touch(self):
+        """Marks the Hotspot as modified since the last save. 
+        Template hotspots are saved with their slide, so the slide is marked instead."""
+        id, parent = self.__dict__.get('id'), self.__dict__.get('parent')
+        if self._template:
+            if type(parent) == pyzzle.Slide:
+                pyzzle.Slide.touch(parent)
+        elif id and Hotspot.rows.get(id) is self:
+            Hotspot.touch(self)
+    
     def _getRect(self):
         """The portion of the screen the user may click to
         activate the Hotspot."""
-        if self.rectRel:
-            self._rect=self.rectRel.absolute(self.parent.rect)
+        if self.rectRel and not self._rectEdited:
+            #only recalculate when the parent moves or resizes
+            reference=self.parent.rect
+            key=(self.rectRel, tuple(reference))
+            if key != self._rectKey:
+                self._rect=self.rectRel.absolute(reference)
+                self._rectKey=key
         return self._rect
     def _setRect(self, rect):
         self._rect=rect
+        self._rectEdited=True
+        if hasattr(self.parent, '_grid'):
+            self.parent._grid=None
     rect=property(_getRect, _setRect)
+    def collidepoint(self, pos):
+        """Whether a point on the screen is within the Hotspot. 
+        If the Hotspot is in the hit map of its slide, the point must 
+        also be on one of its pixels in the hit map (see pyzzle.hitmap)."""
+        if not self.rect.collidepoint(pos): return False
+        hitmap=HitMap.rows.get(getattr(self.parent, 'id', None))
+        if hitmap and self.id in hitmap.hotspots:
+            return hitmap.at(pos, self.parent.rect) == self.id
+        return True
+    def _localRect(self, size):
+        """The Hotspot's rect relative to the top left of its parent, 
+        or None if its rect is not relative to its parent. 
+        Used by Panel to index the Hotspot."""
+        if self.rectRel and not self._rectEdited:
+            return self.rectRel.absolute(Rect((0,0), size))
     
     def _getLink(self):
         """The Panel the user will transition to 
-        when the Hotspot is activated"""
+        when the Hotspot is activated. 
+        May be set to the id of a slide that has yet to be loaded, 
+        in which case the slide is loaded when the link is first requested."""
+        if isinstance(self._link, basestring):
+            #resolving the link is not an edit, so the Hotspot is not touched
+            slide=pyzzle.Slide[self._link]
+            Sprite.__setattr__(self, '_link', slide)
+            if hasattr(slide, 'links'): slide.links.add(self)
         return self._link
     def _setLink(self, slide):
         if hasattr(self._link, 'links'): self._link.links.remove(self)
         self._link=slide
         if hasattr(self._link, 'links'): self._link.links.add(self)
     link=property(_getLink, _setLink)
+    def _getLinkId(self):
+        """The id of the link, found without loading the link."""
+        if isinstance(self._link, basestring):
+            return self._link
+        return self._link.id if self._link else None
     
     def _getEnabled(self):
         if not self._enabled:return False
@@ -165,20 +244,21 @@ class Hotspot(Sprite):
     def draw(self,screen):
         """Draws the Hotspot's border, if the game is in design mode. """
         if pyzzle.design and pygame.key.get_mods() & KMOD_SHIFT:
-            if (self._link or not self._template):
+            if (self.link or not self._template):
                 pygame.draw.rect(screen, pyzzle.Text.colorDefault,
                                  self.rect, 2)
     def highlight(self):
         """Called when the user hovers over the Hotspot.
         Draws cursor and text to the screen, where present, 
         and calls onHighlight"""
-        if self.text or (self._link and pyzzle.design):
-            text=pyzzle.Text(self._link.id if pyzzle.design else self.text)
+        if self.text or (self.link and pyzzle.design):
+            text=pyzzle.Text(self.link.id if pyzzle.design else self.text)
             text._getImage()
             textrect=text.rect
             textrect.topleft=pyzzle.cursor.rect.bottomright
             textrect.clamp_ip(pyzzle.screen.get_rect())
             text.draw(pyzzle.screen)
+            pyzzle.markDirty(textrect)
         self.onHighlight(self)
         return self.cursor
         
@@ -212,10 +292,12 @@ class Hotspot(Sprite):
         onClick must explicitly call this to transition the user.
         This makes it very easy to script certain behavior, 
         such as for locks."""
-        self.onTransition(self.parent, self._link, self.delay)
+        self.onTransition(self.parent, self.link, self.delay)
     def kill(self):
-        del Hotspot.rows[self.id]
+        Hotspot.discard(self.id)
         Sprite.kill(self)
+        if pyzzle.linkgraph:
+            pyzzle.linkgraph.update(self)
 
     def design(self, drag=True):
         selected=pyzzle.dragRect(color=(255,0,255)) if drag else Rect(0,0,0,0)
@@ -251,7 +333,7 @@ class Hotspot(Sprite):
                     if slidefile:
                         slide=pyzzle.Slide(slidename, slidefile, self.parent.stage)
                         slide._refs={}
-                        for ref in 'forward', 'up', 'down', 'right', 'left':
+                        for ref in pyzzle.Slide._refColumns:
                             slide._refs[ref]=None
                         slide._loadRefs()
                 if slide:
@@ -41,6 +41,7 @@ class Item:
                  id=None, taken=False, 
                  onTake=lambda item:None, onUse=lambda item:None):
         if id: Item.rows[id]=self
+        self.id=id
         
         self.menuSlide=menuSlide
         if menuSlide:
@@ -86,6 +87,8 @@ class Item:
         if self.menuSlide:
             self.inventory.add(self.menuSlide)
         self.taken=True
+        if pyzzle.journal and self.id:
+            pyzzle.journal.record('item', self.id, True)
         self.onTake(self)
     def take(self, *param):
         self.add()
@@ -1,8 +1,21 @@
 """Provides high level functionality for accessing media from files"""
 import os
 import pygame
-import pyzzle
-import urlparse, urllib2
+import pyzzle, profiler
+import urlparse, httplib, socket
+import threading, Queue, time
+import struct, hashlib
+from collections import OrderedDict
+
+downloadRetries=3
+"""The number of times a failed download is retried."""
+downloadBackoff=.5
+"""The number of seconds to wait before retrying a failed download. 
+Doubles with each retry."""
+downloadTimeout=30
+"""The number of seconds to wait for a download server to respond."""
+downloadRedirects=5
+"""The number of redirects followed before a download is given up on."""
 
 class Library:
     """Loads and stores data from files.
@@ -20,8 +33,29 @@ class Library:
     In addition, a URL can be specified from which files will download in the
     event they are not found on the local machine. This frees you from restrictions
     imposed on the size of your distributable - a game from a 10 MB installer file 
-    could access thousands of MB in content. """
-    def __init__(self, folder, load, default=None, download=None):
+    could access thousands of MB in content. 
+    
+    Libraries may be given a memory budget, in bytes. Once the data loaded 
+    exceeds the budget, the least recently used files are deleted until it fits, 
+    except for files that are pinned (e.g. the image of the current slide 
+    and its neighbors). Deleted files are simply loaded again when next requested. 
+    
+    Libraries with a decode function may also prefetch files, decoding them 
+    on a pool of background threads before they are requested. 
+    
+    Downloads also run in the background, on a separate pool of threads that 
+    keep their connections alive. The default file is presented until 
+    the download (and, if possible, decoding) completes. 
+    
+    Files are found through an index of the Library's folder, so file names 
+    are not case sensitive, and loading a file does not touch the disk 
+    unless the file is actually read. """
+    refreshInterval=5.
+    """The minimum number of seconds between refreshes of the folder index, 
+    when a file is not found in it. Files that were still missing after a refresh 
+    do not cause another one until the folder they would be in is modified."""
+    def __init__(self, folder, load, default=None, download=None, 
+                 budget=None, size=None, decode=None, convert=None):
         """Creates a Library.
         @param folder: The relative folder path from which content from this library
             may be accessed.
@@ -32,12 +66,39 @@ class Library:
             something goes wrong when loading the file.
         @param download: The name of the URL from which to download content,
             in the event content is not on the local machine.
+        @param budget: The number of bytes loaded data may occupy before the 
+            least recently used files are deleted. None means no limit.
+        @param size: A function that accepts loaded data and returns the 
+            number of bytes it occupies. sizeOf() by default.
+        @param decode: A thread safe function that accepts the path of a file 
+            and returns its decoded data. Required for prefetch().
+        @param convert: A function that runs on the main thread upon requesting 
+            a prefetched file, and returns the data produced by decode(), 
+            converted to the data load() would have returned. 
         """
         self.folder=folder
         self.default=default
         self.download=download
+        self.budget=budget
+        self.size=size if size else sizeOf
+        self.used=0
+        """The number of bytes occupied by loaded data"""
         self._load=load
-        self.loaded={}
+        self._decode=decode
+        self._convert=convert if convert else lambda data:data
+        self._index=None
+        self._indexed=0
+        self._folders={}
+        self._missing={}
+        self._fetching={}
+        self._downloading={}
+        self.failed=set()
+        """Files that could not be downloaded, and will not be tried again"""
+        self._sizes={}
+        self._pins={}
+        self.loaded=OrderedDict()
+        """Loaded data, indexed by file name, from least to most recently used"""
+        libraries.append(self)
     def __getitem__(self, key):
         return self.load(key)
     def __delitem__(self, key):
@@ -49,58 +110,473 @@ class Library:
         (if url is specified), and displays self.default if all else fails 
         (if default content is specified). Throws an exception if an error occurs 
         that is not resolved from a download or default content. 
+        
+        Keyword parameters are passed to the load function, and data loaded 
+        with different parameters is stored separately 
+        (e.g. fonts.load('freesansbold.ttf', fontSize=16)). 
         """
-        if file in self.loaded:
-            return self.loaded[file]
+        if file in self._downloading and self._pending(file):
+            return self.load(self.default, **param)
+        if self._fetching:
+            self._collect(file)
+        key=(file,)+tuple(sorted(param.items())) if param else file
+        if key in self.loaded:
+            data=self.loaded.pop(key)
+            self.loaded[key]=data
+            return data
         else:
-            path=os.path.join(self.folder, file)
-            if os.path.exists(path):
+            path=self.find(file)
+            if path:
+                start=profiler.timer()
                 data=self._load(path, **param)
-                self.loaded[file]=data
+                profiler.loaded(self, file, profiler.timer()-start)
+                self._store(key, data)
             elif file==self.default:
                 raise 'Could not load default file: '+str(self.default)
             elif not self.default:
                 raise 'Could not load file: '+str(file)
-            elif self.download:
-                base=self.download
-                base2 = urlparse.urljoin(base, self.folder)+'/'
-                url = urlparse.urljoin(base2, file)
-                url = url.replace(' ', '%20')
-                url = url.replace('\\', '/')
-                request = urllib2.Request(url)
-                try:
-                    print('downloading from '+url)
-                    downloader = urllib2.urlopen(request)
-                    download = open(path, "wb")
-                    download.write(downloader.read())
-                    download.close()
-                    data=self._load(path, **param)
-                    self.loaded[file]=data
-                except urllib2.HTTPError, ex:
-                    print(str(ex.code)+' Could not find file: '+str(url))
-                    data=self.load(self.default)
+            elif self.download and file not in self.failed:
+                self._startDownload(file)
+                data=self.load(self.default, **param)
             else:
                 print('Could not load file: '+str(file))
-                data=self.load(self.default)
+                data=self.load(self.default, **param)
             return data
     def delete(self, file):
-        """Deletes data loaded from the file, if present. 
-        Implementing behavior that uses this function may be more
-        trouble than its worth. Only consider this if You're game slows
-        down considerably as more and more content is loaded. Even on 
-        a large (1000+ slide) project, this shouldn't happen when
-        using reasonable slide resolutions. 
+        """Deletes data loaded from the file, if present, including data 
+        loaded with keyword parameters (e.g. every size of a font). 
+        Files are deleted automatically when the Library exceeds its budget,
+        so this is rarely needed.
+        """
+        for key in self.loaded.keys():
+            if key == file or (isinstance(key, tuple) and key[0] == file):
+                self._delete(key)
+    def _delete(self, key):
+        del self.loaded[key]
+        self.used-=self._sizes.pop(key)
+    def prefetch(self, file):
+        """Queues the file to be decoded in the background, if it is not 
+        already loaded, so that it is ready by the time it is requested. 
+        Files that are not on the local machine are not prefetched."""
+        if file in self.loaded or file in self._fetching or file in self._downloading:
+            return
+        path=self.find(file)
+        if not path:
+            if self.download and file not in self.failed:
+                self._startDownload(file)
+        elif self._decode:
+            self._fetching[file]=_Fetch(path, self._decode)
+            decoders.submit(self._fetching[file])
+    def refresh(self):
+        """Rebuilds the index of the Library's folder, 
+        e.g. after files have been added or renamed."""
+        self._index={}
+        self._folders={}
+        self._missing={}
+        for folder, subfolders, files in os.walk(self.folder):
+            relative=os.path.relpath(folder, self.folder)
+            self._folders[relative.lower() if relative != os.curdir else '']=relative
+            for file in files:
+                path=os.path.normpath(os.path.join(relative, file))
+                self._index[path.lower()]=path
+        self._indexed=time.time()
+    def _modified(self, key):
+        """The modification time of the nearest indexed folder that would contain 
+        a file, which changes once the file (or a folder leading to it) is added.
+        @param key: The lower case path of the file, relative to the Library's folder.
+        """
+        folder=os.path.dirname(key)
+        while folder and folder not in self._folders:
+            folder=os.path.dirname(folder)
+        try:
+            return os.path.getmtime(os.path.join(self.folder, self._folders.get(folder, '')))
+        except OSError:
+            return None
+    def find(self, file):
+        """Finds the path of a file within the Library's folder, 
+        regardless of capitalization.
+        @return: The path of the file, or None if it's not found.
         """
-        if file in self.loaded:
-            del self.loaded[file]
+        relative=os.path.normpath(file)
+        if relative.startswith(os.pardir) or os.path.isabs(relative):
+            #outside the folder, so not indexed
+            path=os.path.join(self.folder, file)
+            return path if os.path.exists(path) else None
+        key=relative.lower()
+        if self._index is None:
+            self.refresh()
+        elif (key not in self._index and self._missing.get(key, -1) != self._modified(key) and
+              time.time()-self._indexed > self.refreshInterval):
+            modified=self._modified(key)
+            self.refresh()
+            if key not in self._index:
+                self._missing[key]=modified
+        if key in self._index:
+            return os.path.join(self.folder, self._index[key])
+    def _startDownload(self, file):
+        url=urlparse.urljoin(urlparse.urljoin(self.download, self.folder)+'/', file)
+        url=url.replace(' ', '%20').replace('\\', '/')
+        print('downloading from '+url)
+        self._downloading[file]=_Download(url, os.path.join(self.folder, file))
+        downloaders.submit(self._downloading[file])
+    def _pending(self, file):
+        """Whether a file is still being downloaded, 
+        or decoded in the background after being downloaded."""
+        download=self._downloading[file]
+        if not download.done.is_set():
+            return True
+        if download.succeeded and self._decode and not download.decoding:
+            download.decoding=True
+            self._fetching[file]=_Fetch(download.path, self._decode)
+            decoders.submit(self._fetching[file])
+        if file in self._fetching and not self._fetching[file].done.is_set():
+            return True
+        del self._downloading[file]
+        if download.succeeded and self._index is not None:
+            relative=os.path.normpath(file)
+            self._index[relative.lower()]=relative
+        if not download.succeeded:
+            print('Could not download file: '+str(download.url))
+            self.failed.add(file)
+        return False
+    def _collect(self, file=None):
+        """Stores the requested file, if it was prefetched, along with one 
+        other file that has finished decoding, so that converting prefetched 
+        files is spread across frames. If the requested file is still being 
+        decoded, waits for it, and if it has yet to be started, cancels it 
+        so it's loaded as usual."""
+        fetched=[]
+        if file in self._fetching:
+            fetch=self._fetching[file]
+            if not fetch.cancel(): 
+                fetch.done.wait()
+            fetched.append(file)
+        for other, fetch in self._fetching.items():
+            if other != file and fetch.done.is_set():
+                fetched.append(other)
+                break
+        for file in fetched:
+            fetch=self._fetching.pop(file)
+            if fetch.data is not None and file not in self.loaded:
+                self._store(file, self._convert(fetch.data))
+    def _store(self, file, data):
+        self.loaded[file]=data
+        self._sizes[file]=self.size(data)
+        self.used+=self._sizes[file]
+        self.trim()
+    def trim(self):
+        """Deletes the least recently used files that are not pinned, 
+        until the data loaded fits within the budget."""
+        if self.budget is None: return
+        for file in self.loaded.keys():
+            if self.used <= self.budget: break
+            if file not in self._pins and file != self.default:
+                self._delete(file)
+    def pin(self, file):
+        """Prevents the file from being deleted to fit the budget, 
+        until it is unpinned as many times as it was pinned. 
+        The file need not be loaded yet."""
+        self._pins[file]=self._pins.get(file, 0)+1
+    def unpin(self, file):
+        """Undoes a call to pin()."""
+        if self._pins.get(file, 0) > 1: self._pins[file]-=1
+        else:                           self._pins.pop(file, None)
+        self.trim()
+            
+class _Fetch:
+    """A file queued to be decoded by a background thread."""
+    def __init__(self, path, decode):
+        self.path=path
+        self.decode=decode
+        self.data=None
+        self.done=threading.Event()
+        self._lock=threading.Lock()
+        self._state='queued'
+    def cancel(self):
+        """Cancels decoding, if it has yet to start.
+        @return: Whether decoding was cancelled."""
+        with self._lock:
+            if self._state=='queued':
+                self._state='cancelled'
+                self.done.set()
+            return self._state=='cancelled'
+    def run(self):
+        with self._lock:
+            if self._state!='queued': return
+            self._state='started'
+        try:
+            self.data=self.decode(self.path)
+        except Exception, ex:
+            print('Could not prefetch file: '+str(self.path))
+        self.done.set()
+class _Download:
+    """A file queued to be downloaded by a background thread."""
+    def __init__(self, url, path):
+        self.url=url
+        self.path=path
+        self.succeeded=False
+        self.decoding=False
+        self.done=threading.Event()
+    def run(self):
+        for attempt in range(downloadRetries+1):
+            if attempt:
+                time.sleep(downloadBackoff*2**(attempt-1))
+            try:
+                self.succeeded=_get(self.url, self.path)
+                break
+            except (httplib.HTTPException, socket.error, IOError, OSError), ex:
+                print('Error downloading '+str(self.url)+': '+str(ex))
+        self.done.set()
+
+libraries=[]
+"""All Libraries that have been created."""
+def downloading():
+    """Whether any Library is downloading files in the background, 
+    which will replace default content on screen once they are done."""
+    return any(library._downloading for library in libraries)
+
+_connections=threading.local()
+def _get(url, path):
+    """Downloads a url to a file, following up to downloadRedirects redirects.
+    @return: Whether the file was found. Raises an exception for errors worth retrying."""
+    for redirect in range(downloadRedirects+1):
+        found=_request(url, path)
+        if not isinstance(found, basestring):
+            return found
+        url=found
+    print('Too many redirects downloading '+str(url))
+    return False
+def _request(url, path):
+    """Requests a url over a kept-alive connection of the current thread, 
+    and downloads it to a file unless it is redirected. 
+    The file is written under a temporary name, then renamed, 
+    so a failed download never leaves a truncated file behind.
+    @return: Whether the file was found, or the url it was redirected to. 
+        Raises an exception for errors worth retrying."""
+    scheme, host, urlpath, query, fragment = urlparse.urlsplit(url)
+    connections=_connections.__dict__.setdefault('connections', {})
+    if (scheme, host) not in connections:
+        Connection=httplib.HTTPSConnection if scheme=='https' else httplib.HTTPConnection
+        connections[scheme, host]=Connection(host, timeout=downloadTimeout)
+    connection=connections[scheme, host]
+    try:
+        connection.request('GET', urlpath+('?'+query if query else ''))
+        response=connection.getresponse()
+        if response.status >= 500:
+            response.read()
+            raise IOError(str(response.status)+' '+response.reason)
+        location=response.getheader('location')
+        if response.status in (301, 302, 303, 307, 308) and location:
+            response.read()
+            return urlparse.urljoin(url, location)
+        if response.status != 200:
+            response.read()
+            return False
+        folder=os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        temp=path+'.part'
+        try:
+            download=open(temp, 'wb')
+            received=0
+            try:
+                while True:
+                    chunk=response.read(64*1024)
+                    if not chunk: break
+                    download.write(chunk)
+                    received+=len(chunk)
+            finally:
+                download.close()
+            #reading in chunks does not raise if the connection drops early
+            length=response.getheader('content-length')
+            if length and received != int(length):
+                raise IOError('received '+str(received)+' of '+length+' bytes')
+            if os.name=='nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return True
+    except:
+        connection.close()
+        del connections[scheme, host]
+        raise
+
+class _Pool:
+    """A pool of daemon threads that run queued tasks."""
+    def __init__(self, size):
+        self.size=size
+        """The number of threads in the pool."""
+        self._queue=Queue.Queue()
+        self._threads=[]
+    def submit(self, task):
+        """Queues a task, which must have a run() method."""
+        while len(self._threads) < self.size:
+            thread=threading.Thread(target=self._work)
+            thread.daemon=True
+            thread.start()
+            self._threads.append(thread)
+        self._queue.put(task)
+    def _work(self):
+        while True:
+            self._queue.get().run()
+decoders=_Pool(2)
+"""The threads that decode prefetched files."""
+downloaders=_Pool(4)
+"""The threads that download files, which limits the number of concurrent downloads."""
+
+def sizeOf(data):
+    """Estimates the number of bytes occupied by a Surface or Sound. 
+    Returns 0 for other kinds of data."""
+    if isinstance(data, pygame.Surface):
+        return data.get_bytesize()*data.get_width()*data.get_height()
+    if isinstance(data, pygame.mixer.Sound) and pygame.mixer.get_init():
+        frequency, format, channels = pygame.mixer.get_init()
+        return int(data.get_length()*frequency*channels*abs(format)/8)
+    return 0
             
-def loadImage(path):            return pygame.image.load(path).convert_alpha()
+class SurfaceCache:
+    """An on-disk cache of decoded images, so that images decoded in a previous 
+    session, or deleted from media.images to fit its budget, are not decoded again.
+    
+    Images are stored once converted for display, with their pixels uncompressed 
+    in the surface's own format, so a cached image is copied straight into a Surface 
+    rather than converted again. Entries are keyed by the image's path and 
+    modification time, and by the pixel format of the display, so they are never stale. 
+    Once the cache exceeds its limit, the least recently read entries are deleted.
+    """
+    magic='PYZS'
+    header='<4sIIII4I'
+    """The magic, width, height, bits per pixel, pitch and masks of a cached image."""
+    def __init__(self, folder='cache', limit=1024*1024*1024):
+        """Creates a SurfaceCache.
+        @param folder: The folder that cached images are stored in.
+        @param limit: The number of bytes the cache may occupy on disk.
+        """
+        self.folder=folder
+        self.limit=limit
+        self._used=None
+        self._lock=threading.Lock()
+    def _file(self, path):
+        display=pygame.display.get_surface()
+        format=(display.get_bitsize(), display.get_masks()) if display else None
+        key=repr((os.path.abspath(path), os.path.getmtime(path), 
+                  os.path.getsize(path), format))
+        return os.path.join(self.folder, hashlib.sha1(key).hexdigest()+'.surface')
+    def read(self, path):
+        """Reads the image decoded from a file, if it's in the cache.
+        @rtype: Surface
+        @return: The image, already converted for display, 
+            or None if the image is not in the cache.
+        """
+        try:
+            file=self._file(path)
+            if not os.path.exists(file): return None
+            cached=open(file, 'rb')
+            try:
+                data=cached.read()
+            finally:
+                cached.close()
+            header=struct.calcsize(self.header)
+            magic, width, height, bitsize, pitch, r, g, b, a = \
+                struct.unpack(self.header, data[:header])
+            if magic != self.magic or len(data) != header+pitch*height:
+                return None
+            image=pygame.Surface((width, height), pygame.SRCALPHA if a else 0, 
+                                 bitsize, (r, g, b, a))
+            if image.get_pitch() != pitch:
+                return None
+            image.get_buffer().write(data[header:], 0)
+            os.utime(file, None)
+            return image
+        except (IOError, OSError, ValueError, struct.error, pygame.error):
+            return None
+    def write(self, path, image):
+        """Stores the image decoded from a file, once converted for display, 
+        then deletes the least recently read entries if the cache is over its limit.
+        Writing is slow, so this is best called on a background thread, 
+        with a copy of an image the main thread may draw on."""
+        try:
+            file=self._file(path)
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            temp=file+'.%d.part' % threading.current_thread().ident
+            cached=open(temp, 'wb')
+            try:
+                cached.write(struct.pack(self.header, self.magic, 
+                                         image.get_width(), image.get_height(), 
+                                         image.get_bitsize(), image.get_pitch(), 
+                                         *image.get_masks()))
+                cached.write(image.get_buffer().raw)
+            finally:
+                cached.close()
+            if os.name=='nt' and os.path.exists(file):
+                os.remove(file)
+            os.rename(temp, file)
+        except (IOError, OSError), ex:
+            print('Could not cache image: '+str(path))
+            return
+        with self._lock:
+            if self._used is None:
+                self._used=sum(os.path.getsize(cached) for cached in self._files())
+            else:
+                self._used+=os.path.getsize(file)
+            if self._used > self.limit:
+                self.trim()
+    def _files(self):
+        return [os.path.join(self.folder, cached) for cached in os.listdir(self.folder) 
+                if cached.endswith('.surface')]
+    def trim(self):
+        """Deletes the least recently read entries, until the cache fits well within its limit."""
+        files=sorted(self._files(), key=os.path.getmtime)
+        self._used=sum(os.path.getsize(file) for file in files)
+        for file in files:
+            if self._used <= self.limit*.9: break
+            self._used-=os.path.getsize(file)
+            os.remove(file)
+surfaceCache=None
+"""A SurfaceCache that decoded images are stored in, or None to decode images every time.
+Enable the cache after pyzzle.init(), e.g. media.surfaceCache=media.SurfaceCache('cache')"""
+    
+class _Decoded:
+    """An image decoded by any thread, to be converted for display by the main thread."""
+    def __init__(self, path, image, cached):
+        self.path=path
+        self.image=image
+        self.cached=cached
+class _CacheWrite:
+    """An image queued to be written to the surface cache by a background thread."""
+    def __init__(self, cache, path, image):
+        self.cache=cache
+        self.path=path
+        self.image=image
+    def run(self):
+        self.cache.write(self.path, self.image)
+
+def decodeImage(path):
+    """Decodes an image file, from the surface cache if it's there. Thread safe.
+    @rtype: _Decoded"""
+    if surfaceCache:
+        image=surfaceCache.read(path)
+        if image: return _Decoded(path, image, True)
+    return _Decoded(path, pygame.image.load(path), False)
+def convertImage(decoded):
+    """Converts a decoded image for display, on the main thread. Images read from 
+    the surface cache are already converted; others are queued to be cached once converted."""
+    if decoded.cached: return decoded.image
+    image=decoded.image.convert_alpha()
+    if surfaceCache:
+        decoders.submit(_CacheWrite(surfaceCache, decoded.path, image.copy()))
+    return image
+def loadImage(path):            return convertImage(decodeImage(path))
 def loadFont(path, fontSize=16):return pygame.font.Font(path, fontSize)
 def loadSound(path):            return pygame.mixer.Sound(path)
-def loadMovie(path):            return pygame.movie.Movie(path)
-images=Library('pictures',  loadImage, default='default.gif')
+def loadMovie(path):            return pyzzle.movie.load(path)
+images=Library('pictures',  loadImage, default='default.gif', budget=256*1024*1024,
+               decode=decodeImage, convert=convertImage)
 movies=Library('Movies',  loadMovie)
 cursors=Library('cursors',  loadImage, default='arrow.png')
 fonts =Library('fonts',     loadFont)
-sounds=Library('sounds/effects',    loadSound, default='../default.wav')
+sounds=Library('sounds/effects',    loadSound, default='../default.wav', budget=64*1024*1024)
 voices=Library('sounds/voices',    loadSound, default='../default.wav')
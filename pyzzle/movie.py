@@ -1,12 +1,165 @@
 """Presents video/audio to the user in a manner similar to Slides"""
 import pygame, os
+import threading, Queue, struct, zipfile, abc
+from cStringIO import StringIO
 from pygame.rect import Rect
 from pygame.surface import Surface
 from pygame.sprite import Group
 
-import pyzzle, media
+import pyzzle, media, animation
 from panel import Panel
 
+class FrameReader:
+    """The abstract base of classes that read the frames of a movie file, in any order.
+
+    A FrameReader is opened with the path of a movie file, and must implement read(),
+    and set size, frameRate and frameCount to describe the movie.
+    Movies decode their frames with a FrameReader on a background thread,
+    so a FrameReader must be thread safe. Subclasses for other formats
+    may be registered in readers, by file extension."""
+    __metaclass__=abc.ABCMeta
+    size=(0,0)
+    """The width and height of the movie's frames."""
+    frameRate=15.
+    """The number of frames per second."""
+    frameCount=0
+    """The number of frames in the movie."""
+    @abc.abstractmethod
+    def read(self, index):
+        """Decodes a frame of the movie.
+        @param index: The number of the frame, from 0 to frameCount-1.
+        @rtype: Surface
+        """
+    def _getLength(self):
+        """The number of seconds the movie plays for."""
+        return self.frameCount/self.frameRate
+    length=property(_getLength)
+
+class ImageSequence(FrameReader):
+    """Reads a movie from a zip file of images, one per frame,
+    played in the order of their names (e.g. 0001.png, 0002.png...).
+    If the zip file has a comment, it is the movie's frame rate.
+    Any format that pygame.image can load may be used for the frames."""
+    def __init__(self, path):
+        self._zip=zipfile.ZipFile(path)
+        self._lock=threading.Lock()
+        self._names=sorted(info.filename for info in self._zip.infolist()
+                           if not info.filename.endswith('/'))
+        if self._zip.comment.strip():
+            self.frameRate=float(self._zip.comment)
+        self.frameCount=len(self._names)
+        if self._names:
+            self.size=self.read(0).get_size()
+    def read(self, index):
+        name=self._names[index]
+        with self._lock:
+            data=self._zip.read(name)
+        return pygame.image.load(StringIO(data), name)
+
+class RawFrames(FrameReader):
+    """Reads a movie from a file of uncompressed RGB frames,
+    which costs nothing to decode. The file starts with a header
+    of the form given by RawFrames.header, giving the width and height of
+    the frames, the frame rate, and the number of frames, followed by
+    the frames themselves, row by row. See writeFrames()."""
+    header=struct.Struct('<4sHHfI')
+    magic='PYZF'
+    def __init__(self, path):
+        self._file=open(path, 'rb')
+        self._lock=threading.Lock()
+        magic, width, height, self.frameRate, self.frameCount=\
+            RawFrames.header.unpack(self._file.read(RawFrames.header.size))
+        if magic != RawFrames.magic:
+            raise ValueError('Not a raw frames file: '+path)
+        self.size=(width, height)
+        self._frameSize=width*height*3
+    def read(self, index):
+        with self._lock:
+            self._file.seek(RawFrames.header.size+index*self._frameSize)
+            data=self._file.read(self._frameSize)
+        return pygame.image.fromstring(data, self.size, 'RGB')
+
+def writeFrames(path, frames, frameRate=15.):
+    """Writes a movie as a file of uncompressed RGB frames (see RawFrames).
+    @param frames: The Surfaces of the frames, all of the same size.
+    @param frameRate: The number of frames per second.
+    """
+    frames=list(frames)
+    width, height = frames[0].get_size() if frames else (0,0)
+    with open(path, 'wb') as file:
+        file.write(RawFrames.header.pack(RawFrames.magic, width, height,
+                                         frameRate, len(frames)))
+        for frame in frames:
+            file.write(pygame.image.tostring(frame, 'RGB'))
+
+class PygameMovie(FrameReader):
+    """Reads MPEG-1 movies through pygame.movie, where pygame still has it.
+    pygame.movie does not give the movie's frame rate, so frameRate must match it."""
+    frameRate=30.
+    def __init__(self, path):
+        self._movie=pygame.movie.Movie(path)
+        self._lock=threading.Lock()
+        self.size=self._movie.get_size()
+        self.frameCount=int(self._movie.get_length()*self.frameRate)
+        self._surface=Surface(self.size)
+        self._movie.set_display(self._surface)
+    def read(self, index):
+        with self._lock:
+            self._movie.render_frame(index)
+            return self._surface.copy()
+
+readers={'.zip':ImageSequence, '.frames':RawFrames}
+"""The FrameReader class used to read movie files, by file extension."""
+if hasattr(pygame, 'movie'):
+    readers['.mpg']=readers['.mpeg']=PygameMovie
+
+def load(path):
+    """Opens a movie file with the FrameReader registered for its extension.
+    @rtype: FrameReader"""
+    extension=os.path.splitext(path)[1].lower()
+    if extension not in readers:
+        raise ValueError('No movie reader for '+extension+' files: '+path)
+    return readers[extension](path)
+
+class _Decoder(threading.Thread):
+    """Decodes the frames of a movie ahead of time, on a background thread,
+    into a bounded buffer that the game thread takes them from.
+    Frames are numbered from the start of playback, counting repeats
+    when the movie loops. Frames that are already late when their turn
+    comes are skipped rather than decoded. Frames are converted to the 
+    display's pixel format here too, so the game thread blits them as they are."""
+    def __init__(self, reader, size, loop, bufferSize):
+        threading.Thread.__init__(self)
+        self.daemon=True
+        self.reader=reader
+        self.size=size
+        self.loop=loop
+        self.frames=Queue.Queue(bufferSize)
+        """Decoded frames, as (number, Surface), in order."""
+        self.due=0
+        """The number of the frame the game thread is presenting. Set by the game thread."""
+        self.stopped=threading.Event()
+    def run(self):
+        number=0
+        count=self.reader.frameCount
+        while not self.stopped.is_set() and count:
+            number=max(number, self.due)
+            if not self.loop and number >= count: break
+            frame=self.reader.read(number % count)
+            if frame.get_size() != self.size:
+                frame=pygame.transform.scale(frame, self.size)
+            if pygame.display.get_surface():
+                frame=frame.convert()
+            while not self.stopped.is_set():
+                try:
+                    self.frames.put((number, frame), timeout=.1)
+                    break
+                except Queue.Full:
+                    pass
+            number+=1
+    def stop(self):
+        self.stopped.set()
+
 class Movie(Panel):
     """Presents video/audio to the user in a manner similar to Slides.
     
@@ -14,33 +167,36 @@ class Movie(Panel):
     perform click and highlight behavior, nest within Panels, 
     and even nest Sprites such as Hotspots, Text, and Slides. 
     
-    It is worth mentioning that Pygame has limited support for
-    movies, and these limitations transfer to Pyzzle. 
-    Movie files must use the MPEG-1 video codec. If the movie files
-    contain audio, they must use the MPEG-2 audio codec (not MP2), 
-    and no other sounds can play alongside them. As of 0.9,
-    I have not been able to get sound to play from movie files.
-    However, you can specify a seperate audio file to play alongside
-    the movie using the soundfile attribute. This has added benefits - 
-    you can play sounds from a variety of formats, and play the movie
-    alongside multiple sounds.
+    Movie files are read by the FrameReader registered for their extension
+    in movie.readers: zip files of images (ImageSequence), files of raw frames
+    (RawFrames), and, where pygame still provides pygame.movie, MPEG-1 files.
+    Frames are decoded on a background thread into a buffer of bufferSize frames,
+    so drawing a Movie costs a single blit of the frame that is due.
+    Movies are timed by the clock: frames that are not ready in time are dropped,
+    so the movie stays in sync with its soundfile, however slowly frames are drawn.
+    Sound is not read from movie files; specify a separate sound file
+    to play alongside the movie using the soundfile attribute. This has
+    added benefits - you can play sounds from a variety of formats,
+    and play the movie alongside multiple sounds.
     """
+    animated=True
+    """Movies draw a new frame every frame, so they are always redrawn 
+    when pyzzle.dirtyRects is enabled."""
+    bufferSize=8
+    """The number of decoded frames buffered ahead of the one presented."""
     def __init__(self, id, moviefile, soundfile=None, stage=None, 
                  rectRel=None, layer=0, loop=False, onStop=lambda:None):
         """Creates a Movie
         @param id: A unique identifier for the Movie. 
         @param moviefile: The name of the movie file to be played
         @param soundfile: The name of the sound file to be played in sync 
-            with the movie. Use this parameter if you cannot get sound
-            to work from your movie file, or if you would like other sounds
-            to play along with the movie (ambience, music, effects, etc.)
+            with the movie.
         @type stage: Stage
         @param stage: An area of the game in which the movie occurs. Used to determine
             folder paths.
         @type rectRel: RelativeRect
         @param rectRel: The rectangle occupied by the Movie. 
-            rect width and height do not resize the movie - this is a limitation
-            within Pygame.
+            Frames are scaled to its width and height, if given.
         @type layer: float
         @param layer: The layer of the Movie. Larger numbers represent upper layers. 
             Upper layers will draw over lower layers.
@@ -58,9 +214,13 @@ class Movie(Panel):
         self._layer=layer
         self.loaded=False
         self.surface=None
+        """The frame presented."""
         self.onStop=onStop
         self.loop=loop
         self.played=False
+        self._decoder=None
+        self._started=None
+        self._next=None
         
         self.soundfile=soundfile
         if stage:
@@ -70,7 +230,7 @@ class Movie(Panel):
         movie=media.movies.load(self.file)
         self.loaded=True
         screen=pyzzle.screen.get_rect()
-        rect=Rect((0,0),movie.get_size())
+        rect=Rect((0,0),movie.size)
         rect.center=screen.center
         if self.rectRel:
             left,top,width,height=self.rectRel
@@ -81,9 +241,8 @@ class Movie(Panel):
             if top:     rect.top=top*screen.height
         self._rect=rect
         self.surface=pygame.surface.Surface((rect.width, rect.height))
-        movie.set_display(self.surface)
     def _getMovie(self):
-        """The movie that is played."""
+        """The FrameReader of the movie that is played."""
         if not self.loaded: self._load()
         return media.movies.load(self.file)
     movie=property(_getMovie)
@@ -97,18 +256,34 @@ class Movie(Panel):
         return self._rect
     rect=property(_getRect)
 
-    
+    def _frame(self, due):
+        """Takes decoded frames up to the one that is due,
+        and presents the last of them. Earlier frames are dropped."""
+        while True:
+            if self._next is None:
+                try:
+                    self._next=self._decoder.frames.get_nowait()
+                except Queue.Empty:
+                    return
+            number, frame = self._next
+            if number > due: return
+            self.surface=frame
+            self._next=None
     def draw(self, screen):
-        """Renders the movie to the screen, 
+        """Renders the frame of the movie that is due to the screen,
         then draws any sprites within the Movie."""
         movie=self._getMovie()
-        if not movie.get_busy():
-            if self.loop:
-                movie.rewind()
-            elif not self.played:
-                self.played=True
-                self.exit(delay=0)
-                self.onStop()
+        if self._decoder:
+            due=int((animation.now()-self._started)*movie.frameRate)
+            if due >= movie.frameCount and not self.loop:
+                self._frame(movie.frameCount-1)
+                if not self.played:
+                    self.played=True
+                    self.exit(delay=0)
+                    self.onStop()
+            else:
+                self._decoder.due=due
+                self._frame(due)
         screen.blit(self.surface, self._rect)
         Panel.draw(self, screen)
     def enter(self, oldslide=None, delay=.1):
@@ -119,13 +294,15 @@ class Movie(Panel):
         @param delay: The time it should take for oldslide to transition to self
         """
         movie=self._getMovie()
+        if self._decoder: self._decoder.stop()
         if self.soundfile:
             sound=media.sounds.load(self.soundfile)
-            sound.play(-1, fade_ms=int(delay*1000))
-        elif movie.has_audio():
-            pygame.mixer.quit()
-            movie.set_volume(1.0)
-        movie.play()
+            sound.play(-1 if self.loop else 0, fade_ms=int(delay*1000))
+        self.played=False
+        self._next=None
+        self._started=animation.now()
+        self._decoder=_Decoder(movie, self._rect.size, self.loop, self.bufferSize)
+        self._decoder.start()
     def exit(self, newslide=None, delay=.1):
         """Called when the user exits the Movie.
         @type newslide: Panel
@@ -134,8 +311,10 @@ class Movie(Panel):
         @param delay: The time it should take for oldslide to transition to self,
             in seconds
         """
-        movie=self._getMovie()
+        self._getMovie()
         if self.soundfile:
             sound=media.sounds.load(self.soundfile)
             sound.fadeout(int(delay*1000))
-        movie.stop()
\ No newline at end of file
+        if self._decoder:
+            self._decoder.stop()
+            self._decoder=None
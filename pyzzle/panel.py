@@ -13,6 +13,9 @@ class Panel(Sprite):
     All nested sprites must have the rect attribute."""
     
     cursorDefault='default.png'
+    gridSize=64
+    """The width and height, in pixels, of the cells of the grid used 
+    to find the sprite under the cursor."""
     
     def __init__(self):
         self.cursor=Panel.cursorDefault
@@ -20,6 +23,8 @@ class Panel(Sprite):
         Sprite.__init__(self)
         self._rect=Rect(0,0,0,0)
         self.sprites=LayeredUpdates()
+        self._grid=None
+        self._gridSize=None
         
         self.enabled=True
         """Whether draw(), highlight(), and click() functions of the
@@ -48,15 +53,69 @@ class Panel(Sprite):
         """
         self.sprites.add(sprite)
         if hasattr(sprite, '_layer'):
-            self.sprites.change_layer(sprite, sprite._layer)
+            self.change_layer(sprite, sprite._layer)
+        self._grid=None
+    def change_layer(self, sprite, layer):
+        """Moves a nested sprite to another layer. 
+        @see: LayeredUpdates.change_layer()"""
+        #sprites such as Hotspots move themselves when their layer is set
+        if hasattr(sprite, '_layer'):
+            sprite._layer=layer
+        if self.sprites.get_layer_of_sprite(sprite) != layer:
+            self.sprites.change_layer(sprite, layer)
+        self._grid=None
     def remove(self, sprite):
         """Removes the sprite from the Panel. 
         @see: Group.add()"""
         self.sprites.remove(sprite)
+        self._grid=None
     def empty(self):
         """Empties all nested sprites from the Panel. 
         @see: Group.empty()"""
         self.sprites.empty()
+        self._grid=None
+    
+    def _index(self):
+        """Indexes nested sprites by the cells of a grid they overlap, 
+        so that finding the sprite under the cursor does not require 
+        checking every sprite. Only sprites positioned relative to the Panel 
+        (i.e. those with a _localRect() method) are placed in the grid, 
+        in the Panel's own coordinates, so the grid remains valid as the Panel 
+        moves (e.g. when panning). Other sprites are listed separately. 
+        Sprites are paired with their position in drawing order.
+        Sprites that change the grid (by being added, removed, resized, 
+        or moved to another layer) set _grid to None, so it's rebuilt, 
+        as it is when the Panel is resized."""
+        size=self.rect.size
+        if self._grid is None or size != self._gridSize:
+            self._grid={}
+            self._loose=[]
+            cellSize=Panel.gridSize
+            for order, sprite in enumerate(self.sprites):
+                local=sprite._localRect(size) if hasattr(sprite, '_localRect') else None
+                if not local:
+                    self._loose.append((order, sprite))
+                    continue
+                #allow for rounding in the sprite's absolute rect
+                local=local.inflate(2,2)
+                for x in range(local.left//cellSize, local.right//cellSize+1):
+                    for y in range(local.top//cellSize, local.bottom//cellSize+1):
+                        self._grid.setdefault((x,y), []).append((order, sprite))
+            self._gridSize=size
+        return self._grid, self._loose
+    def _hit(self, pos):
+        """The topmost enabled nested sprite at a point on the screen, or None."""
+        grid, loose = self._index()
+        left, top = self.rect.topleft
+        cell=((pos[0]-left)//Panel.gridSize, (pos[1]-top)//Panel.gridSize)
+        candidates=grid.get(cell, [])+loose
+        candidates.sort(reverse=True, key=lambda candidate: candidate[0])
+        for order, sprite in candidates:
+            collide=sprite.collidepoint if hasattr(sprite, 'collidepoint') else sprite.rect.collidepoint
+            if collide(pos):
+                if not hasattr(sprite, 'enabled') or sprite.enabled:
+                    return sprite
+        return None
     def draw(self, screen):
         """Draws nested sprites to the screen. 
         An image attribute or draw(screen) function is 
@@ -76,11 +135,7 @@ class Panel(Sprite):
         @rtype: string
         @return: The name of the cursor file that must be displayed
         """
-        highlighted=None
-        for sprite in self.sprites:
-            if not hasattr(sprite, 'enabled') or sprite.enabled:
-                if sprite.rect.collidepoint(pyzzle.cursor.rect.center):
-                    highlighted=sprite
+        highlighted=self._hit(pyzzle.cursor.rect.center)
         if hasattr(highlighted, 'highlight'):
             return highlighted.highlight()
         else:
@@ -89,11 +144,7 @@ class Panel(Sprite):
         """Called when the user clicks the Panel.
         Calls the click() method of the topmost nested sprite under the cursor.
         If no click() method is found, nothing happens."""
-        highlighted=None
-        for sprite in self.sprites:
-            if not hasattr(sprite, 'enabled') or sprite.enabled:
-                if sprite.rect.collidepoint(pyzzle.cursor.rect.center):
-                    highlighted=sprite
+        highlighted=self._hit(pyzzle.cursor.rect.center)
         if hasattr(highlighted, 'click'):
             highlighted.click(**param)
     def enter(self, oldslide=None, delay=.1):
@@ -0,0 +1,128 @@
+"""Times the phases of every frame drawn by play().
+
+play() marks the end of each phase of a frame as it goes: drawing the panel,
+highlighting the hotspot under the cursor, drawing the cursor, flipping
+the display, expiring shards, and handling events. The time spent loading
+files that were not already loaded (see media.Library.load()) is also recorded,
+although it is spent within the other phases, usually drawing.
+
+The most recent frames are kept in a ring buffer, which scripts may query
+(e.g. profiler.summary(), or profiler.slowest()) or dump to a CSV file.
+In design mode, Ctrl+P shows the timings over the screen.
+Recording costs a few calls to the clock per frame, so it is always on
+unless disabled; the overlay itself is only drawn when shown.
+"""
+import csv
+from collections import deque
+from timeit import default_timer as timer
+
+import pygame
+
+import pyzzle, media
+
+phases=['draw', 'highlight', 'cursor', 'overlay', 'flip', 'shards', 'events']
+"""The phases of a frame, in the order play() runs them."""
+frames=deque(maxlen=300)
+"""The most recent frames, from oldest to newest. Each is a dict holding
+the number of seconds spent in each phase, the 'total' number of seconds
+taken by the frame, the time it 'start'ed, the seconds spent on 'loads',
+and the files those loads 'missed', as (folder, file) pairs.
+Replace with deque(maxlen=n) to keep more or fewer frames."""
+enabled=True
+"""Whether frames are recorded."""
+overlay=False
+"""Whether play() shows the timings over the screen, in design mode."""
+overlayInterval=.25
+"""The number of seconds between updates of the overlay."""
+overlayFontSize=14
+
+_frame=None
+_lap=None
+_overlay={'image':None, 'updated':0}
+
+def beginFrame():
+    """Starts recording a frame. Called by play() before it draws."""
+    global _frame, _lap
+    if not enabled: return
+    _lap=timer()
+    _frame={'start':_lap, 'loads':0., 'misses':[]}
+def lap(phase):
+    """Records the time since the last phase ended as spent in a phase
+    of the current frame, if any."""
+    global _lap
+    if _frame is None: return
+    now=timer()
+    _frame[phase]=_frame.get(phase, 0.)+now-_lap
+    _lap=now
+def endFrame():
+    """Finishes recording the current frame, and adds it to frames."""
+    global _frame
+    if _frame is None: return
+    _frame['total']=timer()-_frame['start']
+    frames.append(_frame)
+    _frame=None
+def loaded(library, file, seconds):
+    """Records a file that was loaded because it was not already loaded.
+    Called by media.Library.load()."""
+    if _frame is None: return
+    _frame['loads']+=seconds
+    _frame['misses'].append((library.folder, file))
+
+def summary(count=None):
+    """The average number of seconds spent in each phase of recent frames,
+    along with the average 'total' and 'loads', and the 'max' total.
+    @param count: The number of recent frames to average. All frames by default.
+    @rtype: dict"""
+    recent=list(frames)[-count:] if count else list(frames)
+    if not recent: return {}
+    averages=dict((key, sum(frame.get(key, 0.) for frame in recent)/len(recent))
+                  for key in phases+['total', 'loads'])
+    averages['max']=max(frame['total'] for frame in recent)
+    return averages
+def slowest(count=5):
+    """The slowest recent frames, slowest first.
+    @rtype: list"""
+    return sorted(frames, key=lambda frame: frame['total'], reverse=True)[:count]
+def dump(filename):
+    """Writes recent frames to a CSV file, one row per frame, in milliseconds."""
+    with open(filename, 'wb') as file:
+        writer=csv.writer(file)
+        writer.writerow(['start', 'total']+phases+['loads', 'misses'])
+        for frame in frames:
+            writer.writerow(['%.3f' % frame['start'], '%.3f' % (frame['total']*1000)]+
+                            ['%.3f' % (frame.get(phase, 0.)*1000) for phase in phases]+
+                            ['%.3f' % (frame['loads']*1000),
+                             ' '.join('/'.join(miss) for miss in frame['misses'])])
+
+def _lines():
+    averages=summary()
+    if not averages: return ['No frames recorded']
+    lines=['frame %.2fms avg, %.2fms max, %d fps' %
+           (averages['total']*1000, averages['max']*1000, pyzzle.framerate)]
+    lines+=['  %-10s %.2fms' % (phase, averages[phase]*1000) for phase in phases+['loads']]
+    lines.append('slowest:')
+    for frame in slowest(3):
+        worst=max(phases, key=lambda phase: frame.get(phase, 0.))
+        line='  %.2fms (%s %.2fms' % (frame['total']*1000, worst, frame.get(worst, 0.)*1000)
+        if frame['misses']:
+            line+=', loaded '+frame['misses'][0][1]
+        lines.append(line+')')
+    return lines
+def drawOverlay(screen):
+    """Draws recent timings over the top left of the screen, if the overlay
+    is shown in design mode. The timings are updated every overlayInterval seconds.
+    @return: The rect drawn over, or None."""
+    if not (overlay and pyzzle.design): return None
+    now=timer()
+    if not _overlay['image'] or now-_overlay['updated'] > overlayInterval:
+        font=media.fonts.load('freesansbold.ttf', fontSize=overlayFontSize)
+        lines=[font.render(line, True, (255,255,255)) for line in _lines()]
+        height=font.get_linesize()
+        image=pygame.Surface((max(line.get_width() for line in lines)+8,
+                              height*len(lines)+8), pygame.SRCALPHA)
+        image.fill((0,0,0,160))
+        for i, line in enumerate(lines):
+            image.blit(line, (4, 4+i*height))
+        _overlay['image']=image
+        _overlay['updated']=now
+    return screen.blit(_overlay['image'], (0,0))
@@ -0,0 +1,159 @@
+"""Records the player's progress, so that it can be resumed later.
+
+Progress is recorded in a journal: an SQLite file in WAL mode that is
+only ever appended to. Entries are written by a background thread,
+so recording progress never stalls the game, even when autosaving
+on every transition. Entries that have been superseded by later ones
+are periodically compacted away.
+
+To autosave the player's progress and resume it on the next launch::
+
+    pyzzle.load('main.game')
+    pyzzle.journal=pyzzle.progress.Journal('player.save')
+    if not pyzzle.journal.resume():
+        pyzzle.transition(newslide=pyzzle.Slide.start)
+    pyzzle.play()
+"""
+import sqlite3, threading, Queue, json, atexit
+
+import pyzzle
+
+class Journal:
+    """An append-only record of the player's progress, written in the background.
+
+    Each entry records the latest value of some part of the game's state,
+    identified by a kind and a key (e.g. kind 'visited', key 'room-4-1').
+    The following kinds are recorded while the journal is assigned to
+    pyzzle.journal: 'visited' (Slide.visited), 'switch' (Switch.on),
+    'item' (Item.taken), 'history' (pyzzle.history, keyed by index),
+    and 'state' (the current slide, and the length of pyzzle.history).
+    """
+    compactEvery=1000
+    """The number of entries written between compactions."""
+    def __init__(self, file):
+        """Opens a journal, creating the file if it does not exist.
+        The journal is closed when the program exits, however it exits, 
+        so entries that are still queued are not lost.
+        @param file: The name of the journal's SQLite database file.
+        """
+        self.file=file
+        self._queue=Queue.Queue()
+        self._resuming=False
+        self._ready=threading.Event()
+        self._thread=threading.Thread(target=self._write)
+        self._thread.daemon=True
+        self._thread.start()
+        self._ready.wait()
+        atexit.register(self.close)
+
+    def _connect(self):
+        connection=sqlite3.connect(self.file)
+        connection.execute('pragma journal_mode=wal')
+        connection.execute('pragma synchronous=normal')
+        connection.execute('create table if not exists Journal '
+                           '([seq] integer primary key autoincrement, '
+                           '[kind] text, [key] text, [value] text)')
+        connection.commit()
+        return connection
+    def _write(self):
+        connection=self._connect()
+        self._compact(connection)
+        self._ready.set()
+        written=0
+        closing=False
+        while not closing:
+            entries=[self._queue.get()]
+            while True:
+                try:                entries.append(self._queue.get_nowait())
+                except Queue.Empty: break
+            closing=None in entries
+            entries=[entry for entry in entries if entry]
+            if entries:
+                connection.executemany('insert into Journal ([kind], [key], [value]) '
+                                       'values (?, ?, ?)', entries)
+                connection.commit()
+                written+=len(entries)
+            if written >= Journal.compactEvery or closing:
+                self._compact(connection)
+                written=0
+            for entry in range(len(entries)+closing):
+                self._queue.task_done()
+        connection.close()
+    def _compact(self, connection):
+        connection.execute('delete from Journal where seq not in '
+                           '(select max(seq) from Journal group by [kind], [key])')
+        connection.commit()
+
+    def record(self, kind, key, value):
+        """Queues an entry to be written to the journal. Returns immediately.
+        @param kind: The kind of state the entry records.
+        @param key: Identifies what the entry records, among entries of its kind.
+        @param value: The new value. Must be serializable as JSON.
+        """
+        if not self._resuming:
+            self._queue.put((kind, key, json.dumps(value)))
+    def transition(self, oldslide, newslide):
+        """Records a transition that has just been appended to pyzzle.history."""
+        id=lambda slide: slide.id if isinstance(slide, pyzzle.Slide) else None
+        self.record('history', str(len(pyzzle.history)-1), [id(oldslide), id(newslide)])
+        self.record('state', 'history', len(pyzzle.history))
+        if id(newslide):
+            self.record('state', 'slide', id(newslide))
+    def flush(self):
+        """Waits until all queued entries have been written."""
+        self._queue.join()
+    def close(self):
+        """Writes any queued entries, compacts the journal, and stops its thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def read(self):
+        """Reads the latest value of each entry in the journal.
+        @rtype: dict
+        @return: The values of entries, indexed by kind, then by key.
+        """
+        self.flush()
+        connection=sqlite3.connect(self.file)
+        state={}
+        for kind, key, value in connection.execute(
+                'select [kind], [key], [value] from Journal where seq in '
+                '(select max(seq) from Journal group by [kind], [key]) order by seq'):
+            state.setdefault(kind, {})[key]=json.loads(value)
+        connection.close()
+        return state
+    def resume(self):
+        """Restores the player's progress from the journal, and
+        transitions to the slide the player was last at.
+        Only slides the player must see, or that items and switches
+        refer to, are loaded - visited slides are just remembered by id.
+        @return: The slide the player was last at, or None if no progress
+            was recorded.
+        """
+        state=self.read()
+        self._resuming=True
+        try:
+            for id, visited in state.get('visited', {}).iteritems():
+                if visited: pyzzle.Slide.visits.add(id)
+                else:       pyzzle.Slide.visits.discard(id)
+            for id, taken in state.get('item', {}).iteritems():
+                item=pyzzle.Item.rows.get(id)
+                if item and taken and not item.taken:
+                    item.add()
+            for id, on in state.get('switch', {}).iteritems():
+                switch=pyzzle.Switch.rows.get(id)
+                if switch and switch.on != on:
+                    switch._hotspot=None
+                    switch.onSwitch(switch)
+            slide=state.get('state', {}).get('slide')
+            slide=pyzzle.Slide[slide] if slide in pyzzle.Slide else None
+            if slide:
+                pyzzle.panel.sprites.empty()
+                pyzzle.transition(newslide=slide)
+            history=state.get('history', {})
+            pyzzle.history=[tuple(pyzzle.Slide.ref(id) for id in history[str(i)])
+                            for i in range(state.get('state', {}).get('history', 0))
+                            if str(i) in history]
+        finally:
+            self._resuming=False
+        return slide
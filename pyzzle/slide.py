@@ -7,11 +7,11 @@ from pygame.sprite import Group
 from pygame.rect import Rect
 from pygame.surface import Surface
 
-import pyzzle, standard, media
+import pyzzle, standard, media, ambience
 from relative import RelativeRect
 from hotspot import Hotspot
 from panel import Panel
-from datafile import Table,Row
+from datafile import Table,Row,DB,changed
 
 
 
@@ -34,6 +34,25 @@ class Slide(Panel):
     
     __metaclass__=Table
     
+    _columns=frozenset(['id', 'stage', '_file', '_ambiencefile', 
+                        '_movementSoundfile', '_layer', 'rectRel'])
+    """Attributes that are saved to the database"""
+    _scripts=frozenset(['onEnter', 'onExit', 'wrap', 'panSpeed', 'cursor', 'enabled'])
+    """Attributes that scripts customize, which are not saved to the database"""
+    _refColumns=('forward', 'up', 'down', 'right', 'left')
+    """The columns that link a slide to its neighbors, one per direction. 
+    Each is saved from the template hotspot of the same name."""
+    
+    visits=set()
+    """The ids of all slides the player has visited, 
+    including slides that have since been released."""
+    wrap=False
+    """Whether the slide's image continues around horizontally, 
+    as in a 360 degree panorama, instead of ending at its left and right edges."""
+    panSpeed=6.
+    """The speed at which panoramic slides pan, in pixels per second, 
+    for each pixel the cursor is within a pan hotspot."""
+    
     def panHotspots(self, direction):
         panWidth=.2
         screen=pyzzle.screen.get_rect()
@@ -56,6 +75,7 @@ class Slide(Panel):
                          layer=.1, _template=True)
         panHotspot.rect=panRects[direction]
         self.add(panHotspot)
+        self._panHotspots.append(panHotspot)
     def templateHotspots(self, link, direction):
         width=.2
         rectRels=\
@@ -93,15 +113,53 @@ class Slide(Panel):
         slide._refs={}
         if stage and stage.movementSound and not row.movementSound:
             slide._movementSoundfile=stage.movementSound
-        for ref in 'forward', 'up', 'down', 'right', 'left':
+        for ref in Slide._refColumns:
             slide._refs[ref]=row[ref]
+        if Slide.source:
+            slide._loadRefs()
+            Slide.source.load(Hotspot, where={'parent':slide.id})
         return slide
     def _loadRefs(self):
         for direction in self._refs:
             linkname=self._refs[direction]
-            link=Slide[linkname] if linkname else None
+            link=Slide.ref(linkname)
             if pyzzle.design or linkname:
                 self.templateHotspots(link, direction)
+    def _shard(self):
+        return self.stage.id if self.stage else None
+    def _release(self):
+        """Releases the slide and its hotspots, so that they are fetched 
+        from the database the next time they are needed. 
+        Slides that are on screen, referenced by items or switches, 
+        or have unsaved changes are not released. Neither are slides that 
+        scripts customized, along with any of their hotspots (e.g. by setting 
+        onEnter or onClick, adding sprites, or calling addVariant()), 
+        since a slide fetched again would not have those customizations.
+        @return: Whether the slide was released."""
+        if self.alive() or self in Slide.dirty or self._scripted:
+            return False
+        for item in pyzzle.Item:
+            if self in (item.gameSlide, item.menuSlide, item.closeupSlide):
+                return False
+        for switch in pyzzle.Switch:
+            if self in (switch.onslide, switch.offslide):
+                return False
+        hotspots=[sprite for sprite in self.sprites 
+                  if hasattr(sprite, '_template') and not sprite._template]
+        if any(hotspot in Hotspot.dirty or hotspot._scripted for hotspot in hotspots):
+            return False
+        
+        with Slide.source.loading():
+            for hotspot in self.links.sprites():
+                hotspot._link=self.id
+            for hotspot in self.sprites:
+                link=getattr(hotspot, '_link', None)
+                if hasattr(link, 'links'): link.links.remove(hotspot)
+        for hotspot in hotspots:
+            if Hotspot.rows.get(hotspot.id) is hotspot:
+                del Hotspot.rows[hotspot.id]
+        del Slide.rows[self.id]
+        return True
     def _save(self):
         cells=  \
         {'id':self.id,
@@ -113,10 +171,10 @@ class Slide(Panel):
         if self.rectRel:
             for attr in 'left','top','width','height':
                 cells['rect'+attr]=getattr(self.rectRel, attr)
-        for ref in 'forward', 'up', 'down', 'right', 'left':
+        for ref in Slide._refColumns:
             hotspot=getattr(self,ref)
-            if hotspot and hotspot.link:
-                cells[ref]=hotspot.link.id
+            if hotspot and hotspot._link:
+                cells[ref]=hotspot._getLinkId()
         return cells
     
     
@@ -170,15 +228,49 @@ class Slide(Panel):
         in the current game session."""
         self.links=Group()
         """All Hotspots that link to this slide when clicked."""
-        self.visited=False
-        """Whether the player has previously visited the slide."""
+        self._visited=False
+        self.variants=[]
+        """Alternate image files the slide may display, e.g. after a switch 
+        is flipped. See addVariant()."""
+        self._pinned=[]
+        self._panHotspots=[]
+        self._imageSize=None
+        self._layout=None
+        self._panned=0
+        self._panRemainder=[0., 0.]
         
-        for ref in 'forward', 'up', 'down', 'right', 'left':
+        for ref in Slide._refColumns:
             setattr(self, ref, None)
-        
+        self._scripted=False
+        """Whether a script customized the slide once it was created, 
+        in which case it is never released (see _release())."""
+    
+    def __setattr__(self, attr, value):
+        if attr in Slide._columns and changed(self.__dict__.get(attr), value):
+            Panel.__setattr__(self, attr, value)
+            if Slide.rows.get(self.__dict__.get('id')) is self:
+                Slide.touch(self)
+        else:
+            if attr in Slide._scripts: self._script()
+            Panel.__setattr__(self, attr, value)
+    def _script(self):
+        """Marks the slide as customized by a script, 
+        unless it is still being created or loaded."""
+        if '_scripted' in self.__dict__ and not DB._loading:
+            Panel.__setattr__(self, '_scripted', True)
+    def add(self, sprite):
+        """Adds the sprite to the Slide. 
+        @see: Panel.add()"""
+        if not getattr(sprite, '_template', False):
+            self._script()
+        Panel.add(self, sprite)
     
     def _loadImage(self, image):
         self.loaded=True
+        self._imageSize=image.get_size()
+        for panHotspot in self._panHotspots:
+            self.remove(panHotspot)
+        self._panHotspots=[]
         screen=pyzzle.screen.get_rect()
         rect=image.get_rect()
         rect.center=self.parent.rect.center
@@ -195,33 +287,103 @@ class Slide(Panel):
         if rect.height > screen.height:
             self.panHotspots('up')
             self.panHotspots('down')
+    def _imagePath(self, file=None):
+        """The name of the slide's image file within media.images"""
+        if not file: file=self.file
+        if self.stage:
+            return os.path.join(self.stage.folder, file)
+        return file
+    def _imagePaths(self):
+        """The names of the slide's image file and its variants within media.images"""
+        files=[self.file]+[file for file in self.variants if file != self.file]
+        return [self._imagePath(file) for file in files if file]
+    def addVariant(self, file):
+        """Registers an alternate image file for the slide. 
+        Variants are decoded in the background and kept loaded 
+        along with the slide's image, so setting the slide's file 
+        to a variant takes effect on the next frame without loading anything. 
+        Variants as large as the slide's image also keep its layout. 
+        The slide's current file becomes a variant too, so it can be switched back to.
+        @param file: The name of the image file, in the folder of the slide's stage.
+        """
+        if file in self.variants: return
+        self._script()
+        for variant in self.file, file:
+            if variant and variant not in self.variants:
+                self.variants.append(variant)
+        if self._pinned:
+            #the player is at the slide
+            self._pin()
+            media.images.prefetch(self._imagePath(file))
     def _getImage(self):
         """The image displayed by the Slide."""
-        file=self.file
-        if self.stage:
-            file=os.path.join(self.stage.folder, file)
-        image=media.images.load(file)
-        if not self.loaded: self._loadImage(image)
+        image=media.images.load(self._imagePath())
+        if not self.loaded or image.get_size() != self._imageSize:
+            #e.g. the default image was presented while the image downloaded
+            self._loadImage(image)
+        self._layout=(id(self.stage), self._file)
         return image
     image=property(_getImage)
     
+    def _neighbors(self):
+        """The slides that the Slide's hotspots link to."""
+        neighbors=[]
+        for sprite in self.sprites:
+            link=getattr(sprite, 'link', None)
+            if isinstance(link, Slide) and link is not self and link not in neighbors:
+                neighbors.append(link)
+        return neighbors
+    def _pin(self):
+        """Keeps the media of the slide and its neighbors loaded 
+        while the player is at the slide."""
+        self._unpin()
+        self._pinned=[(media.images, path) 
+                      for slide in [self]+self._neighbors() 
+                      for path in slide._imagePaths()]
+        if self.ambiencefile:
+            self._pinned.append((media.sounds, self.ambiencefile))
+        for library, file in self._pinned:
+            library.pin(file)
+    def _unpin(self):
+        for library, file in self._pinned:
+            library.unpin(file)
+        self._pinned=[]
+    
     def _getRect(self):
         """The portion of the screen occupied by the slide.
         rect coordinates are determined by rectRel. 
         If a coordinate in rectRel is None, the coordinate is 
         determined by the slide's image size. 
         """
-        self._getImage()
+        #the image is checked every time the slide is drawn, 
+        #so only check it here if it has yet to be laid out
+        if not self.loaded or self._layout != (id(self.stage), self._file):
+            self._getImage()
         return self._rect
     rect=property(_getRect)
 
     
+    def _getVisited(self):
+        """Whether the player has previously visited the slide."""
+        if self.id: return self.id in Slide.visits
+        return self._visited
+    def _setVisited(self, visited):
+        if pyzzle.journal and self.id and visited != self.visited:
+            pyzzle.journal.record('visited', self.id, visited)
+        self._visited=visited
+        if not self.id:     pass
+        elif visited:       Slide.visits.add(self.id)
+        else:               Slide.visits.discard(self.id)
+    visited=property(_getVisited, _setVisited)
+    
     def _setFile(self, file):
+        #the image is checked on the next frame, and only laid out again 
+        #if its size differs (see _getImage)
         self._file=file
-        self.loaded=False
     def _getFile(self):
-        """The name of the image file displayed by the Slide.
-        Resets self.loaded to False"""
+        """The name of the image file displayed by the Slide. 
+        Switching to one of the slide's variants costs nothing 
+        once they are loaded (see addVariant())."""
         return self._file
     file=property(_getFile, _setFile)
 
@@ -240,12 +402,64 @@ class Slide(Panel):
     
     def draw(self, screen):
         """Draws the slide's image to screen, 
-        then draws any sprites within the Slide."""
-        screen.blit(self.image, self._rect)
+        then draws any sprites within the Slide. 
+        Only the part of the image within the screen is blitted, so panoramas 
+        cost no more to draw than slides the size of the screen. 
+        Panoramas that wrap are drawn in two parts where their ends meet."""
+        image=self.image
+        offsets=(0, -self._rect.width, self._rect.width) if self.wrap else (0,)
+        for offset in offsets:
+            rect=self._rect.move(offset, 0)
+            visible=rect.clip(screen.get_rect())
+            if visible:
+                screen.blit(image, visible, visible.move(-rect.left, -rect.top))
         Panel.draw(self, screen)
         
         if pyzzle.design:
             pyzzle.Text(self.id).draw(screen)
+    def collidepoint(self, pos):
+        """Whether a point on the screen is on the Slide. 
+        Panoramas that wrap extend across the whole screen horizontally."""
+        if self.wrap:
+            return self.rect.top <= pos[1] < self.rect.bottom
+        return self.rect.collidepoint(pos)
+    def _hit(self, pos):
+        """The topmost enabled sprite at a point on the screen. On panoramas that wrap, 
+        points beyond either end of the image are found where the image repeats."""
+        hit=Panel._hit(self, pos)
+        if not hit and self.wrap:
+            rect=self.rect
+            if   pos[0] >= rect.right: hit=Panel._hit(self, (pos[0]-rect.width, pos[1]))
+            elif pos[0] <  rect.left:  hit=Panel._hit(self, (pos[0]+rect.width, pos[1]))
+        return hit
+    def pan(self, x, y=0):
+        """Moves the slide across the screen, to look around a panorama.
+        Fractions of pixels add up over successive calls, so slow pans are smooth. 
+        Panoramas that wrap keep turning horizontally. Others jump back to their 
+        far edge when they can go no further horizontally, and stop vertically.
+        @param x: The number of pixels to move right.
+        @param y: The number of pixels to move down.
+        """
+        screen=pyzzle.screen.get_rect()
+        rect=self.rect
+        x+=self._panRemainder[0]
+        y+=self._panRemainder[1]
+        stepx, stepy = int(x), int(y)
+        self._panRemainder=[x-stepx, y-stepy]
+        if stepx and self.wrap:
+            #keep the image's left edge on or left of the screen's
+            left=(rect.left+stepx) % rect.width
+            rect.left=left-rect.width if left > 0 else 0
+        elif stepx:
+            towards, aways = ('right', 'left') if stepx < 0 else ('left', 'right')
+            if not (screen.left <= getattr(rect, towards)+stepx <= screen.right):
+                rect.move_ip(stepx, 0)
+            else:
+                setattr(rect, aways, getattr(screen, aways))
+        if stepy:
+            towards='bottom' if stepy < 0 else 'top'
+            if not (screen.top <= getattr(rect, towards)+stepy <= screen.bottom):
+                rect.move_ip(0, stepy)
     def enter(self, oldslide=None, delay=.1):
         """Called when the user enters the Slide.
         @type oldslide: Panel
@@ -255,10 +469,14 @@ class Slide(Panel):
         """
         Panel.enter(self, oldslide, delay)
         self.visited=True
+        if pyzzle.gamefile and self._shard() in pyzzle.gamefile.shards:
+            pyzzle.gamefile.attach(self._shard())
+        self._pin()
+        for slide in [self]+self._neighbors():
+            for path in slide._imagePaths():
+                media.images.prefetch(path)
         if self.ambiencefile:
-            ambience=media.sounds.load(self.ambiencefile)
-            if ambience.get_num_channels() == 0:
-                ambience.play(-1, fade_ms=int(delay*1000))
+            ambience.play(self.ambiencefile, fade=delay)
     def exit(self, newslide=None, delay=.1):
         """Called when the user exits the Slide.
         @type newslide: Panel
@@ -270,8 +488,6 @@ class Slide(Panel):
         Panel.exit(self, newslide, delay)
         if self.ambiencefile and \
            ((not hasattr(newslide, 'ambiencefile')) or self.ambiencefile!=newslide.ambiencefile):
-            ambience=media.sounds.load(self.ambiencefile)
-            ambience.stop()
-            #currently causes bug in which ambience.get_num_channels() == 1
-            #ambience.fadeout(int(delay*1000))
+            ambience.stop(fade=delay)
+        self._unpin()
 
@@ -0,0 +1,190 @@
+"""Compiles game data into a binary snapshot that loads without SQL.
+
+Loading a game file normally selects every row of every table,
+wraps each row in a datafile.Row, and resolves every reference
+to a slide or hotspot by its id. A snapshot stores the same data
+with references already resolved to integer indices, and with the
+relative rects of slides and hotspots stored as flat arrays of floats.
+Loading a game from its snapshot only requires reading a single file.
+
+Snapshots are written next to the game file they are compiled from
+(e.g. main.gamec for main.game). A snapshot is only used if the game
+file and its shards have not changed since it was written, so it is
+safe to leave an outdated snapshot lying around - pyzzle.load() falls
+back to the game file.
+"""
+import os, marshal
+from array import array
+
+import pyzzle
+from datafile import DB, Row
+
+MAGIC='PYZS'
+VERSION=1
+
+def filename(gamefilename):
+    """The name of the snapshot file compiled from a game file."""
+    return gamefilename+'c'
+
+def _signature(files):
+    return [(file, os.path.getsize(file), os.path.getmtime(file)) for file in files]
+def _index(ids):
+    return dict((id, i) for i, id in enumerate(ids))
+def _cells(rows):
+    return [dict(zip(cells.keys(), tuple(cells))) for cells in rows]
+
+def write(gamefilename, snapshotfilename=None):
+    """Compiles a game file, along with any shards of its stages,
+    into a snapshot.
+    @param gamefilename: The name of the SQLite database file to compile.
+    @param snapshotfilename: The name of the snapshot file to write.
+        By default, the game file name followed by 'c' (e.g. main.gamec)
+    """
+    db=DB(gamefilename)
+    stages=_cells(db.select('Stage'))
+    for stage in stages:
+        if stage.get('file'):
+            db.shard(stage['id'], stage['file'])
+    slides=db.select('Slide')
+    hotspots=db.select('Hotspot')
+    items=db.select('Item')
+    switches=db.select('Switch')
+    db.close()
+
+    stageIndex=_index([stage['id'] for stage in stages])
+    slideIndex=_index([row['id'] for row in slides])
+    hotspotIndex=_index([row['id'] for row in hotspots])
+    slideRef=lambda id: slideIndex[id] if id else -1
+    hotspotRef=lambda id: hotspotIndex[id] if id else -1
+
+    rects=array('d')
+    refs=array('i')
+    for row in slides:
+        rects.extend([row[attr] or 0. for attr in
+                      ('rectleft', 'recttop', 'rectheight', 'rectwidth')])
+        refs.extend([slideRef(row[ref]) for ref in pyzzle.Slide._refColumns])
+    world={'stages':stages,
+           'slides':{'id':           [row['id'] for row in slides],
+                     'stage':        [stageIndex[row['stage']] if row['stage'] else -1
+                                      for row in slides],
+                     'image':        [row['image'] for row in slides],
+                     'ambientSound': [row['ambientSound'] for row in slides],
+                     'movementSound':[row['movementSound'] for row in slides],
+                     'layer':        [row['layer'] for row in slides],
+                     'rect':         rects.tostring(),
+                     'refs':         refs.tostring()}}
+
+    rects=array('d')
+    drags=array('d')
+    links=array('i')
+    for row in hotspots:
+        rects.extend([row[attr] or 0. for attr in ('left', 'top', 'width', 'height')])
+        drags.extend([row['drag'+attr] or 0. for attr in ('left', 'top', 'width', 'height')])
+        links.extend([slideRef(row['parent']), slideRef(row['link'])])
+    world['hotspots']=\
+        {'id':        [row['id'] for row in hotspots],
+         'cursor':    [row['cursor'] for row in hotspots],
+         'sound':     [row['sound'] for row in hotspots],
+         'transition':[row['transition'] for row in hotspots],
+         'delay':     [row['delay'] for row in hotspots],
+         'text':      [row['text'] for row in hotspots],
+         'layer':     [row['layer'] for row in hotspots],
+         'zip':       [row['zip'] for row in hotspots],
+         'rect':      rects.tostring(),
+         'drag':      drags.tostring(),
+         'links':     links.tostring()}
+    world['items']=[(row['id'], slideRef(row['gameslide']), hotspotRef(row['gamehotspot']),
+                     row['takenfile'], slideRef(row['menuslide']),
+                     slideRef(row['closeupslide']), row['taken'])
+                    for row in items]
+    world['switches']=[(row['id'], slideRef(row['onslide']), slideRef(row['offslide']),
+                        hotspotRef(row['onhotspot']), hotspotRef(row['offhotspot']), row['on'])
+                       for row in switches]
+
+    files=[gamefilename]+[db.shards[stage['id']] for stage in stages
+                          if stage['id'] in db.shards]
+    if not snapshotfilename: snapshotfilename=filename(gamefilename)
+    snapshotfile=open(snapshotfilename, 'wb')
+    snapshotfile.write(MAGIC)
+    marshal.dump((VERSION, _signature(files), world), snapshotfile)
+    snapshotfile.close()
+
+def load(gamefile, snapshotfilename=None):
+    """Loads the game world from the snapshot of a game file,
+    provided the snapshot is up to date.
+    @type gamefile: datafile.DB
+    @param gamefile: The game file the snapshot was compiled from.
+        Shards listed in the snapshot are registered with it,
+        so that changes can be saved as usual.
+    @param snapshotfilename: The name of the snapshot file.
+        By default, the game file name followed by 'c' (e.g. main.gamec)
+    @rtype: boolean
+    @return: Whether the snapshot was loaded. If False, nothing was loaded,
+        and the game file must be loaded instead.
+    """
+    if not snapshotfilename: snapshotfilename=filename(gamefile.file)
+    try:
+        snapshotfile=open(snapshotfilename, 'rb')
+        try:
+            if snapshotfile.read(len(MAGIC)) != MAGIC: return False
+            version, signature, world = marshal.load(snapshotfile)
+        finally:
+            snapshotfile.close()
+        if version != VERSION: return False
+        if _signature([file for file, size, mtime in signature]) != signature: return False
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return False
+    _build(world, gamefile)
+    return True
+
+def _build(world, gamefile):
+    """Loads the game world from a snapshot, by turning its columns back into 
+    the cells of each row, and loading them as pyzzle.load() loads rows 
+    selected from the game file."""
+    stages=[Row(cells) for cells in world['stages']]
+    pyzzle.stages.rows=dict((stage.id, stage) for stage in stages)
+    for stage in stages:
+        if stage.cells.get('file'):
+            gamefile.shard(stage.id, stage.file)
+
+    columns=world['slides']
+    rects=array('d', columns['rect'])
+    refs=array('i', columns['refs'])
+    slideIds=columns['id']
+    slideId=lambda i: slideIds[i] if i >= 0 else None
+    for i, id in enumerate(slideIds):
+        cells={'id':           id,
+               'stage':        stages[columns['stage'][i]].id if columns['stage'][i] >= 0 else None,
+               'image':        columns['image'][i],
+               'ambientSound': columns['ambientSound'][i],
+               'movementSound':columns['movementSound'][i],
+               'layer':        columns['layer'][i]}
+        cells.update(zip(('rectleft', 'recttop', 'rectheight', 'rectwidth'), rects[i*4:i*4+4]))
+        cells.update((ref, slideId(refs[i*5+j])) for j, ref in enumerate(pyzzle.Slide._refColumns))
+        pyzzle.Slide._load(cells)
+    for slide in pyzzle.Slide:
+        slide._loadRefs()
+
+    columns=world['hotspots']
+    rects=array('d', columns['rect'])
+    drags=array('d', columns['drag'])
+    links=array('i', columns['links'])
+    hotspotIds=columns['id']
+    hotspotId=lambda i: hotspotIds[i] if i >= 0 else None
+    for i, id in enumerate(hotspotIds):
+        cells=dict((column, columns[column][i]) for column in 
+                   ('cursor', 'sound', 'transition', 'delay', 'text', 'layer', 'zip'))
+        cells.update(id=id, parent=slideId(links[i*2]), link=slideId(links[i*2+1]))
+        cells.update(zip(('left', 'top', 'width', 'height'), rects[i*4:i*4+4]))
+        cells.update(zip(('dragleft', 'dragtop', 'dragwidth', 'dragheight'), drags[i*4:i*4+4]))
+        pyzzle.Hotspot._load(cells)
+
+    for id, gameslide, gamehotspot, takenfile, menuslide, closeupslide, taken in world['items']:
+        pyzzle.Item._load({'id':id, 'gameslide':slideId(gameslide), 
+                           'gamehotspot':hotspotId(gamehotspot), 'takenfile':takenfile, 
+                           'menuslide':slideId(menuslide), 'closeupslide':slideId(closeupslide), 
+                           'taken':taken})
+    for id, onslide, offslide, onhotspot, offhotspot, on in world['switches']:
+        pyzzle.Switch._load({'id':id, 'onslide':slideId(onslide), 'offslide':slideId(offslide), 
+                             'onhotspot':hotspotId(onhotspot), 'offhotspot':hotspotId(offhotspot), 
+                             'on':on})
@@ -1,7 +1,7 @@
 """
     A collection of commonly used, global functions
 """
-import pyzzle, movie, media
+import pyzzle, movie, media, animation, profiler
 
 import pygame
 from pygame.locals import *
@@ -10,14 +10,19 @@ import sys
 import math
 
 def beginDraw():
-    """Runs the draw() method on pyzzle.panel.
+    """Advances animations in pyzzle.scheduler, then runs the draw() method 
+    on pyzzle.panel and draws any animations over it.
     Useful for creating custom transitions."""
-    pyzzle.screen.fill((0,0,0))
-    pyzzle.panel.draw(pyzzle.screen)
+    pyzzle.scheduler.update()
+    if not pyzzle.scheduler.opaque():
+        pyzzle.screen.fill((0,0,0))
+        pyzzle.panel.draw(pyzzle.screen)
+    pyzzle.scheduler.draw(pyzzle.screen)
 def endDraw():
     """Finalizes drawing. 
     Useful for creating custom transitions."""
     pygame.display.flip()
+    _dirty['flips']+=1
 def drawCursor(cursor, pos=None):
     """Displays the cursor
     Useful for creating custom transitions."""
@@ -27,17 +32,132 @@ def drawCursor(cursor, pos=None):
         pyzzle.cursor.rect=pyzzle.cursor.image.get_rect()
         pyzzle.cursor.rect.center=pos
         pyzzle.screen.blit(pyzzle.cursor.image, pyzzle.cursor.rect)
+        markDirty(pyzzle.cursor.rect)
+
+_dirty={'scene':None, 'drawn':[], 'flips':0, 'lastFlips':None}
+def markDirty(rect):
+    """Marks a region of the screen that was drawn over pyzzle.panel 
+    (e.g. the cursor, or highlighted text), so that it is restored 
+    on the next frame drawn by drawDirty()."""
+    if pyzzle.dirtyRects:
+        _dirty['drawn'].append(Rect(rect))
+def _scene(panel):
+    """Describes everything drawn by a panel, to tell whether anything moved or changed."""
+    scene=[]
+    for sprite in panel.sprites:
+        rect=getattr(sprite, 'rect', None)
+        scene.append((id(sprite), tuple(rect) if rect else None,
+                      getattr(sprite, 'enabled', True), 
+                      id(getattr(sprite, 'image', None))))
+        if isinstance(sprite, pyzzle.Panel):
+            scene.append(_scene(sprite))
+    return scene
+def _animated(panel):
+    """The rects of sprites that draw something different every frame (e.g. movies)."""
+    rects=[]
+    for sprite in panel.sprites:
+        if getattr(sprite, 'animated', False):
+            rects.append(Rect(sprite.rect))
+        elif isinstance(sprite, pyzzle.Panel):
+            rects+=_animated(sprite)
+    return rects
+def _merge(rects):
+    merged=[]
+    for rect in rects:
+        for other in merged[:]:
+            if rect.colliderect(other):
+                rect=rect.union(other)
+                merged.remove(other)
+        merged.append(rect)
+    return merged
+def drawDirty():
+    """Draws a frame of the main loop, highlights, and displays the cursor, 
+    redrawing only the regions of the screen that changed since the last frame: 
+    the cursor, highlighted text, and animated sprites such as movies. 
+    The whole screen is redrawn when any sprite moves, appears, or changes image, 
+    and after any frame drawn with endDraw() (e.g. during transitions). 
+    Used in place of beginDraw() and endDraw() when pyzzle.dirtyRects is enabled."""
+    pyzzle.scheduler.update()
+    screen=pyzzle.screen
+    busy=pyzzle.scheduler.busy()
+    scene=(_scene(pyzzle.panel), pyzzle.design and pygame.key.get_mods() & KMOD_SHIFT, busy)
+    full=busy or scene != _dirty['scene'] or _dirty['flips'] != _dirty['lastFlips']
+    restored=_dirty['drawn']
+    _dirty['drawn']=[]
+    if full:
+        if not pyzzle.scheduler.opaque():
+            screen.fill((0,0,0))
+            pyzzle.panel.draw(screen)
+        pyzzle.scheduler.draw(screen)
+    else:
+        restored=_merge([rect.clip(screen.get_rect()) for rect in 
+                         restored+_animated(pyzzle.panel)])
+        for rect in restored:
+            screen.set_clip(rect)
+            screen.fill((0,0,0))
+            pyzzle.panel.draw(screen)
+        screen.set_clip(None)
+    profiler.lap('draw')
+    cursor=pyzzle.panel.highlight()
+    profiler.lap('highlight')
+    drawCursor(cursor)
+    profiler.lap('cursor')
+    overlay=profiler.drawOverlay(screen)
+    if overlay: markDirty(overlay)
+    profiler.lap('overlay')
+    if full:
+        pygame.display.flip()
+    else:
+        pygame.display.update(restored+_dirty['drawn'])
+    profiler.lap('flip')
+    _dirty['scene']=scene
+    _dirty['lastFlips']=_dirty['flips']
+_activity={'scene':None, 'panning':False}
+def animating():
+    """Whether anything on screen changed during the last frame, or will change 
+    on the next, without any input from the user: e.g. a movie is playing, 
+    a transition is running, or the cursor rests on a hotspot that pans the slide. 
+    Used by play() to decide whether to wait for input before drawing again."""
+    scene=_scene(pyzzle.panel)
+    changed=scene != _activity['scene']
+    _activity['scene']=scene
+    panning=_activity['panning']
+    _activity['panning']=False
+    return changed or panning or bool(_animated(pyzzle.panel)) or pyzzle.scheduler.busy()
+def waitEvents(timeout):
+    """Waits until an event is posted (e.g. the user moves the mouse, 
+    or a timer fires), without using the CPU in the meantime.
+    @param timeout: The maximum number of seconds to wait.
+    @return: Whether an event was posted before the timeout."""
+    try:
+        event=pygame.event.wait(int(timeout*1000))
+    except TypeError:
+        #pygame 1.x cannot wait with a timeout, so poll instead
+        end=pygame.time.get_ticks()+int(timeout*1000)
+        event=pygame.event.poll()
+        while event.type == NOEVENT and pygame.time.get_ticks() < end:
+            pygame.time.wait(10)
+            event=pygame.event.poll()
+    if event.type == NOEVENT:
+        return False
+    #leave the event for the main loop, which handles it after drawing the frame
+    pygame.event.post(event)
+    return True
 def draw():
     """Draws everything in pyzzle.panel. Does not run any highlight() methods."""
     beginDraw()
     endDraw()
 
 def pause(delay=1):
-    """Pauses the game.
+    """Pauses the game. The game is still drawn, and animations still run, 
+    but events are left for the main loop to process once the pause is over.
     @param delay: The number of seconds to pause the game.
     """
-    framecount=int(delay*pyzzle.framerate)
-    for i in range(framecount):
+    end=animation.now()+delay
+    clock=pygame.time.Clock()
+    while animation.now() < end:
+        clock.tick(pyzzle.framecap)
+        pygame.event.pump()
         draw()
 
 def dragRect(color=(0,0,0)):
@@ -273,24 +393,27 @@ def promptChoice(question='', choices=[], allowExit=True, color=None, fontFile=N
         
 #highlight functions
 def _pan(self, towards, aways, x=True):
-    screen=pyzzle.screen.get_rect()
+    slide=self.parent
     mouse=pyzzle.cursor.rect.center
-    distance=getattr(self.rect,aways)-mouse[not x]
-    distance*=.1
-    if x:
-        if not (screen.left <= getattr(self.parent.rect, towards)+distance <= screen.right):
-            self.parent.rect.move_ip(distance,0)
-        else:
-            setattr(self.parent.rect, aways, getattr(screen, aways))
-    elif not (screen.top <= getattr(self.parent.rect, towards)+distance <= screen.bottom):
-        self.parent.rect.move_ip(0,distance)
+    depth=getattr(self.rect,aways)-mouse[not x]
+    #pan by the time since the last frame, unless panning just started
+    now=animation.now()
+    elapsed=now-slide._panned if now-slide._panned < .25 else 0
+    slide._panned=now
+    #slow pans move less than a pixel per frame, so nothing on screen changes, 
+    #but play() must keep drawing frames for the fractions to add up
+    _activity['panning']=True
+    distance=depth*slide.panSpeed*elapsed
+    if x:   slide.pan(distance, 0)
+    else:   slide.pan(0, distance)
 def panRight(self):
     """Moves the slide right, and jumps back to the slide's left when it con go no further. 
-    Used in panoramic slides."""
+    Used in panoramic slides. Panoramas that wrap keep turning instead (see Slide.wrap)."""
     _pan(self, towards='right', aways='left')
 def panLeft(self): 
     """Moves the slide left, and jumps back to the slide's right when it con go no further. 
-    Intended as a choice for Hotspot.onHighlight. Used in panoramic slides."""
+    Intended as a choice for Hotspot.onHighlight. Used in panoramic slides. 
+    Panoramas that wrap keep turning instead (see Slide.wrap)."""
     _pan(self, towards='left', aways='right')
 def panUp(self):    
     _pan(self, towards='top', aways='bottom', x=False)
@@ -339,11 +462,46 @@ def endTransition(oldslide, newslide, delay=0, panel=None):
     if oldslide:
         panel.remove(oldslide)
     pyzzle.history.append((oldslide, newslide))
+    if pyzzle.journal:
+        pyzzle.journal.transition(oldslide, newslide)
 def _noTransition(*p,**k):
     pass
+def capture(sprites=None, hidden=()):
+    """Draws sprites onto an offscreen surface the size of the screen, 
+    as they appear on screen. Transitions draw slides once this way, 
+    then just blit the surfaces every frame, however complex the slides are.
+    @param sprites: The sprites to draw, which are drawn on a transparent 
+        surface. pyzzle.panel, drawn on black, by default.
+    @param hidden: Sprites within pyzzle.panel to leave out.
+    @rtype: Surface
+    """
+    screen=pyzzle.screen
+    if sprites is None:
+        surface=screen.copy()
+        surface.fill((0,0,0))
+        hidden=[sprite for sprite in hidden if sprite]
+        enabled=[getattr(sprite, 'enabled', True) for sprite in hidden]
+        for sprite in hidden: sprite.enabled=False
+        try:
+            pyzzle.panel.draw(surface)
+        finally:
+            for sprite, wasEnabled in zip(hidden, enabled):
+                sprite.enabled=wasEnabled
+    else:
+        surface=pygame.Surface(screen.get_size(), SRCALPHA)
+        surface.fill((0,0,0,0))
+        for sprite in sprites:
+            if sprite: sprite.draw(surface)
+        surface=surface.convert_alpha()
+    return surface
 def transition(oldslide=None, newslide=None, delay=0, **param):
     """Basic transition function.
-    Pauses the game for a given number of seconds, then flashes to newslide
+    Waits for a given number of seconds, then flashes to newslide. 
+    
+    Like all transition functions, this queues the transition in pyzzle.scheduler 
+    and returns immediately, so the game keeps running while it completes. 
+    Transitions without delay complete before returning, 
+    unless another transition has yet to complete.
     @type oldslide: Panel
     @param oldslide: The Panel to exit.
     @type newslide: Panel
@@ -351,33 +509,44 @@ def transition(oldslide=None, newslide=None, delay=0, **param):
     @param delay: The time it should take to perform onStart and onStop 
         individually, in seconds.
     @param **param: Additional arguments used in beginTransition() and endTransition()
+    @rtype: animation.Tween
+    @return: The queued transition, which may be cancelled or finished early.
     """
-    beginTransition(oldslide, newslide, delay, **param)
-    pause(delay)
-    endTransition(oldslide, newslide, delay, **param)
+    return pyzzle.scheduler.queue(animation.Tween(delay, 
+        onStart =lambda: beginTransition(oldslide, newslide, delay, **param),
+        onFinish=lambda: endTransition(oldslide, newslide, delay, **param),
+        blocking=True))
 def _scroll(oldslide, newslide, towards, aways, delay=0, **param):
-    beginTransition(oldslide, newslide, delay, **param)
     screen=pyzzle.screen.get_rect()
-    
-    oldsliderect = oldslide.rect if oldslide else Rect(screen)
-    newsliderect = newslide.rect if newslide else Rect(screen)
-    setattr(newsliderect, aways, getattr(oldsliderect, towards))
-    screenx, screeny=screen.center
-    slidex, slidey=newsliderect.center
-    distancex, distancey=screenx-slidex, screeny-slidey
-    framecount=int(delay*pyzzle.framerate)
-    increment=(distancex/framecount, distancey/framecount) if framecount else (0,0)
-    
-    for i in xrange(0, framecount):
-        if oldslide:    oldslide.rect.move_ip(*increment)
-        if newslide:    newslide.rect.move_ip(*increment)
-        draw()
-    if oldslide:    oldslide.rect.center=pyzzle.screen.get_rect().center
-    if newslide:    newslide.rect.center=pyzzle.screen.get_rect().center
-    endTransition(oldslide, newslide, delay, **param)
+    frames={}
+    def start():
+        beginTransition(oldslide, newslide, delay, **param)
+        oldsliderect = oldslide.rect if oldslide else Rect(screen)
+        newsliderect = Rect(newslide.rect if newslide else screen)
+        setattr(newsliderect, aways, getattr(oldsliderect, towards))
+        frames['distance']=(screen.centerx-newsliderect.centerx, 
+                            screen.centery-newsliderect.centery)
+        #newslide is drawn where it ends up, and offset while scrolling
+        if newslide:    newslide.rect.center=screen.center
+        frames['background']=capture(hidden=(oldslide, newslide))
+        frames['old']=capture([oldslide])
+        frames['new']=capture([newslide])
+    def drawFrames(surface):
+        distancex, distancey = frames['distance']
+        progress=tween.progress()
+        surface.blit(frames['background'], (0,0))
+        surface.blit(frames['old'], (int(distancex*progress),     int(distancey*progress)))
+        surface.blit(frames['new'], (int(distancex*(progress-1)), int(distancey*(progress-1))))
+    def finish():
+        if oldslide:    oldslide.rect.center=screen.center
+        if newslide:    newslide.rect.center=screen.center
+        endTransition(oldslide, newslide, delay, **param)
+    tween=animation.Tween(delay, onStart=start, onFinish=finish, onDraw=drawFrames, 
+                          blocking=True, opaque=True)
+    return pyzzle.scheduler.queue(tween)
 def _scrollfn(towards, aways):
     def scroll(oldslide=None, newslide=None, delay=0, **param):
-        _scroll(oldslide, newslide, towards, aways, delay, **param)
+        return _scroll(oldslide, newslide, towards, aways, delay, **param)
     return scroll
 scrollRight =_scrollfn('right', 'left')
 scrollLeft  =_scrollfn('left', 'right')
@@ -395,28 +564,66 @@ def fade(oldslide=None, newslide=None, delay=0, color=(0,0,0), alpha=255, **para
     @param color: The color at maximum fade
     @param alpha: The alpha transparency of the slide at maximum fade
     @param **param: Additional arguments used in beginTransition() and endTransition()
+    @rtype: animation.Tween
+    @return: The last stage of the fade queued in pyzzle.scheduler.
     """
     if not (oldslide and newslide):
         delay=delay*2
-    framecount=int(delay*pyzzle.framerate)
-    increment=1./(framecount) if framecount else 1.
     filter=pyzzle.screen.copy()
     filter.fill(color)
     filter.set_alpha(alpha)
+    frames={}
+    def freeze(tween):
+        #movies must keep playing, so are drawn as usual
+        frames.pop('screen', None)
+        if not _animated(pyzzle.panel):
+            frames['screen']=capture()
+            tween.opaque=True
+    def drawFilter(screen):
+        if 'screen' in frames:
+            screen.blit(frames['screen'], (0,0))
+        screen.blit(filter, (0,0))
+    def swap():
+        beginTransition(oldslide, newslide, delay, **param)
+        endTransition(oldslide, newslide, delay, **param)
     if oldslide:
-        for i in range(framecount):
-            beginDraw()
-            filter.set_alpha(int(alpha*increment*i))
-            pyzzle.screen.blit(filter, (0,0))
-            endDraw()
-    beginTransition(oldslide, newslide, delay, **param)
-    endTransition(oldslide, newslide, delay, **param)
+        tween=animation.Tween(delay, 
+            onUpdate=lambda progress: filter.set_alpha(int(alpha*progress)), 
+            onDraw=drawFilter, blocking=True)
+        tween.onStart=lambda tween=tween: freeze(tween)
+        pyzzle.scheduler.queue(tween)
+    tween=pyzzle.scheduler.queue(animation.Tween(0, onFinish=swap, blocking=True))
     if newslide:
-        for i in range(framecount):
-            beginDraw()
-            filter.set_alpha(int(alpha*(1-(increment*i))))
-            pyzzle.screen.blit(filter, (0,0))
-            endDraw()
+        tween=animation.Tween(delay, 
+            onUpdate=lambda progress: filter.set_alpha(int(alpha*(1-progress))), 
+            onDraw=drawFilter, blocking=True)
+        tween.onStart=lambda tween=tween: freeze(tween)
+        pyzzle.scheduler.queue(tween)
+    return tween
+def crossfade(oldslide=None, newslide=None, delay=0, **param):
+    """Transitions slides by gradually blending oldslide into newslide.
+    @type oldslide: Panel
+    @param oldslide: The Panel to fade out of.
+    @type newslide: Panel
+    @param newslide: The Panel to fade in to.
+    @param delay: The time it should take to blend the slides.
+    @param **param: Additional arguments used in beginTransition() and endTransition()
+    @rtype: animation.Tween
+    @return: The crossfade queued in pyzzle.scheduler.
+    """
+    frames={}
+    def start():
+        beginTransition(oldslide, newslide, delay, **param)
+        frames['old']=capture(hidden=(newslide,))
+        frames['new']=capture(hidden=(oldslide,))
+    def update(progress):
+        frames['new'].set_alpha(int(255*progress))
+    def drawFrames(screen):
+        screen.blit(frames['old'], (0,0))
+        screen.blit(frames['new'], (0,0))
+    return pyzzle.scheduler.queue(animation.Tween(delay, start, update, 
+        onFinish=lambda: endTransition(oldslide, newslide, delay, **param), 
+        onDraw=drawFrames, blocking=True, opaque=True))
 
 
 def cutscene(oldslide=None, newslide=None, delay=0, 
@@ -433,22 +640,21 @@ def cutscene(oldslide=None, newslide=None, delay=0,
     @param onStop: The transition function used to transition from the movie to newslide 
     @param allowExit: Whether the user can skip the movie by hitting ESC.
     @param moviefile: The name of the movie file to play. 
-        Pygame currently only supports the MPEG-1 video codec. 
+        See movie.readers for the formats supported. 
     @param soundfile: The name of the sound file to play along with the movie.
-        Any sound from the movie will be replaced with this sound.
-        Use this if you are having trouble getting movie sound to play in Pygame.
     @type movie: Movie
     @param movie: An instance of the Movie class to play. If specified, 
         any file you specify with the moviefile parameter will be ignored.
     @param **param: Additional arguments used in beginTransition() and endTransition()
     """
     if not movie:
-        movie=movie.Movie(id=None, moviefile=moviefile, soundfile=soundfile)
+        #the movie parameter hides the movie module
+        movie=pyzzle.movie.Movie(id=None, moviefile=moviefile, soundfile=soundfile)
     stopped=False
     onStart(oldslide, movie, delay)
     clock = pygame.time.Clock()
     while not (movie.played or stopped):
-        clock.tick(150)
+        clock.tick(pyzzle.framecap)
         pyzzle.framerate=clock.get_fps()
         draw()
         for event in pygame.event.get():
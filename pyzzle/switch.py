@@ -43,12 +43,26 @@ class Switch:
         for hotspot in self.hotspots:
             hotspot.onClick=onClick
             
+    @staticmethod
+    def _links(slide):
+        """The hotspots that link to a slide, found by the slide's id. 
+        In lazy mode, this includes hotspots whose link has yet to be resolved, 
+        and slides that link to the slide are fetched if need be."""
+        hotspots=set(slide.links)|set(Hotspot.rows.values())
+        if Slide.source and pyzzle.linkgraph:
+            for id in pyzzle.linkgraph.predecessors(slide):
+                if id in Slide:
+                    hotspots.update(Slide[id].sprites)
+        return [hotspot for hotspot in hotspots 
+                if isinstance(hotspot, Hotspot) and hotspot._getLinkId() == slide.id]
     def switch(self):
         self.on=not self.on
+        if pyzzle.journal and self.id:
+            pyzzle.journal.record('switch', self.id, self.on)
         if self.onslide != self.offslide and all([self.onslide, self.offslide]):
             oldslide =self.offslide if self.on else self.onslide
             newslide =self.onslide  if self.on else self.offslide
-            for link in oldslide.links:
+            for link in Switch._links(oldslide):
                 if link not in self.hotspots:
                     link.link=newslide
             if self._hotspot:
@@ -4,12 +4,33 @@ import media
 import pyzzle
 from pygame.rect import *
 from pygame.sprite import *
+from collections import OrderedDict
+
+renderLimit=256
+"""The number of rendered text surfaces kept by render()."""
+_rendered=OrderedDict()
+
+def render(text, fontFile, fontSize, color, antialias=False):
+    """Renders text to a surface, reusing the surface if the same text 
+    was recently rendered with the same font, size, color, and antialiasing. 
+    The surface is shared, so it must not be drawn on."""
+    key=(text, fontFile, fontSize, tuple(color), antialias)
+    if key in _rendered:
+        image=_rendered.pop(key)
+    else:
+        font=media.fonts.load(fontFile, fontSize=fontSize)
+        image=font.render(text, antialias, color)
+        if len(_rendered) >= renderLimit:
+            _rendered.popitem(last=False)
+    _rendered[key]=image
+    return image
 
 class Text(Sprite):
     """Presents text to the user"""
     fontFileDefault='freesansbold.ttf'
     fontSizeDefault=32
     colorDefault=(0,0,0)
+    antialias=False
     def __init__(self, text, fontFile=None, fontSize=None, color=None,
                  slide=None, rectRel=None, onClick=None, cursor=None):
         """Creates new Text"""
@@ -23,6 +44,7 @@ class Text(Sprite):
         self.fontFile = fontFile
         self.fontSize = fontSize
         self.image= None
+        self._rendered=None
         self.rectRel = rectRel
         self.rect=None
         self.color = color
@@ -56,10 +78,13 @@ class Text(Sprite):
             self._loadImage()
     
     def _loadImage(self):
-        """The image of text as presented to the user"""
-        font=media.fonts.load(self.fontFile)
-        self.image=font.render(self.text, False, self.color)
-        self._getRect()
+        """The image of text as presented to the user. 
+        Only rendered again if the text, font, size, or color have changed."""
+        rendered=(self.text, self.fontFile, self.fontSize, tuple(self.color), self.antialias)
+        if rendered != self._rendered:
+            self.image=render(*rendered)
+            self._rendered=rendered
+            self._getRect()
     def _getImage(self):
         self._loadImage()
         return self.image
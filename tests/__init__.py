@@ -0,0 +1,4 @@
+"""Tests for Pyzzle. They run without a display, from the folder above this one:
+
+    python -m unittest discover -s tests -t .
+"""
@@ -0,0 +1,60 @@
+"""Helpers shared by the tests."""
+import os, shutil, tempfile, unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pyzzle
+from pyzzle import datafile
+
+root=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+"""The folder of the demo game, whose media the tests use."""
+
+def reset():
+    """Forgets all loaded rows and game state, as if Pyzzle had just been imported."""
+    for TableClass in (pyzzle.Slide, pyzzle.Hotspot, pyzzle.Item, pyzzle.Switch,
+                       pyzzle.HitMap, pyzzle.stages, pyzzle.globals):
+        TableClass.rows={}
+        TableClass.source=None
+        TableClass.dirty=set()
+        TableClass.killed={}
+    pyzzle.Slide.visits=set()
+    pyzzle.scheduler.cancel()
+    pyzzle.panel.empty()
+    pyzzle.history=[]
+    pyzzle.journal=None
+
+class GameTestCase(unittest.TestCase):
+    """Loads a copy of the demo game before each test,
+    so tests may modify and save it freely."""
+    lazy=False
+    """Whether the game is loaded lazily."""
+    def setUp(self):
+        self.folder=tempfile.mkdtemp()
+        self.gamefile=os.path.join(self.folder, 'main.game')
+        shutil.copy(os.path.join(root, 'main.game'), self.gamefile)
+        self.cwd=os.getcwd()
+        os.chdir(root)
+        if not pyzzle.screen:
+            pyzzle.init((640,480))
+        reset()
+        self.shardTimeout=datafile.DB.shardTimeout
+        self.prepare()
+        pyzzle.load(self.gamefile, lazy=self.lazy, useSnapshot=False)
+    def prepare(self):
+        """Called before the game is loaded, e.g. to modify the game file."""
+    def tearDown(self):
+        reset()
+        pyzzle.gamefile.close()
+        datafile.DB.shardTimeout=self.shardTimeout
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+    
+    def visit(self, slide):
+        """Transitions to a slide, and draws a frame as play() does."""
+        oldslides=[sprite for sprite in pyzzle.panel.sprites if isinstance(sprite, pyzzle.Slide)]
+        pyzzle.transition(oldslides[-1] if oldslides else None, slide)
+        pyzzle.scheduler.finish()
+        pyzzle.beginDraw()
+        pyzzle.drawCursor(pyzzle.panel.highlight(), (0,0))
+        pyzzle.endDraw()
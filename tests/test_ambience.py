@@ -0,0 +1,41 @@
+import unittest, os, time, wave
+
+from pyzzle import ambience
+from tests.base import GameTestCase
+
+class WaveStreamTest(GameTestCase):
+    def prepare(self):
+        self.path=os.path.join(self.folder, 'ambience.wav')
+        file=wave.open(self.path, 'wb')
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(22050)
+        file.writeframes('\0\0'*22050)
+        file.close()
+        self.streams=[]
+    def stream(self):
+        """Switches to a new stream, as ambience.play() does."""
+        if ambience.current: ambience.current.stop(.5)
+        ambience.current=ambience._WaveStream('ambience.wav', self.path)
+        ambience.current.play(0)
+        self.streams.append(ambience.current)
+        return ambience.current
+    def tearDown(self):
+        ambience.stop()
+        for stream in self.streams:
+            stream._thread.join(5)
+        GameTestCase.tearDown(self)
+    
+    def testFadingStreamLeavesNewerStreamAlone(self):
+        first, second, third = [self.stream() for i in range(3)]
+        self.assertTrue(third.channel is first.channel)
+        #the first stream is still fading out, while the third plays
+        time.sleep(.25)
+        self.assertEqual(third.channel.get_volume(), 1.)
+        first._thread.join(5)
+        time.sleep(.1)
+        self.assertEqual(third.channel.get_volume(), 1.)
+        self.assertTrue(third.channel.get_busy())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from pyzzle import animation
+from pyzzle.animation import Tween, Scheduler
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.time=0.
+        now=animation.now
+        animation.now=lambda: self.time
+        self.addCleanup(setattr, animation, 'now', now)
+        self.scheduler=Scheduler()
+        self.events=[]
+    def tween(self, name, duration):
+        """A Tween that records when it starts, updates and finishes."""
+        return Tween(duration,
+                     onStart =lambda: self.events.append((name, 'start')),
+                     onUpdate=lambda progress: self.events.append((name, progress)),
+                     onFinish=lambda: self.events.append((name, 'finish')))
+    
+    def testProgressFollowsClock(self):
+        self.scheduler.start(self.tween('a', 2))
+        self.time=.5
+        self.scheduler.update()
+        self.time=1.5
+        self.scheduler.update()
+        self.time=3.
+        self.scheduler.update()
+        self.assertEqual(self.events, [('a', 'start'), ('a', 0.), ('a', .25), ('a', .75), 
+                                       ('a', 1.), ('a', 'finish')])
+        self.assertFalse(self.scheduler.busy())
+    def testZeroDurationFinishesAtOnce(self):
+        self.scheduler.queue(self.tween('a', 0))
+        self.assertEqual(self.events, [('a', 'start'), ('a', 1.), ('a', 'finish')])
+        self.assertFalse(self.scheduler.busy())
+    def testQueuedTweensRunInTurn(self):
+        self.scheduler.queue(self.tween('a', 1))
+        self.scheduler.queue(self.tween('b', 1))
+        self.time=.5
+        self.scheduler.update()
+        self.assertFalse(('b', 'start') in self.events)
+        self.time=1.
+        self.scheduler.update()
+        self.assertEqual(self.events[-3:], [('a', 'finish'), ('b', 'start'), ('b', 0.)])
+        #the second tween is timed from when the first one finished
+        self.time=1.5
+        self.scheduler.update()
+        self.assertEqual(self.events[-1], ('b', .5))
+    def testSlowFramesDoNotSlowTweens(self):
+        self.scheduler.start(self.tween('a', 1))
+        self.time=10.
+        self.scheduler.update()
+        self.assertEqual(self.events[-2:], [('a', 1.), ('a', 'finish')])
+    def testFinishAndCancel(self):
+        self.scheduler.queue(self.tween('a', 1))
+        self.scheduler.queue(self.tween('b', 1))
+        self.scheduler.finish()
+        self.assertEqual([event for event in self.events if event[1] == 'finish'], 
+                         [('a', 'finish'), ('b', 'finish')])
+        self.scheduler.start(self.tween('c', 1))
+        self.scheduler.cancel()
+        self.assertFalse(('c', 'finish') in self.events)
+        self.assertFalse(self.scheduler.busy())
+    def testBlocking(self):
+        self.scheduler.start(Tween(1))
+        self.assertFalse(self.scheduler.blocking())
+        self.scheduler.queue(Tween(1, blocking=True))
+        self.assertTrue(self.scheduler.blocking())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest, os, sqlite3
+
+import pyzzle
+from tests.base import GameTestCase
+from tests.test_datafile import count
+
+class CleanupTest(GameTestCase):
+    def prepare(self):
+        connection=sqlite3.connect(self.gamefile)
+        connection.execute("update [Slide] set [image]='ROOM-3-1.JPG' where [id]='room-3-1'")
+        connection.execute("update [Slide] set [image]='nothere.jpg' where [id]='room-3-2'")
+        connection.execute("update [Hotspot] set [cursor]='Zip.PNG' where [id]='room-1-1room-4-1'")
+        connection.commit()
+        connection.close()
+    
+    def testNamesMatchFiles(self):
+        pyzzle.cleanup(report=False)
+        self.assertEqual(count(self.gamefile, "select [image] from [Slide] where [id]='room-3-1'"), 
+                         'room-3-1.jpg')
+        self.assertEqual(count(self.gamefile, 
+                               "select [cursor] from [Hotspot] where [id]='room-1-1room-4-1'"), 
+                         'zip.png')
+    def testLoadedRowsAreCorrectedWithoutChanges(self):
+        pyzzle.cleanup(report=False)
+        self.assertEqual(pyzzle.Slide['room-3-1'].file, 'room-3-1.jpg')
+        self.assertEqual(pyzzle.Hotspot['room-1-1room-4-1'].cursor, 'zip.png')
+        self.assertEqual(pyzzle.Slide.dirty, set())
+        self.assertEqual(pyzzle.Hotspot.dirty, set())
+    def testMissingAndUnusedFiles(self):
+        missing, unused = pyzzle.cleanup(report=False)
+        self.assertEqual(missing, [os.path.join('pictures', 'nothere.jpg')])
+        self.assertTrue(os.path.join('pictures', 'room-3-2.jpg') in unused)
+        self.assertFalse(os.path.join('pictures', 'room-3-1.jpg') in unused)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import unittest, sqlite3, os, re, zlib, shutil
+
+import pygame
+
+import pyzzle
+from pyzzle import datafile
+from tests.base import GameTestCase
+
+def emptyCopy(gamefile, folder):
+    """Copies a game file into a folder, without any slides or hotspots.
+    @return: The path of the copy."""
+    os.mkdir(folder)
+    copy=os.path.join(folder, os.path.basename(gamefile))
+    shutil.copy(gamefile, copy)
+    connection=sqlite3.connect(copy)
+    connection.execute('delete from [Slide]')
+    connection.execute('delete from [Hotspot]')
+    connection.commit()
+    connection.close()
+    return copy
+def count(file, query):
+    connection=sqlite3.connect(file)
+    try:
+        return connection.execute(query).fetchone()[0]
+    finally:
+        connection.close()
+
+class LazyLoadTest(GameTestCase):
+    lazy=True
+    def testVisitingSlideChangesNothing(self):
+        self.visit(pyzzle.Slide['room-1-1'])
+        for hotspot in pyzzle.Slide['room-1-1'].sprites:
+            getattr(hotspot, 'link', None)
+        self.assertEqual(pyzzle.Slide.dirty, set())
+        self.assertEqual(pyzzle.Hotspot.dirty, set())
+    def testEditingLinkChangesHotspot(self):
+        hotspot=pyzzle.Hotspot['room-1-1room-4-1']
+        hotspot.link=pyzzle.Slide['room-1-2']
+        self.assertEqual(pyzzle.Hotspot.dirty, set([hotspot]))
+        self.assertTrue(hotspot in pyzzle.Slide['room-1-2'].links)
+    def testSavingKeepsRectRel(self):
+        self.visit(pyzzle.Slide['room-1-1'])
+        hotspot=pyzzle.Hotspot['room-1-1room-4-1']
+        rectRel=hotspot.rectRel
+        hotspot.rect
+        hotspot._save()
+        self.assertTrue(hotspot.rectRel is rectRel)
+        self.assertEqual(pyzzle.Hotspot.dirty, set())
+    def testSavingEditedRect(self):
+        slide=pyzzle.Slide['room-1-1']
+        self.visit(slide)
+        hotspot=pyzzle.Hotspot['room-1-1room-4-1']
+        hotspot.rect=pygame.Rect(slide.rect.topleft, (slide.rect.width//2, slide.rect.height))
+        cells=hotspot._save()
+        self.assertEqual((cells['left'], cells['top'], cells['width'], cells['height']), 
+                         (0, 0, .5, 1))
+        self.assertEqual(pyzzle.Hotspot.dirty, set([hotspot]))
+    def testSwitchRelinksSlidesNotFetched(self):
+        switch=pyzzle.Switch['curtains']
+        self.assertFalse('room-1-4' in pyzzle.Slide.rows)
+        switch.switch()
+        self.assertTrue(pyzzle.Slide['room-1-4'].forward.link is pyzzle.Slide['room-3-4b'])
+        self.assertTrue(pyzzle.Hotspot['room-3-4bswitch'].link is pyzzle.Slide['room-3-4'])
+    def testSaveAsWritesWholeGame(self):
+        pyzzle.Slide['start'].file='bookcover.jpg'
+        copy=emptyCopy(self.gamefile, os.path.join(self.folder, 'copy'))
+        original=pyzzle.gamefile
+        pyzzle.save(copy)
+        original.close()
+        for table in 'Slide', 'Hotspot':
+            self.assertEqual(count(copy, 'select count(*) from ['+table+']'), 
+                             count(self.gamefile, 'select count(*) from ['+table+']'))
+        self.assertEqual(count(copy, "select [image] from [Slide] where [id]='start'"), 'bookcover.jpg')
+        self.assertTrue(pyzzle.Slide.source is pyzzle.gamefile)
+        self.assertEqual(pyzzle.gamefile.file, copy)
+
+class ShardTest(GameTestCase):
+    """Keeps the slides and hotspots of the 'room' stage in a shard."""
+    lazy=True
+    def prepare(self):
+        connection=sqlite3.connect(self.gamefile)
+        connection.execute("alter table [Stage] add column [file] TEXT")
+        connection.execute("update [Stage] set [file]='room.db' where [id]='room'")
+        connection.execute("attach database ? as [room]", (os.path.join(self.folder, 'room.db'),))
+        for table, condition in (('Hotspot', "[parent] in (select [id] from main.[Slide] where [stage]='room')"),
+                                 ('Slide',   "[stage]='room'")):
+            sql=connection.execute("select [sql] from main.sqlite_master where [name]=?", (table,)).fetchone()[0]
+            connection.execute(re.sub(r'^\s*create\s+table\s+', 'create table [room].', sql, flags=re.I))
+            connection.execute('insert into [room].['+table+'] select * from main.['+table+'] where '+condition)
+            connection.execute('delete from main.['+table+'] where '+condition)
+        connection.commit()
+        connection.close()
+    def expire(self):
+        datafile.DB.shardTimeout=0
+        pyzzle.gamefile.expire(keep=[None])
+    def cell(self, query):
+        connection=sqlite3.connect(self.gamefile)
+        connection.execute("attach database ? as [room]", (os.path.join(self.folder, 'room.db'),))
+        try:
+            return connection.execute(query).fetchone()[0]
+        finally:
+            connection.close()
+    
+    def testExpireDetachesIdleShards(self):
+        self.visit(pyzzle.Slide['room-1-1'])
+        self.assertTrue('room' in pyzzle.gamefile._attached)
+        self.visit(pyzzle.Slide['start'])
+        self.expire()
+        self.assertFalse('room' in pyzzle.gamefile._attached)
+        self.assertFalse('room-1-1' in pyzzle.Slide.rows)
+    def testExpireKeepsScriptedSlides(self):
+        pyzzle.Slide['room-1-1'].onEnter=lambda slide: None
+        pyzzle.Slide['room-1-2'].addVariant('room-1-2b.jpg')
+        pyzzle.Slide['room-1-3']
+        self.visit(pyzzle.Slide['start'])
+        self.expire()
+        self.assertFalse('room-1-3' in pyzzle.Slide.rows)
+        for id in 'room-1-1', 'room-1-2':
+            self.assertTrue(id in pyzzle.Slide.rows)
+    def testExpireKeepsSlidesOfScriptedHotspots(self):
+        hotspot=pyzzle.Hotspot['room-1-1room-4-1']
+        hotspot.onClick=lambda hotspot: None
+        self.visit(pyzzle.Slide['start'])
+        self.expire()
+        self.assertTrue(pyzzle.Hotspot['room-1-1room-4-1'] is hotspot)
+    def testExpireKeepsShardsWithUnsavedRows(self):
+        self.visit(pyzzle.Slide['room-1-1'])
+        pyzzle.Slide['room-1-1'].file='room-1-2.jpg'
+        self.visit(pyzzle.Slide['start'])
+        self.expire()
+        self.assertTrue('room' in pyzzle.gamefile._attached)
+    def testExpireIgnoresUnsavedRowsInOtherShards(self):
+        self.visit(pyzzle.Slide['room-1-1'])
+        self.visit(pyzzle.Slide['start'])
+        pyzzle.Slide['start'].file='bookcover.jpg'
+        self.expire()
+        self.assertFalse('room' in pyzzle.gamefile._attached)
+    def testSaveIsOneTransaction(self):
+        hotspot=pyzzle.Hotspot['room-1-1room-4-1']
+        pyzzle.gamefile.detach('room')
+        hotspot.cursor='grab.png'
+        pyzzle.Slide['start'].file='bookcover.jpg'
+        pyzzle.HitMap('start', (1,1), zlib.compress('\x00'), [])
+        #fail once every table has been written
+        def fail():
+            raise IOError('disk full')
+        pyzzle.gamefile.commit=fail
+        try:
+            self.assertRaises(IOError, pyzzle.save)
+        finally:
+            del pyzzle.gamefile.commit
+        self.assertEqual(self.cell("select [image] from main.[Slide] where [id]='start'"), 'startscreen.jpg')
+        self.assertEqual(self.cell("select [cursor] from [room].[Hotspot] where [id]='room-1-1room-4-1'"), 'zip.png')
+        self.assertEqual(self.cell("select count(*) from main.[HitMap]"), 0)
+        pyzzle.save()
+        self.assertEqual(self.cell("select [image] from main.[Slide] where [id]='start'"), 'bookcover.jpg')
+        self.assertEqual(self.cell("select [cursor] from [room].[Hotspot] where [id]='room-1-1room-4-1'"), 'grab.png')
+        self.assertEqual(self.cell("select count(*) from main.[HitMap]"), 1)
+        self.assertEqual(pyzzle.Hotspot.dirty, set())
+    def testSaveAsKeepsShards(self):
+        copy=emptyCopy(self.gamefile, os.path.join(self.folder, 'copy'))
+        original=pyzzle.gamefile
+        pyzzle.save(copy)
+        original.close()
+        shard=os.path.join(self.folder, 'copy', 'room.db')
+        self.assertEqual(count(copy, "select count(*) from [Slide] where [stage]='room'"), 0)
+        self.assertEqual(count(shard, "select count(*) from [Slide]"), 
+                         self.cell("select count(*) from [room].[Slide]"))
+        self.assertEqual(pyzzle.gamefile.shards['room'], shard)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest, os, shutil, tempfile, threading
+import SimpleHTTPServer, SocketServer
+
+from pyzzle import media
+
+class Handler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """Serves the files of the server's folder, failing as their names ask:
+    'flaky' files fail with a server error the first time they are requested,
+    'truncated' files are cut off partway through, 'moved/' files redirect 
+    to the file of the same name, and 'loop' files redirect to themselves."""
+    protocol_version='HTTP/1.1'
+    def do_GET(self):
+        name=self.path.strip('/')
+        self.server.requests.append(name)
+        if 'flaky' in name and self.server.requests.count(name) == 1:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif name.startswith('moved/') or 'loop' in name:
+            self.send_response(301 if 'permanent' in name else 302)
+            self.send_header('Location', '/'+name.replace('moved/', ''))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif 'truncated' in name:
+            self.send_response(200)
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            self.wfile.write('partial')
+            self.close_connection=1
+        else:
+            SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+    def translate_path(self, path):
+        return os.path.join(self.server.folder, path.strip('/'))
+    def log_message(self, *args):
+        pass
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.served=tempfile.mkdtemp()
+        self.folder=tempfile.mkdtemp()
+        for name in 'room.txt', 'flaky.txt':
+            with open(os.path.join(self.served, name), 'w') as file:
+                file.write('contents of '+name)
+        self.server=SocketServer.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads=True
+        self.server.folder=self.served
+        self.server.requests=[]
+        thread=threading.Thread(target=self.server.serve_forever)
+        thread.daemon=True
+        thread.start()
+        self.url='http://127.0.0.1:%d/' % self.server.server_address[1]
+        self.backoff=media.downloadBackoff
+        media.downloadBackoff=0
+    def tearDown(self):
+        media.downloadBackoff=self.backoff
+        #close the kept-alive connections, so the server's threads can finish
+        connections=media._connections.__dict__.pop('connections', {})
+        for connection in connections.values():
+            connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.served)
+        shutil.rmtree(self.folder)
+    def download(self, name):
+        download=media._Download(self.url+name, os.path.join(self.folder, name))
+        download.run()
+        return download
+    
+    def testDownload(self):
+        download=self.download('room.txt')
+        self.assertTrue(download.succeeded)
+        self.assertEqual(open(download.path).read(), 'contents of room.txt')
+        self.assertEqual(os.listdir(self.folder), ['room.txt'])
+    def testRetryAfterServerError(self):
+        download=self.download('flaky.txt')
+        self.assertTrue(download.succeeded)
+        self.assertEqual(self.server.requests, ['flaky.txt', 'flaky.txt'])
+        self.assertEqual(open(download.path).read(), 'contents of flaky.txt')
+    def testMissingFileIsNotRetried(self):
+        download=self.download('missing.txt')
+        self.assertFalse(download.succeeded)
+        self.assertEqual(self.server.requests, ['missing.txt'])
+        self.assertEqual(os.listdir(self.folder), [])
+    def testRedirectIsFollowed(self):
+        download=self.download('moved/room.txt')
+        self.assertTrue(download.succeeded)
+        self.assertEqual(self.server.requests, ['moved/room.txt', 'room.txt'])
+        self.assertEqual(open(download.path).read(), 'contents of room.txt')
+    def testRedirectLoopIsGivenUp(self):
+        download=self.download('loop.txt')
+        self.assertFalse(download.succeeded)
+        self.assertEqual(len(self.server.requests), media.downloadRedirects+1)
+    def testTruncatedDownloadLeavesNoFile(self):
+        download=self.download('truncated.txt')
+        self.assertFalse(download.succeeded)
+        self.assertEqual(len(self.server.requests), media.downloadRetries+1)
+        #neither the partial file nor the file itself is left behind
+        self.assertEqual(os.listdir(self.folder), [])
+    def testLibraryPresentsDefaultUntilDownloaded(self):
+        #libraries download from their folder under the url
+        os.mkdir(os.path.join(self.served, 'pictures'))
+        shutil.copy(os.path.join(self.served, 'flaky.txt'), os.path.join(self.served, 'pictures'))
+        os.mkdir(os.path.join(self.folder, 'pictures'))
+        shutil.copy(os.path.join(self.served, 'room.txt'), 
+                    os.path.join(self.folder, 'pictures', 'default.txt'))
+        cwd=os.getcwd()
+        os.chdir(self.folder)
+        library=media.Library('pictures', lambda path: open(path).read(),
+                              default='default.txt', download=self.url)
+        try:
+            self.assertEqual(library.load('flaky.txt'), 'contents of room.txt')
+            self.assertTrue(library._downloading['flaky.txt'].done.wait(5))
+            self.assertEqual(library.load('flaky.txt'), 'contents of flaky.txt')
+        finally:
+            media.libraries.remove(library)
+            os.chdir(cwd)
+
+if __name__ == '__main__':
+    unittest.main()
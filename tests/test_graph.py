@@ -0,0 +1,45 @@
+import unittest
+
+import pyzzle
+from tests.base import GameTestCase
+
+class LinkGraphTest(GameTestCase):
+    def testLinksFromGameFile(self):
+        graph=pyzzle.linkgraph
+        self.assertEqual(graph.successors('room-1-1'), 
+                         set(['room-1-2', 'room-1-4', 'room-3-1', 'room-4-1']))
+        self.assertEqual(graph.predecessors('room-1-1'), set(['room-1-2', 'room-1-4', 'room-5-2']))
+        self.assertEqual(graph.orphans(), set(['start']))
+        self.assertEqual(graph.deadEnds(), set(['start']))
+        self.assertTrue('room-4-4' in graph.neighborhood('room-1-1', 2))
+        self.assertFalse('room-4-4' in graph.neighborhood('room-1-1', 1))
+    def testRelinkingHotspot(self):
+        graph=pyzzle.linkgraph
+        graph.successors('room-1-1')
+        pyzzle.Hotspot['room-1-1room-4-1'].link=pyzzle.Slide['start']
+        self.assertEqual(graph.outgoing['room-1-1']['room-1-1room-4-1'], 'start')
+        self.assertTrue('room-1-1' in graph.predecessors('start'))
+        self.assertFalse('start' in graph.orphans())
+    def testRelinkingTemplateHotspot(self):
+        graph=pyzzle.linkgraph
+        graph.successors('room-1-1')
+        pyzzle.Slide['room-1-1'].forward.link=pyzzle.Slide['start']
+        self.assertEqual(graph.outgoing['room-1-1']['room-1-1', 'forward'], 'start')
+        self.assertFalse('room-3-1' in graph.successors('room-1-1'))
+        self.assertFalse('start' in graph.orphans())
+    def testKillingHotspot(self):
+        graph=pyzzle.linkgraph
+        graph.successors('room-1-1')
+        pyzzle.Hotspot['room-1-1room-4-1'].kill()
+        self.assertFalse('room-1-1room-4-1' in graph.outgoing['room-1-1'])
+        self.assertFalse('room-1-1' in graph.predecessors('room-4-1'))
+
+class LazyLinkGraphTest(GameTestCase):
+    lazy=True
+    def testQueriesLoadNoSlides(self):
+        loaded=set(pyzzle.Slide.rows)
+        self.assertTrue('room-4-4' in pyzzle.linkgraph.reachable('room-1-1'))
+        self.assertEqual(set(pyzzle.Slide.rows), loaded)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest, os, shutil, sqlite3, zlib
+
+import pygame
+
+import pyzzle
+from pyzzle import HitMap
+from tests.base import GameTestCase, reset, root
+
+class HitMapTest(GameTestCase):
+    def createHitMap(self):
+        """Paints hotspot 'startforward' red, and leaves a green square unnamed."""
+        slide=pyzzle.Slide['start']
+        image=pygame.Surface(slide.image.get_size())
+        image.fill((255,0,0), (10,10,20,20))
+        image.fill((0,255,0), (50,50,20,20))
+        return HitMap.fromImage(slide, image, {(255,0,0):'startforward'})
+    
+    def testPixelsOfHotspot(self):
+        hitmap=self.createHitMap()
+        rect=pyzzle.Slide['start'].rect
+        self.assertEqual(hitmap.at((rect.left+15, rect.top+15), rect), 'startforward')
+        self.assertEqual(hitmap.at((rect.left+5, rect.top+5), rect), None)
+    def testUnnamedColorsBelongToNoHotspot(self):
+        hitmap=self.createHitMap()
+        rect=pyzzle.Slide['start'].rect
+        self.assertEqual(hitmap.at((rect.left+55, rect.top+55), rect), None)
+        self.assertEqual(max(bytearray(zlib.decompress(hitmap._mask))), 1)
+    def testStrayColorsAreNotPromptedFor(self):
+        image=pygame.Surface((640,480))
+        image.fill((255,0,0), (0,0,320,240))
+        image.fill((0,0,255), (320,240,160,120))
+        for x in range(0, 640, 64):
+            image.set_at((x,400), (x//64+1,200,0))
+        self.assertEqual(pyzzle.hitmap._commonColors(image), [(255,0,0), (0,0,255)])
+    def testIndexPastHotspots(self):
+        hitmap=HitMap('start', (1,1), zlib.compress('\x05'), ['startforward'])
+        self.assertEqual(hitmap.at((0,0), pygame.Rect(0,0,1,1)), None)
+    def testSaveAs(self):
+        self.createHitMap()
+        pyzzle.save()
+        pyzzle.gamefile.close()
+        reset()
+        pyzzle.load(self.gamefile, useSnapshot=False)
+        self.assertEqual(HitMap.dirty, set())
+        copy=os.path.join(self.folder, 'copy.game')
+        shutil.copy(os.path.join(root, 'main.game'), copy)
+        original=pyzzle.gamefile
+        pyzzle.save(copy)
+        original.close()
+        connection=sqlite3.connect(copy)
+        self.assertEqual(connection.execute('select [slide] from [HitMap]').fetchall(), [('start',)])
+        connection.close()
+
+if __name__ == '__main__':
+    unittest.main()
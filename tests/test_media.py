@@ -0,0 +1,131 @@
+import unittest, os, shutil, tempfile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+
+from pyzzle import media
+from tests.base import root
+
+class LibraryTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd=os.getcwd()
+        os.chdir(root)
+        pygame.init()
+        self.libraries=[]
+    def tearDown(self):
+        for library in self.libraries:
+            media.libraries.remove(library)
+        os.chdir(self.cwd)
+    def library(self, *args, **param):
+        """Creates a Library that is forgotten once the test is done."""
+        library=media.Library(*args, **param)
+        self.libraries.append(library)
+        return library
+    
+    def fileLibrary(self, names, **param):
+        """Creates a Library of empty files, whose data are their paths, 10 bytes each."""
+        folder=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        for name in names:
+            open(os.path.join(folder, name), 'w').close()
+        return self.library(folder, lambda path: path, size=lambda data: 10, **param)
+    
+    def testBudgetDeletesLeastRecentlyUsed(self):
+        library=self.fileLibrary(['a', 'b', 'c'], budget=25)
+        library.load('a')
+        library.load('b')
+        library.load('a')
+        library.load('c')
+        self.assertEqual(list(library.loaded), ['a', 'c'])
+        self.assertEqual(library.used, 20)
+    def testPinnedFilesAreKept(self):
+        library=self.fileLibrary(['a', 'b', 'c'], budget=25)
+        library.pin('a')
+        library.load('a')
+        library.load('b')
+        library.load('c')
+        self.assertEqual(list(library.loaded), ['a', 'c'])
+        library.unpin('a')
+        library.load('b')
+        self.assertEqual(list(library.loaded), ['c', 'b'])
+    def testMissingFileRefreshesOnlyOnceFolderChanges(self):
+        library=self.fileLibrary(['a'])
+        library.refreshInterval=0
+        refreshes=[]
+        refresh=library.refresh
+        library.refresh=lambda: refreshes.append(1) or refresh()
+        library.find('a')
+        self.assertEqual(library.find('b'), None)
+        self.assertEqual(library.find('b'), None)
+        self.assertEqual(len(refreshes), 2)
+        open(os.path.join(library.folder, 'b'), 'w').close()
+        os.utime(library.folder, (0, 0))
+        self.assertEqual(library.find('B'), os.path.join(library.folder, 'b'))
+        self.assertEqual(len(refreshes), 3)
+    def testFindIgnoresCapitalization(self):
+        library=self.fileLibrary([])
+        os.mkdir(os.path.join(library.folder, 'Sub'))
+        open(os.path.join(library.folder, 'Sub', 'File.JPG'), 'w').close()
+        self.assertEqual(library.find(os.path.join('sub', 'file.jpg')), 
+                         os.path.join(library.folder, 'Sub', 'File.JPG'))
+        self.assertEqual(library.find('sub'), None)
+    def testDownloadedFileIsIndexed(self):
+        library=self.fileLibrary(['a'])
+        library.refreshInterval=1e9
+        library.find('a')
+        path=os.path.join(library.folder, 'b')
+        open(path, 'w').close()
+        download=media._Download('http://localhost/b', path)
+        download.succeeded=True
+        download.done.set()
+        library._downloading['b']=download
+        self.assertFalse(library._pending('b'))
+        self.assertEqual(library.find('B'), path)
+    def testDeleteFontOfEverySize(self):
+        fonts=self.library('fonts', media.loadFont)
+        fonts.load('freesansbold.ttf', fontSize=16)
+        fonts.load('freesansbold.ttf', fontSize=32)
+        self.assertEqual(len(fonts.loaded), 2)
+        fonts.delete('freesansbold.ttf')
+        self.assertEqual(len(fonts.loaded), 0)
+
+class SurfaceCacheTest(unittest.TestCase):
+    def setUp(self):
+        pygame.init()
+        if not pygame.display.get_surface():
+            pygame.display.set_mode((640,480))
+        self.folder=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.path=os.path.join(self.folder, 'image.png')
+        image=pygame.Surface((30,20), pygame.SRCALPHA, 32)
+        image.fill((10,20,30,40))
+        image.fill((200,100,50,255), (5,5,10,10))
+        pygame.image.save(image, self.path)
+        media.surfaceCache=media.SurfaceCache(os.path.join(self.folder, 'cache'))
+        self.addCleanup(setattr, media, 'surfaceCache', None)
+    def cache(self):
+        """Loads the image, and waits for it to be written to the cache."""
+        image=media.loadImage(self.path)
+        for wait in range(100):
+            if media.surfaceCache.read(self.path): break
+            pygame.time.wait(10)
+        return image
+
+    def testCachedImageIsAlreadyConverted(self):
+        image=self.cache()
+        decoded=media.decodeImage(self.path)
+        self.assertTrue(decoded.cached)
+        cached=media.convertImage(decoded)
+        self.assertEqual((cached.get_bitsize(), cached.get_masks()), 
+                         (image.get_bitsize(), image.get_masks()))
+        self.assertEqual(pygame.image.tostring(cached, 'RGBA'), 
+                         pygame.image.tostring(image, 'RGBA'))
+    def testChangedFileIsNotRead(self):
+        self.cache()
+        os.utime(self.path, (0, 0))
+        self.assertFalse(media.decodeImage(self.path).cached)
+
+if __name__ == '__main__':
+    unittest.main()
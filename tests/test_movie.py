@@ -0,0 +1,54 @@
+import unittest, os, shutil, tempfile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+
+from pyzzle import movie
+
+class MovieTest(unittest.TestCase):
+    def setUp(self):
+        pygame.init()
+        if not pygame.display.get_surface():
+            pygame.display.set_mode((640,480))
+        self.folder=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.path=os.path.join(self.folder, 'movie.frames')
+        frames=[]
+        for shade in range(10):
+            frame=pygame.Surface((8,6))
+            frame.fill((shade*20, 0, 0))
+            frames.append(frame)
+        movie.writeFrames(self.path, frames, frameRate=10.)
+    def decode(self, size, due=0):
+        """Decodes the movie on a background thread, from the frame that is due,
+        and returns the first frame decoded."""
+        decoder=movie._Decoder(movie.load(self.path), size, False, 2)
+        decoder.due=due
+        decoder.start()
+        self.addCleanup(decoder.stop)
+        return decoder.frames.get(timeout=5)
+
+    def testRawFrames(self):
+        reader=movie.load(self.path)
+        self.assertEqual((reader.size, reader.frameRate, reader.frameCount), ((8,6), 10., 10))
+        self.assertEqual(reader.length, 1.)
+        self.assertEqual(reader.read(3).get_at((0,0)), (60,0,0,255))
+    def testFramesAreScaledAndConverted(self):
+        number, frame = self.decode((16,12))
+        display=pygame.display.get_surface()
+        self.assertEqual(frame.get_size(), (16,12))
+        self.assertEqual((frame.get_bitsize(), frame.get_masks()),
+                         (display.get_bitsize(), display.get_masks()))
+    def testLateFramesAreSkipped(self):
+        number, frame = self.decode((8,6), due=5)
+        self.assertEqual(number, 5)
+        self.assertEqual(frame.get_at((0,0)), (100,0,0,255))
+    def testReaderMustImplementRead(self):
+        class Reader(movie.FrameReader):
+            pass
+        self.assertRaises(TypeError, Reader)
+
+if __name__ == '__main__':
+    unittest.main()
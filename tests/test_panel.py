@@ -0,0 +1,55 @@
+import unittest
+
+import pyzzle
+from pyzzle import Hotspot
+from pyzzle.relative import RelativeRect
+from tests.base import GameTestCase
+
+class GridTest(GameTestCase):
+    def setUp(self):
+        GameTestCase.setUp(self)
+        self.slide=pyzzle.Slide['start']
+        self.visit(self.slide)
+        self.lower=self.hotspot('lower', (.1,.1,.3,.3), 1)
+        self.upper=self.hotspot('upper', (.2,.2,.3,.3), 2)
+    def hotspot(self, id, rectRel, layer):
+        hotspot=Hotspot(parent=self.slide, link=None, id=id, 
+                        rectRel=RelativeRect(rectRel), layer=layer)
+        self.slide.add(hotspot)
+        return hotspot
+    def at(self, x, y):
+        """The sprite of the slide at a point relative to the slide."""
+        rect=self.slide.rect
+        return self.slide._hit((rect.left+int(x*rect.width), rect.top+int(y*rect.height)))
+    
+    def testTopmostSpriteIsHit(self):
+        self.assertEqual(self.at(.3,.3), self.upper)
+        self.assertEqual(self.at(.15,.15), self.lower)
+        self.assertEqual(self.at(.45,.45), self.upper)
+        self.assertEqual(self.at(.9,.9), None)
+    def testGridIsKeptUntilSpritesChange(self):
+        grid=self.slide._index()[0]
+        self.at(.3,.3)
+        self.assertTrue(self.slide._index()[0] is grid)
+        self.slide.remove(self.upper)
+        self.assertEqual(self.at(.3,.3), self.lower)
+    def testLayerChangeIsHit(self):
+        self.at(.3,.3)
+        self.upper._layer=0
+        self.assertEqual(self.at(.3,.3), self.lower)
+        self.slide.change_layer(self.upper, 3)
+        self.assertEqual(self.at(.3,.3), self.upper)
+    def testResizedSpriteIsHit(self):
+        self.at(.3,.3)
+        self.lower.rectRel=RelativeRect((.6,.6,.2,.2))
+        self.assertEqual(self.at(.15,.15), None)
+        self.assertEqual(self.at(.7,.7), self.lower)
+    def testReplacedSpriteIsHit(self):
+        self.at(.3,.3)
+        self.slide.remove(self.upper)
+        other=self.hotspot('other', (.6,.6,.2,.2), 2)
+        self.assertEqual(self.at(.3,.3), self.lower)
+        self.assertEqual(self.at(.7,.7), other)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest, os, shutil, tempfile, csv
+from collections import deque
+
+from pyzzle import profiler, media
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.time=0.
+        for name, value in (('timer', lambda: self.time), ('frames', deque(maxlen=3))):
+            self.addCleanup(setattr, profiler, name, getattr(profiler, name))
+            setattr(profiler, name, value)
+    def frame(self, **seconds):
+        """Records a frame that spends the given seconds in each phase, in order."""
+        profiler.beginFrame()
+        for phase in profiler.phases:
+            self.time+=seconds.get(phase, 0.)
+            profiler.lap(phase)
+        profiler.endFrame()
+    
+    def testPhasesAreTimed(self):
+        self.frame(draw=.010, flip=.002)
+        frame=profiler.frames[-1]
+        self.assertAlmostEqual(frame['draw'], .010)
+        self.assertAlmostEqual(frame['flip'], .002)
+        self.assertAlmostEqual(frame['highlight'], 0.)
+        self.assertAlmostEqual(frame['total'], .012)
+    def testSummaryAndSlowest(self):
+        self.frame(draw=.010)
+        self.frame(draw=.030)
+        summary=profiler.summary()
+        self.assertAlmostEqual(summary['draw'], .020)
+        self.assertAlmostEqual(summary['max'], .030)
+        self.assertAlmostEqual(profiler.slowest(1)[0]['total'], .030)
+    def testOnlyRecentFramesAreKept(self):
+        for draw in range(5):
+            self.frame(draw=draw)
+        self.assertEqual([frame['draw'] for frame in profiler.frames], [2, 3, 4])
+    def testLoadsAreRecorded(self):
+        folder=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        open(os.path.join(folder, 'a'), 'w').close()
+        library=media.Library(folder, lambda path: path)
+        self.addCleanup(media.libraries.remove, library)
+        profiler.beginFrame()
+        library.load('a')
+        library.load('a')
+        profiler.endFrame()
+        self.assertEqual(profiler.frames[-1]['misses'], [(folder, 'a')])
+    def testDump(self):
+        self.frame(draw=.010)
+        folder=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        filename=os.path.join(folder, 'frames.csv')
+        profiler.dump(filename)
+        rows=list(csv.reader(open(filename, 'rb')))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][rows[0].index('draw')], '10.000')
+    def testDisabled(self):
+        profiler.enabled=False
+        self.addCleanup(setattr, profiler, 'enabled', True)
+        self.frame(draw=.010)
+        self.assertEqual(len(profiler.frames), 0)
+
+if __name__ == '__main__':
+    unittest.main()
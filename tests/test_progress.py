@@ -0,0 +1,38 @@
+import unittest, os, sys, subprocess, sqlite3
+
+import pyzzle
+from pyzzle.progress import Journal
+from tests.base import GameTestCase, reset, root
+
+class JournalTest(GameTestCase):
+    def testResume(self):
+        file=os.path.join(self.folder, 'player.save')
+        pyzzle.journal=Journal(file)
+        self.visit(pyzzle.Slide['room-1-1'])
+        self.visit(pyzzle.Slide['room-4-1'])
+        pyzzle.journal.close()
+        pyzzle.gamefile.close()
+        reset()
+        pyzzle.load(self.gamefile, useSnapshot=False)
+        pyzzle.journal=Journal(file)
+        slide=pyzzle.journal.resume()
+        pyzzle.journal.close()
+        self.assertTrue(slide is pyzzle.Slide['room-4-1'])
+        self.assertTrue(set(['room-1-1', 'room-4-1']) <= pyzzle.Slide.visits)
+        self.assertEqual(len(pyzzle.history), 2)
+    def testExitWithoutClosing(self):
+        """Entries still queued when the game exits, e.g. from the menu, are written."""
+        file=os.path.join(self.folder, 'player.save')
+        script=('import sys\n'
+                'from pyzzle.progress import Journal\n'
+                'journal=Journal(sys.argv[1])\n'
+                'for i in range(1000): journal.record("visited", str(i), True)\n'
+                'sys.exit()\n')
+        with open(os.devnull, 'w') as output:
+            subprocess.check_call([sys.executable, '-c', script, file], cwd=root, stdout=output)
+        connection=sqlite3.connect(file)
+        self.assertEqual(connection.execute('select count(*) from Journal').fetchone()[0], 1000)
+        connection.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import pyzzle
+from pyzzle import media
+from tests.base import GameTestCase
+
+class VariantTest(GameTestCase):
+    def setUp(self):
+        GameTestCase.setUp(self)
+        self.slide=pyzzle.Slide['room-1-4']
+        self.slide.addVariant('room-1-4b.jpg')
+        self.variant=self.slide._imagePath('room-1-4b.jpg')
+        self.loads=[]
+        load=media.images._load
+        media.images._load=lambda path, **param: self.loads.append(path) or load(path, **param)
+        self.addCleanup(setattr, media.images, '_load', load)
+    def tearDown(self):
+        media.images.delete(self.variant)
+        GameTestCase.tearDown(self)
+    
+    def testVariantsOfNeighborsArePinned(self):
+        #earlier tests may have left slides pinned
+        pins=lambda: media.images._pins.get(self.variant, 0)
+        unpinned=pins()
+        self.visit(pyzzle.Slide['room-1-1'])
+        self.assertEqual(pins(), unpinned+1)
+        self.visit(pyzzle.Slide['start'])
+        self.assertEqual(pins(), unpinned)
+    def testSwitchingToVariantLoadsNothing(self):
+        self.visit(self.slide)
+        #waits for the variant to be decoded in the background
+        media.images.load(self.variant)
+        rect=self.slide.rect
+        del self.loads[:]
+        self.slide.file='room-1-4b.jpg'
+        pyzzle.draw()
+        self.assertEqual(self.loads, [])
+        self.assertTrue(self.slide.rect is rect)
+        self.assertTrue(self.slide.image is media.images.load(self.variant))
+    def testSwitchingBack(self):
+        self.visit(self.slide)
+        self.slide.file='room-1-4b.jpg'
+        pyzzle.draw()
+        self.slide.file='room-1-4.jpg'
+        pyzzle.draw()
+        self.assertTrue(self.slide.image is media.images.load(self.slide._imagePath()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest, os, sqlite3
+
+import pyzzle
+from pyzzle import snapshot
+from tests.base import GameTestCase, reset
+
+def world():
+    """Describes every slide, hotspot, item and switch, indexed by id."""
+    id=lambda row: row.id if row else None
+    return {'slides':  dict((slide.id, slide._save()) for slide in pyzzle.Slide.rows.values()),
+            'hotspots':dict((hotspot.id, hotspot._save())
+                            for hotspot in pyzzle.Hotspot.rows.values()),
+            'items':   dict((item.id, (id(item.gameSlide), id(item.gameHotspot), item.takenfile,
+                                       id(item.menuSlide), id(item.closeupSlide), item.taken))
+                            for item in pyzzle.Item.rows.values()),
+            'switches':dict((switch.id, (id(switch.onslide), id(switch.offslide),
+                                         map(id, switch.hotspots), switch.on))
+                            for switch in pyzzle.Switch.rows.values())}
+
+class SnapshotTest(GameTestCase):
+    def reload(self):
+        """Loads the game again, from its snapshot if it is up to date.
+        @return: Whether the snapshot was loaded."""
+        pyzzle.gamefile.close()
+        reset()
+        loaded=[]
+        load=snapshot.load
+        snapshot.load=lambda *args: loaded.append(load(*args)) or loaded[-1]
+        try:
+            pyzzle.load(self.gamefile)
+        finally:
+            snapshot.load=load
+        return loaded == [True]
+
+    def testRoundTrip(self):
+        expected=world()
+        snapshot.write(self.gamefile)
+        self.assertTrue(self.reload())
+        self.assertEqual(world(), expected)
+    def testOutdatedSnapshotIsIgnored(self):
+        snapshot.write(self.gamefile)
+        connection=sqlite3.connect(self.gamefile)
+        connection.execute("update Slide set image='changed.jpg' where id='room-1-1'")
+        connection.commit()
+        connection.close()
+        #the game file is changed within the resolution of its mtime
+        os.utime(self.gamefile, (0, 0))
+        self.assertFalse(self.reload())
+        self.assertEqual(pyzzle.Slide['room-1-1'].file, 'changed.jpg')
+
+if __name__ == '__main__':
+    unittest.main()
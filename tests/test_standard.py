@@ -0,0 +1,163 @@
+import unittest
+
+import pygame
+
+import pyzzle
+from pyzzle import media, animation
+from pyzzle.relative import RelativeRect
+from tests.base import GameTestCase
+
+class PanTest(GameTestCase):
+    def setUp(self):
+        GameTestCase.setUp(self)
+        #the left end of the panorama is red
+        image=pygame.Surface((2560, 480))
+        image.fill((255,0,0), (0,0,10,480))
+        media.images._store('panorama.png', image)
+        self.slide=pyzzle.Slide(None, 'panorama.png')
+        #keep the cursor off the pan hotspots, wherever an earlier test left it
+        pyzzle.cursor.rect.center=pyzzle.screen.get_rect().center
+        self.visit(self.slide)
+    def tearDown(self):
+        media.images.delete('panorama.png')
+        GameTestCase.tearDown(self)
+    def frame(self, pos):
+        """Draws a frame with the cursor at pos, as play() does.
+        @return: Whether play() would draw the next frame without waiting for input."""
+        pyzzle.cursor.rect.center=pos
+        pyzzle.beginDraw()
+        pyzzle.drawCursor(pyzzle.panel.highlight(), pos)
+        pyzzle.endDraw()
+        return pyzzle.animating()
+    
+    def testSlowPanKeepsAnimating(self):
+        screen=pyzzle.screen.get_rect()
+        #just inside the right pan hotspot, the slide pans less than a pixel per frame
+        pos=(int(screen.width*.8)+3, screen.centery)
+        left=self.slide.rect.left
+        end=animation.now()+.5
+        while animation.now() < end:
+            self.assertTrue(self.frame(pos))
+            pygame.time.wait(10)
+        self.assertTrue(self.slide.rect.left < left)
+    def testFractionsOfPixelsAddUp(self):
+        left=self.slide.rect.left
+        for step in range(8):
+            self.slide.pan(-.25)
+        self.assertEqual(self.slide.rect.left, left-2)
+    def testWrapDrawsStartPastEnd(self):
+        self.slide.wrap=True
+        self.slide.pan(-2240-self.slide.rect.left)
+        self.assertEqual(self.slide.rect.left, -2240)
+        pyzzle.beginDraw()
+        self.assertEqual(pyzzle.screen.get_at((315, 240))[:3], (0,0,0))
+        self.assertEqual(pyzzle.screen.get_at((325, 240))[:3], (255,0,0))
+        #turning past the end comes round to the start
+        self.slide.pan(-400)
+        self.assertEqual(self.slide.rect.left, -80)
+    def testIdleOffPanHotspots(self):
+        screen=pyzzle.screen.get_rect()
+        self.frame(screen.center)
+        self.assertFalse(self.frame(screen.center))
+
+class IdleTest(GameTestCase):
+    def setUp(self):
+        GameTestCase.setUp(self)
+        self.visit(pyzzle.Slide['room-1-1'])
+        pyzzle.animating()
+    
+    def testStillSceneIsIdle(self):
+        self.assertFalse(pyzzle.animating())
+    def testChangedSceneAnimatesOnce(self):
+        pyzzle.Hotspot['room-1-1room-4-1'].rectRel=RelativeRect((0,0,.1,.1))
+        self.assertTrue(pyzzle.animating())
+        self.assertFalse(pyzzle.animating())
+    def testRunningTweenAnimates(self):
+        tween=pyzzle.scheduler.start(animation.Tween(1))
+        self.assertTrue(pyzzle.animating())
+        tween.finish()
+        pyzzle.scheduler.update()
+        self.assertFalse(pyzzle.animating())
+    def testWaitEventsTimesOut(self):
+        pygame.event.clear()
+        start=animation.now()
+        self.assertFalse(pyzzle.waitEvents(.05))
+        self.assertTrue(animation.now()-start >= .04)
+    def testWaitEventsLeavesEventForMainLoop(self):
+        pygame.event.clear()
+        pygame.event.post(pygame.event.Event(pygame.USEREVENT))
+        self.assertTrue(pyzzle.waitEvents(1))
+        self.assertEqual(len(pygame.event.get(pygame.USEREVENT)), 1)
+
+class DirtyRectTest(GameTestCase):
+    def setUp(self):
+        GameTestCase.setUp(self)
+        self.visit(pyzzle.Slide['room-1-1'])
+        pyzzle.dirtyRects=True
+        self.addCleanup(setattr, pyzzle, 'dirtyRects', False)
+        self.updates=[]
+        for name, record in (('flip',   lambda: self.updates.append(None)), 
+                             ('update', lambda rects: self.updates.append(rects))):
+            self.addCleanup(setattr, pygame.display, name, getattr(pygame.display, name))
+            setattr(pygame.display, name, record)
+    
+    def testStillFrameUpdatesOnlyCursor(self):
+        pyzzle.drawDirty()
+        pyzzle.drawDirty()
+        self.assertEqual(self.updates[0], None)
+        self.assertTrue(self.updates[1])
+        for rect in self.updates[1]:
+            self.assertTrue(pyzzle.cursor.rect.contains(rect))
+    def testChangedSceneRedrawsScreen(self):
+        pyzzle.drawDirty()
+        pyzzle.Hotspot['room-1-1room-4-1'].rectRel=RelativeRect((0,0,.1,.1))
+        pyzzle.drawDirty()
+        self.assertEqual(self.updates, [None, None])
+    def testFrameAfterFlipRedrawsScreen(self):
+        pyzzle.drawDirty()
+        pyzzle.draw()
+        pyzzle.drawDirty()
+        self.assertEqual(self.updates, [None, None, None])
+
+class TransitionTest(GameTestCase):
+    def setUp(self):
+        GameTestCase.setUp(self)
+        self.old, self.new = pyzzle.Slide['room-1-1'], pyzzle.Slide['room-1-2']
+        self.visit(self.old)
+        self.time=0.
+        self.addCleanup(setattr, animation, 'now', animation.now)
+        animation.now=lambda: self.time
+        self.draws=[]
+        draw=pyzzle.panel.draw
+        pyzzle.panel.draw=lambda screen: self.draws.append(screen) or draw(screen)
+        self.addCleanup(delattr, pyzzle.panel, 'draw')
+    def play(self, transition, duration):
+        """Runs a transition, drawing ten frames a second until it's done.
+        @return: The number of times the panel was drawn along the way."""
+        transition(self.old, self.new, delay=.5)
+        for frame in range(int(duration*10)+1):
+            pyzzle.beginDraw()
+            pyzzle.endDraw()
+            self.time+=.1
+        pyzzle.beginDraw()
+        return len(self.draws)
+    def assertTransitioned(self):
+        self.assertFalse(pyzzle.scheduler.busy())
+        self.assertTrue(self.new in pyzzle.panel)
+        self.assertFalse(self.old in pyzzle.panel)
+        self.assertEqual(self.new.rect.center, pyzzle.screen.get_rect().center)
+    
+    def testFadeDrawsSlidesOnce(self):
+        #once for each stage, then every frame once it's done
+        self.assertTrue(self.play(pyzzle.fade, 1) <= 4)
+        self.assertTransitioned()
+    def testCrossfadeDrawsSlidesOnce(self):
+        self.assertTrue(self.play(pyzzle.crossfade, .5) <= 4)
+        self.assertTransitioned()
+    def testScrollDrawsSlidesOnce(self):
+        self.assertTrue(self.play(pyzzle.scrollRight, .5) <= 5)
+        self.assertTransitioned()
+        self.assertEqual(self.old.rect.center, pyzzle.screen.get_rect().center)
+
+if __name__ == '__main__':
+    unittest.main()